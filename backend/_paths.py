@@ -0,0 +1,16 @@
+"""
+_paths.py
+
+Puts onboard/rpi on sys.path, where the helpers shared with the Pi live
+(link protocol, changelog, MAVLink reader, ...). Backend modules that use
+them import this first. It is appended, so the backend's own modules of
+the same name (pixhawk_client) still take precedence.
+"""
+
+import sys
+from pathlib import Path
+
+ONBOARD_DIR = Path(__file__).resolve().parent.parent / "onboard" / "rpi"
+
+if str(ONBOARD_DIR) not in sys.path:
+    sys.path.append(str(ONBOARD_DIR))
@@ -0,0 +1,278 @@
+"""
+broadcast.py
+
+Fan-out of backend messages to every connected /ws/telemetry client.
+
+Each message is JSON-encoded exactly once and the resulting text frame is
+shared by all client queues. Publishing never awaits, so a slow browser can't
+stall the telemetry path; when its queue is full the oldest frame is dropped
+and counted against that client.
+
+Clients may narrow what they receive with a subscription (message types,
+fields, max rate per type, logs on/off, minimum log severity). Rate-limited
+types are coalesced to the latest value: the first message after the interval
+is sent immediately, anything arriving sooner replaces the pending value and
+is flushed when the interval expires.
+
+A client can also ask for delta frames (see onboard/rpi/delta.py). Delta state
+is per client, so those frames are encoded per client rather than shared.
+"""
+
+import asyncio
+import json
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from log_store import SEVERITY_RANK, parse_log_id
+
+import _paths  # puts onboard/rpi on sys.path
+from delta import DeltaEncoder
+
+
+def _json_default(obj: Any) -> Any:
+    # only called for values json can't encode natively
+    if isinstance(obj, bytearray):
+        return list(obj)
+    if isinstance(obj, bytes):
+        return obj.decode(errors="replace")
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def encode(payload: Dict[str, Any]) -> str:
+    return json.dumps(payload, default=_json_default, separators=(",", ":"), ensure_ascii=False)
+
+
+def project(fields: Dict[str, Any], projection: Optional[Tuple[str, ...]]) -> Dict[str, Any]:
+    return fields if projection is None else {k: fields[k] for k in projection if k in fields}
+
+
+@dataclass(frozen=True)
+class TopicSubscription:
+    fields: Optional[Tuple[str, ...]] = None  # None = all fields
+    interval: float = 0.0  # seconds between messages, 0 = unlimited
+
+
+@dataclass
+class Subscription:
+    topics: Optional[Dict[str, TopicSubscription]] = None  # None = all types
+    logs: bool = True
+    min_severity: Optional[int] = None
+    delta: bool = False
+
+    @classmethod
+    def parse(cls, body: Dict[str, Any]) -> "Subscription":
+        """
+        Build a subscription from a client "subscribe" message body:
+
+            {"telemetry": {"ATTITUDE": {"fields": ["roll", "pitch"], "rate": 10},
+                           "*": {"rate": 1}},
+             "logs": true, "min_severity": 1, "delta": false}
+
+        "telemetry" omitted or null subscribes to every type at full rate; the
+        "*" entry applies to types not listed explicitly. "rate" is in Hz.
+        With "delta" telemetry arrives as "telemetry_delta" frames.
+        """
+        if not isinstance(body, dict):
+            raise ValueError("subscription must be an object")
+
+        topics = None
+        telemetry = body.get("telemetry")
+        if telemetry is not None:
+            if not isinstance(telemetry, dict):
+                raise ValueError("telemetry must map message types to options")
+            topics = {}
+            for topic, opts in telemetry.items():
+                opts = opts or {}
+                fields = opts.get("fields")
+                rate = float(opts.get("rate") or 0)
+                if rate < 0:
+                    raise ValueError(f"negative rate for {topic}")
+                topics[topic] = TopicSubscription(
+                    fields=tuple(fields) if fields is not None else None,
+                    interval=1.0 / rate if rate else 0.0,
+                )
+
+        min_severity = body.get("min_severity")
+        if min_severity is not None:
+            min_severity = int(min_severity)
+            if min_severity not in SEVERITY_RANK:
+                raise ValueError(f"unknown severity {min_severity}")
+
+        return cls(
+            topics=topics,
+            logs=bool(body.get("logs", True)),
+            min_severity=min_severity,
+            delta=bool(body.get("delta", False)),
+        )
+
+    def topic(self, msg_type: str) -> Optional[TopicSubscription]:
+        if self.topics is None:
+            return _ALL_FIELDS
+        return self.topics.get(msg_type) or self.topics.get("*")
+
+    def wants_log(self, log_id: str) -> bool:
+        if not self.logs:
+            return False
+        if self.min_severity is None:
+            return True
+        _, severity, _ = parse_log_id(log_id)
+        rank = SEVERITY_RANK.get(severity)
+        return rank is None or rank >= SEVERITY_RANK[self.min_severity]
+
+
+_ALL_FIELDS = TopicSubscription()
+
+
+class ClientChannel:
+    """Outbound queue, subscription and counters for one WebSocket client."""
+
+    def __init__(self, hub: "BroadcastHub", websocket, queue_size: int) -> None:
+        self.hub = hub
+        self.websocket = websocket
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=queue_size)
+        self.subscription = Subscription()
+        self.delta: Optional[DeltaEncoder] = None
+        self.connected_at = time.time()
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+
+        self._next_due: Dict[str, float] = {}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+
+    def put(self, frame: str) -> None:
+        if self.queue.full():
+            # drop the oldest frame so the client catches up on fresh data
+            self.queue.get_nowait()
+            self.dropped += 1
+            self.hub.dropped += 1
+        self.queue.put_nowait(frame)
+
+    def subscribe(self, subscription: Subscription) -> None:
+        self.close()
+        self._next_due.clear()
+        self.subscription = subscription
+        self.delta = DeltaEncoder() if subscription.delta else None
+
+    def offer(self, msg_type: str, fields: Dict[str, Any]) -> None:
+        """Deliver a telemetry message subject to this client's subscription."""
+        sub = self.subscription.topic(msg_type)
+        if sub is None:
+            return
+        if not sub.interval:
+            self._deliver(msg_type, fields, sub)
+            return
+
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        due = self._next_due.get(msg_type, 0.0)
+        if now >= due:
+            self._next_due[msg_type] = now + sub.interval
+            self._deliver(msg_type, fields, sub)
+            return
+
+        if msg_type in self._pending:
+            self.coalesced += 1
+        else:
+            self._timers[msg_type] = loop.call_at(due, self._flush, msg_type)
+        self._pending[msg_type] = fields
+
+    def _flush(self, msg_type: str) -> None:
+        self._timers.pop(msg_type, None)
+        fields = self._pending.pop(msg_type, None)
+        sub = self.subscription.topic(msg_type)
+        if fields is None or sub is None:
+            return
+        self._next_due[msg_type] = asyncio.get_running_loop().time() + sub.interval
+        self._deliver(msg_type, fields, sub)
+
+    def _deliver(self, msg_type: str, fields: Dict[str, Any], sub: TopicSubscription) -> None:
+        if self.delta is None:
+            self.put(self.hub.telemetry_frame(msg_type, fields, sub.fields))
+            return
+        body = self.delta.encode(msg_type, project(fields, sub.fields))
+        if body is not None:
+            self.put(encode({"type": "telemetry_delta", "data": body}))
+
+    def close(self) -> None:
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        self._pending.clear()
+
+    async def sender_loop(self) -> None:
+        while True:
+            frame = await self.queue.get()
+            await self.websocket.send_text(frame)
+            self.sent += 1
+
+    def stats(self) -> Dict[str, Any]:
+        client = self.websocket.client
+        return {
+            "client": f"{client.host}:{client.port}" if client else None,
+            "connected_s": round(time.time() - self.connected_at, 1),
+            "subscribed": sorted(self.subscription.topics) if self.subscription.topics is not None else "*",
+            "queued": self.queue.qsize(),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+        }
+
+
+class BroadcastHub:
+    def __init__(self, queue_size: int = 100) -> None:
+        self.queue_size = queue_size
+        self.clients: Set[ClientChannel] = set()
+        # frames dropped for slow clients, including clients that have since left
+        self.dropped = 0
+        # latest encoded frame per (msg_type, projection), reused while the
+        # same fields dict is being delivered to several clients
+        self._frames: Dict[Tuple[str, Optional[Tuple[str, ...]]], Tuple[Dict[str, Any], str]] = {}
+
+    def register(self, websocket) -> ClientChannel:
+        channel = ClientChannel(self, websocket, self.queue_size)
+        self.clients.add(channel)
+        return channel
+
+    def unregister(self, channel: ClientChannel) -> None:
+        channel.close()
+        self.clients.discard(channel)
+
+    def telemetry_frame(self, msg_type: str, fields: Dict[str, Any], projection: Optional[Tuple[str, ...]]) -> str:
+        key = (msg_type, projection)
+        cached = self._frames.get(key)
+        if cached is not None and cached[0] is fields:
+            return cached[1]
+        frame = encode({"type": "telemetry", "data": {msg_type: project(fields, projection)}})
+        self._frames[key] = (fields, frame)
+        return frame
+
+    def publish(self, payload: Dict[str, Any]) -> None:
+        """Encode once and enqueue the frame for every interested client."""
+        if not self.clients:
+            return
+
+        match payload.get("type"):
+            case "telemetry":
+                # data is {msg_type: fields}
+                for msg_type, fields in payload["data"].items():
+                    for channel in tuple(self.clients):
+                        channel.offer(msg_type, fields)
+
+            case "log":
+                frame = None
+                log_id = payload["data"]["log_id"]
+                for channel in tuple(self.clients):
+                    if channel.subscription.wants_log(log_id):
+                        frame = frame or encode(payload)
+                        channel.put(frame)
+
+            case _:
+                frame = encode(payload)
+                for channel in tuple(self.clients):
+                    channel.put(frame)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [channel.stats() for channel in self.clients]
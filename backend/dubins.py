@@ -0,0 +1,110 @@
+"""
+dubins.py
+
+Batch Dubins path solver.
+
+A Dubins path is the shortest path between two poses (x, y, heading) for a
+vehicle that only flies forward and turns no tighter than a given radius.
+It is one of six words of three primitives, L(eft) and R(ight) turns at the
+minimum radius and S(traight) lines: LSL, RSR, LSR, RSL, RLR and LRL.
+
+shortest_paths() evaluates all six for many legs at once with NumPy and
+picks the shortest feasible one per leg. Angles are radians in the local XY
+frame (x east, y north, counterclockwise from +x).
+"""
+
+from typing import Optional, Tuple
+
+import numpy as np
+
+FAMILIES = ("LSL", "RSR", "LSR", "RSL", "RLR", "LRL")
+
+TWO_PI = 2 * np.pi
+
+
+def _mod2pi(a: np.ndarray) -> np.ndarray:
+    return np.mod(a, TWO_PI)
+
+
+def shortest_paths(x0: np.ndarray, y0: np.ndarray, th0: np.ndarray,
+                   x1: np.ndarray, y1: np.ndarray, th1: np.ndarray,
+                   radius: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Shortest Dubins path of every leg (arrays of equal length).
+    Returns:
+        (family, params): the index into FAMILIES per leg, and an (n, 3)
+        array with the three primitive lengths normalized by the radius
+        (turn angles in radians, straight length / radius).
+    """
+    dx = x1 - x0
+    dy = y1 - y0
+    d = np.hypot(dx, dy) / radius
+    theta = _mod2pi(np.arctan2(dy, dx))
+    a = _mod2pi(th0 - theta)
+    b = _mod2pi(th1 - theta)
+    sa, sb, ca, cb = np.sin(a), np.sin(b), np.cos(a), np.cos(b)
+    c_ab = np.cos(a - b)
+    d2 = d * d
+
+    n = d.shape[0]
+    params = np.full((6, n, 3), np.nan)
+
+    with np.errstate(invalid="ignore"):
+        # LSL
+        p_sq = 2 + d2 - 2 * c_ab + 2 * d * (sa - sb)
+        tmp = np.arctan2(cb - ca, d + sa - sb)
+        params[0] = np.stack((_mod2pi(tmp - a), np.sqrt(p_sq), _mod2pi(b - tmp)), axis=-1)
+
+        # RSR
+        p_sq = 2 + d2 - 2 * c_ab + 2 * d * (sb - sa)
+        tmp = np.arctan2(ca - cb, d - sa + sb)
+        params[1] = np.stack((_mod2pi(a - tmp), np.sqrt(p_sq), _mod2pi(tmp - b)), axis=-1)
+
+        # LSR
+        p_sq = -2 + d2 + 2 * c_ab + 2 * d * (sa + sb)
+        p = np.sqrt(p_sq)
+        tmp = np.arctan2(-ca - cb, d + sa + sb) - np.arctan2(-2.0, p)
+        params[2] = np.stack((_mod2pi(tmp - a), p, _mod2pi(tmp - b)), axis=-1)
+
+        # RSL
+        p_sq = -2 + d2 + 2 * c_ab - 2 * d * (sa + sb)
+        p = np.sqrt(p_sq)
+        tmp = np.arctan2(ca + cb, d - sa - sb) - np.arctan2(2.0, p)
+        params[3] = np.stack((_mod2pi(a - tmp), p, _mod2pi(b - tmp)), axis=-1)
+
+        # RLR
+        tmp = (6 - d2 + 2 * c_ab + 2 * d * (sa - sb)) / 8
+        phi = np.arctan2(ca - cb, d - sa + sb)
+        p = _mod2pi(TWO_PI - np.arccos(tmp))
+        t = _mod2pi(a - phi + p / 2)
+        params[4] = np.stack((t, p, _mod2pi(a - b - t + p)), axis=-1)
+
+        # LRL
+        tmp = (6 - d2 + 2 * c_ab + 2 * d * (sb - sa)) / 8
+        phi = np.arctan2(ca - cb, d + sa - sb)
+        p = _mod2pi(TWO_PI - np.arccos(tmp))
+        t = _mod2pi(-a - phi + p / 2)
+        params[5] = np.stack((t, p, _mod2pi(b - a - t + p)), axis=-1)
+
+    # infeasible words have NaN parameters (sqrt/arccos out of range)
+    lengths = np.where(np.isnan(params).any(axis=-1), np.inf, params.sum(axis=-1))
+    family = np.argmin(lengths, axis=0)
+    return family, params[family, np.arange(n)]
+
+
+def waypoint_headings(x: np.ndarray, y: np.ndarray, headings: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Heading at every waypoint: the given one where `headings` is not NaN,
+    otherwise the bisector of the incoming and outgoing legs (the leg itself
+    at the first and last waypoint).
+    """
+    legs = np.arctan2(np.diff(y), np.diff(x))
+    incoming = np.concatenate((legs[:1], legs))
+    outgoing = np.concatenate((legs, legs[-1:]))
+    free = np.arctan2(np.sin(incoming) + np.sin(outgoing), np.cos(incoming) + np.cos(outgoing))
+    # a full reversal has no bisector; keep the outgoing leg
+    reversal = np.isclose(np.cos(incoming - outgoing), -1.0)
+    free = np.where(reversal, outgoing, free)
+    if headings is None:
+        return free
+    return np.where(np.isnan(headings), free, headings)
@@ -0,0 +1,171 @@
+"""
+geodesy.py
+
+Vectorized geodesy on the WGS84 ellipsoid for mission planning, validation
+and geofencing. Every function takes scalars or NumPy arrays (degrees,
+meters) and broadcasts.
+
+- LocalProjection: transverse Mercator centred on a reference point, used
+  as the local x (east) / y (north) plane for planning. It is conformal and
+  its scale error is (d / R)^2 / 2, about 3e-5 at 50 km from the
+  reference, against more than 1e-3 for the equirectangular approximation
+  it replaces. Krüger's series to n^4 keeps it at mm level much farther out.
+- vincenty(): ellipsoidal distance, mm accurate, falling back to
+  haversine() for the nearly antipodal pairs it does not converge on.
+- track(): per-step and cumulative 3D distance and time along a sampled
+  path, in one pass.
+"""
+
+from functools import lru_cache
+from typing import Dict, Tuple, Union
+
+import numpy as np
+
+ArrayLike = Union[float, np.ndarray]
+
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+MEAN_RADIUS = 6371008.8  # IUGG mean earth radius, for haversine()
+
+_N = WGS84_F / (2 - WGS84_F)
+_RECTIFYING_A = WGS84_A / (1 + _N) * (1 + _N ** 2 / 4 + _N ** 4 / 64)
+_ALPHA = (_N / 2 - 2 * _N ** 2 / 3 + 5 * _N ** 3 / 16 + 41 * _N ** 4 / 180,
+          13 * _N ** 2 / 48 - 3 * _N ** 3 / 5 + 557 * _N ** 4 / 1440,
+          61 * _N ** 3 / 240 - 103 * _N ** 4 / 140,
+          49561 * _N ** 4 / 161280)
+_BETA = (_N / 2 - 2 * _N ** 2 / 3 + 37 * _N ** 3 / 96 - _N ** 4 / 360,
+         _N ** 2 / 48 + _N ** 3 / 15 - 437 * _N ** 4 / 1440,
+         17 * _N ** 3 / 480 - 37 * _N ** 4 / 840,
+         4397 * _N ** 4 / 161280)
+_DELTA = (2 * _N - 2 * _N ** 2 / 3 - 2 * _N ** 3 + 116 * _N ** 4 / 45,
+          7 * _N ** 2 / 3 - 8 * _N ** 3 / 5 - 227 * _N ** 4 / 45,
+          56 * _N ** 3 / 15 - 136 * _N ** 4 / 35,
+          4279 * _N ** 4 / 630)
+_E_N = 2 * np.sqrt(_N) / (1 + _N)
+
+
+class LocalProjection:
+    """
+    Transverse Mercator with its central meridian through (lat0, lon0) and
+    that point at x = y = 0; x points east and y north, in meters.
+    """
+
+    def __init__(self, lat0: float, lon0: float, k0: float = 1.0) -> None:
+        self.lat0 = lat0
+        self.lon0 = lon0
+        self.k0 = k0
+        _, self._y0 = self._forward(np.asarray(lat0, dtype=float), np.asarray(lon0, dtype=float))
+
+    def _forward(self, lat: np.ndarray, lon: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        phi = np.radians(lat)
+        dlam = np.radians(lon - self.lon0)
+        sin_phi = np.sin(phi)
+        t = np.sinh(np.arctanh(sin_phi) - _E_N * np.arctanh(_E_N * sin_phi))
+        xi = np.arctan2(t, np.cos(dlam))
+        eta = np.arctanh(np.sin(dlam) / np.sqrt(1 + t * t))
+        x, y = eta, xi
+        for j, alpha in enumerate(_ALPHA, 1):
+            x = x + alpha * np.cos(2 * j * xi) * np.sinh(2 * j * eta)
+            y = y + alpha * np.sin(2 * j * xi) * np.cosh(2 * j * eta)
+        scale = self.k0 * _RECTIFYING_A
+        return scale * x, scale * y
+
+    def forward(self, lat: ArrayLike, lon: ArrayLike) -> Tuple[np.ndarray, np.ndarray]:
+        """(lat, lon) in degrees to local (x, y) in meters."""
+        x, y = self._forward(np.asarray(lat, dtype=float), np.asarray(lon, dtype=float))
+        return x, y - self._y0
+
+    def inverse(self, x: ArrayLike, y: ArrayLike) -> Tuple[np.ndarray, np.ndarray]:
+        """Local (x, y) in meters to (lat, lon) in degrees."""
+        scale = self.k0 * _RECTIFYING_A
+        eta = np.asarray(x, dtype=float) / scale
+        xi = (np.asarray(y, dtype=float) + self._y0) / scale
+        xi_p, eta_p = xi, eta
+        for j, beta in enumerate(_BETA, 1):
+            xi_p = xi_p - beta * np.sin(2 * j * xi) * np.cosh(2 * j * eta)
+            eta_p = eta_p - beta * np.cos(2 * j * xi) * np.sinh(2 * j * eta)
+        chi = np.arcsin(np.sin(xi_p) / np.cosh(eta_p))
+        phi = chi
+        for j, delta in enumerate(_DELTA, 1):
+            phi = phi + delta * np.sin(2 * j * chi)
+        lam = np.arctan2(np.sinh(eta_p), np.cos(xi_p))
+        return np.degrees(phi), self.lon0 + np.degrees(lam)
+
+
+@lru_cache(maxsize=32)
+def local_projection(lat0: float, lon0: float) -> LocalProjection:
+    """Shared LocalProjection per reference point; missions reuse the same first waypoint."""
+    return LocalProjection(lat0, lon0)
+
+
+def haversine(lat1: ArrayLike, lon1: ArrayLike, lat2: ArrayLike, lon2: ArrayLike,
+              radius: float = MEAN_RADIUS) -> np.ndarray:
+    """Great-circle distance in meters on a sphere; within ~0.5% of the ellipsoidal distance."""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = phi2 - phi1
+    dlam = np.radians(np.asarray(lon2) - np.asarray(lon1))
+    h = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlam / 2) ** 2
+    return 2 * radius * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+def vincenty(lat1: ArrayLike, lon1: ArrayLike, lat2: ArrayLike, lon2: ArrayLike,
+             tol: float = 1e-12, max_iter: int = 200) -> np.ndarray:
+    """Distance in meters on the WGS84 ellipsoid (Vincenty's inverse formula)."""
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in (lat1, lon1, lat2, lon2)))
+    f = WGS84_F
+    L = np.radians(lon2 - lon1)
+    U1 = np.arctan((1 - f) * np.tan(np.radians(lat1)))
+    U2 = np.arctan((1 - f) * np.tan(np.radians(lat2)))
+    sin_u1, cos_u1 = np.sin(U1), np.cos(U1)
+    sin_u2, cos_u2 = np.sin(U2), np.cos(U2)
+
+    lam = L
+    converged = np.zeros(L.shape, dtype=bool)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for _ in range(max_iter):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.hypot(cos_u2 * sin_lam, cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam)
+            cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+            sin_alpha = np.where(sin_sigma > 0, cos_u1 * cos_u2 * sin_lam / sin_sigma, 0.0)
+            cos2_alpha = 1 - sin_alpha ** 2
+            # equatorial lines have cos2_alpha = 0
+            cos_2sm = np.where(cos2_alpha > 0, cos_sigma - 2 * sin_u1 * sin_u2 / cos2_alpha, 0.0)
+            C = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+            lam_prev = lam
+            lam = L + (1 - C) * f * sin_alpha * (
+                sigma + C * sin_sigma * (cos_2sm + C * cos_sigma * (-1 + 2 * cos_2sm ** 2)))
+            converged = np.abs(lam - lam_prev) < tol
+            if converged.all():
+                break
+
+        u2 = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+        A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+        B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+        d_sigma = B * sin_sigma * (cos_2sm + B / 4 * (cos_sigma * (-1 + 2 * cos_2sm ** 2)
+                                                      - B / 6 * cos_2sm * (-3 + 4 * sin_sigma ** 2)
+                                                      * (-3 + 4 * cos_2sm ** 2)))
+        s = WGS84_B * A * (sigma - d_sigma)
+
+    if not converged.all():
+        s = np.where(converged, s, haversine(lat1, lon1, lat2, lon2))
+    return s
+
+
+def track(lat: np.ndarray, lon: np.ndarray, alt: np.ndarray, speed_mps: float) -> Dict[str, np.ndarray]:
+    """
+    Distance and time along a sampled path.
+    Returns:
+        dict of arrays: 'step_m' (3D distance from the previous point, 0
+        for the first), 'cumulative_m' and 'eta_s' (time from the first
+        point at speed_mps), all as long as the path.
+    """
+    lat, lon, alt = (np.asarray(v, dtype=float) for v in (lat, lon, alt))
+    step = np.zeros(lat.shape)
+    if lat.size > 1:
+        ground = vincenty(lat[:-1], lon[:-1], lat[1:], lon[1:])
+        step[1:] = np.hypot(ground, np.diff(alt))
+    cumulative = np.cumsum(step)
+    eta = cumulative / speed_mps if speed_mps > 0 else np.zeros(lat.shape)
+    return {"step_m": step, "cumulative_m": cumulative, "eta_s": eta}
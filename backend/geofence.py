@@ -0,0 +1,261 @@
+"""
+geofence.py
+
+Geofence checks for processed missions.
+
+A mission may carry "geofences", a list of dicts:
+    {"name": "field", "type": "inclusion" | "exclusion",
+     "polygon": [{"lat": .., "lon": ..}, ...] (or [lat, lon] pairs),
+     "min_alt": .., "max_alt": ..}
+An inclusion fence has to contain every point of the flight path, within
+its altitude floor and ceiling; without a polygon it only limits altitude.
+An exclusion fence must not contain any point within its altitude band
+(the whole column by default). Fences are independent, so with several
+inclusion fences the path has to stay inside all of them.
+
+Each polygon is projected into a local plane around its first vertex (see
+geodesy.local_projection) and indexed by EdgeIndex, so that every sampled
+point is only tested against the few edges of its grid cell. The index only
+depends on the polygon and is cached, so re-checking an edited mission does
+not rebuild it.
+"""
+
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from geodesy import local_projection
+
+FENCE_TYPES = ("inclusion", "exclusion")
+
+# points tested per batch, bounds the (points x edges per cell) temporaries
+_CHUNK_CELLS = 1 << 20
+
+# where in its cell the reference point sits; off-centre by an irrational amount so that it
+# does not land on the edges of fences drawn on a round grid
+_REF_X = 0.5 + np.sqrt(2) / 20
+_REF_Y = 0.5 + np.sqrt(3) / 20
+
+
+class EdgeIndex:
+    """
+    Point-in-polygon test over a uniform grid of the polygon's edges.
+
+    The polygon's bounding box is cut into about `cells_per_edge` cells per
+    edge; every cell lists the edges passing through it and knows
+    whether a reference point near its centre is inside the polygon. A
+    point is inside if its cell's reference point is, flipped once for
+    every edge crossing the segment between the two. That segment stays in
+    the cell, so only the few edges of that cell are tested. The edge table
+    is padded with NaN, which never counts as a crossing, so a whole batch
+    of points is tested at once.
+    """
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, cells_per_edge: float = 16.0) -> None:
+        x0, y0 = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+        self.edges = (x0, y0, x1, y1)
+
+        self.bbox = (float(x0.min()), float(y0.min()), float(x0.max()), float(y0.max()))
+        xmin, ymin, xmax, ymax = self.bbox
+        width, height = max(xmax - xmin, 1e-9), max(ymax - ymin, 1e-9)
+        cells = max(1.0, cells_per_edge * len(x0))
+        self.nx = int(np.clip(np.ceil(np.sqrt(cells * width / height)), 1, 1024))
+        self.ny = int(np.clip(np.ceil(cells / self.nx), 1, 1024))
+        self.cell_w, self.cell_h = width / self.nx, height / self.ny
+
+        # every edge goes into the cells it passes through (with a hair of margin): split into one
+        # piece per grid column, each piece covers the rows between its two ends
+        lo_x, hi_x = np.minimum(x0, x1), np.maximum(x0, x1)
+        ix0, ix1 = self._col(lo_x, -1e-9), self._col(hi_x, 1e-9)
+        edge, col = self._expand(ix0, ix1)
+        left = np.maximum(xmin + (col - 1e-9) * self.cell_w, lo_x[edge])
+        right = np.minimum(xmin + (col + 1 + 1e-9) * self.cell_w, hi_x[edge])
+        dx, dy = (x1 - x0)[edge], (y1 - y0)[edge]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            t0 = np.where(dx != 0, (left - x0[edge]) / dx, 0.0)
+            t1 = np.where(dx != 0, (right - x0[edge]) / dx, 1.0)
+        ya, yb = y0[edge] + np.clip(t0, 0, 1) * dy, y0[edge] + np.clip(t1, 0, 1) * dy
+        iy0, iy1 = self._row(np.minimum(ya, yb), -1e-9), self._row(np.maximum(ya, yb), 1e-9)
+        piece, row = self._expand(iy0, iy1)
+        edge, cell = edge[piece], row * self.nx + col[piece]
+
+        order = np.argsort(cell, kind="stable")
+        edge, cell = edge[order], cell[order]
+        counts = np.bincount(cell, minlength=self.nx * self.ny)
+        slot = np.arange(len(edge)) - np.repeat(np.cumsum(counts) - counts, counts)
+        self._counts = counts
+        self.width = int(counts.max())
+
+        shape = (self.nx * self.ny, self.width)
+        self._x0, self._y0, self._x1, self._y1 = (np.full(shape, np.nan) for _ in range(4))
+        for table, values in zip((self._x0, self._y0, self._x1, self._y1), self.edges):
+            table[cell, slot] = values[edge]
+
+        self._rx = xmin + (np.arange(self.nx) + _REF_X) * self.cell_w
+        self._ry = ymin + (np.arange(self.ny) + _REF_Y) * self.cell_h
+        self._ref_inside = self._scan_rows().ravel()
+
+    @staticmethod
+    def _expand(start: np.ndarray, stop: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Every (i, j) with start[i] <= j <= stop[i], as two flat arrays."""
+        counts = stop - start + 1
+        i = np.repeat(np.arange(len(start)), counts)
+        return i, start[i] + np.arange(len(i)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    def _col(self, x: np.ndarray, margin: float = 0.0) -> np.ndarray:
+        return np.clip(np.floor((x - self.bbox[0]) / self.cell_w + margin), 0, self.nx - 1).astype(np.int64)
+
+    def _row(self, y: np.ndarray, margin: float = 0.0) -> np.ndarray:
+        return np.clip(np.floor((y - self.bbox[1]) / self.cell_h + margin), 0, self.ny - 1).astype(np.int64)
+
+    def _scan_rows(self) -> np.ndarray:
+        """Even-odd test of the reference points, one horizontal ray per grid row; (ny, nx) mask."""
+        x0, y0, x1, y1 = self.edges
+        inside = np.zeros((self.ny, self.nx), dtype=bool)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for row, ry in enumerate(self._ry):
+                straddles = (y0 > ry) != (y1 > ry)
+                crossings = np.sort((x0 + (ry - y0) * (x1 - x0) / (y1 - y0))[straddles])
+                right = len(crossings) - np.searchsorted(crossings, self._rx, side="right")
+                inside[row] = right % 2 == 1
+        return inside
+
+    def contains(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """Boolean mask of the points (x, y) inside the polygon."""
+        x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        xmin, ymin, xmax, ymax = self.bbox
+        inside = np.zeros(x.shape, dtype=bool)
+        candidates = np.flatnonzero((x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax))
+        cells = self._row(y[candidates]) * self.nx + self._col(x[candidates])
+        inside[candidates] = self._ref_inside[cells]
+        # a few crowded cells (e.g. where the spikes of a star meet) must not widen the test of all the others:
+        # points are tested in groups of up to 1, 2, 4, ... edges per cell, against that many table columns
+        counts = self._counts[cells]
+        low = 0
+        while low < self.width:
+            high = min(2 * low or 1, self.width)
+            group = np.flatnonzero((counts > low) & (counts <= high))
+            chunk = max(1, _CHUNK_CELLS // high)
+            for start in range(0, len(group), chunk):
+                sel = group[start:start + chunk]
+                inside[candidates[sel]] ^= self._flips(x[candidates[sel]], y[candidates[sel]], cells[sel], high)
+            low = high
+        return inside
+
+    def _flips(self, x: np.ndarray, y: np.ndarray, cell: np.ndarray, width: int) -> np.ndarray:
+        """Whether an odd number of edges cross the segment from each point to its cell's reference point."""
+        px, py = x[:, None], y[:, None]
+        cx, cy = self._rx[cell % self.nx, None], self._ry[cell // self.nx, None]
+        x0, y0, x1, y1 = (table[cell, :width] for table in (self._x0, self._y0, self._x1, self._y1))
+        with np.errstate(invalid="ignore"):
+            # an edge crosses the segment if its ends lie on different sides of the segment's line and vice versa;
+            # points exactly on a line count as the same side throughout, keeping the parity consistent
+            ends_apart = (((cx - px) * (y0 - py) - (cy - py) * (x0 - px)) > 0) != \
+                         (((cx - px) * (y1 - py) - (cy - py) * (x1 - px)) > 0)
+            line_apart = (((x1 - x0) * (cy - y0) - (y1 - y0) * (cx - x0)) > 0) != \
+                         (((x1 - x0) * (py - y0) - (y1 - y0) * (px - x0)) > 0)
+        return np.count_nonzero(ends_apart & line_apart, axis=1) % 2 == 1
+
+
+@lru_cache(maxsize=32)
+def _edge_index(lat: Tuple[float, ...], lon: Tuple[float, ...]) -> EdgeIndex:
+    """Shared EdgeIndex per fence polygon, in the plane of local_projection(lat[0], lon[0])."""
+    return EdgeIndex(*local_projection(lat[0], lon[0]).forward(np.array(lat), np.array(lon)))
+
+
+class Fence:
+    def __init__(self, name: str, kind: str, lat: Optional[np.ndarray], lon: Optional[np.ndarray],
+                 min_alt: float = -np.inf, max_alt: float = np.inf) -> None:
+        self.name = name
+        self.kind = kind
+        self.lat = lat
+        self.lon = lon
+        self.vertices = None if lat is None else (tuple(lat.tolist()), tuple(lon.tolist()))
+        self.min_alt = min_alt
+        self.max_alt = max_alt
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], number: int) -> "Fence":
+        """Parse one entry of mission["geofences"]; raises ValueError if it is malformed."""
+        name = str(data.get("name", f"#{number}"))
+        kind = data.get("type", "inclusion")
+        if kind not in FENCE_TYPES:
+            raise ValueError(f"Geofence {name!r}: unknown type {kind!r} (choose from {', '.join(FENCE_TYPES)}).")
+
+        lat = lon = None
+        polygon = data.get("polygon")
+        if polygon:
+            try:
+                points = [(p["lat"], p["lon"]) if isinstance(p, dict) else (p[0], p[1]) for p in polygon]
+                lat, lon = np.array(points, dtype=float).T
+            except (KeyError, IndexError, TypeError, ValueError):
+                raise ValueError(f"Geofence {name!r}: polygon vertices need a lat and lon.")
+            if len(lat) < 3:
+                raise ValueError(f"Geofence {name!r}: a polygon needs at least 3 vertices.")
+        elif kind == "exclusion":
+            raise ValueError(f"Geofence {name!r}: an exclusion fence needs a polygon.")
+
+        try:
+            min_alt = float(data["min_alt"]) if data.get("min_alt") is not None else -np.inf
+            max_alt = float(data["max_alt"]) if data.get("max_alt") is not None else np.inf
+        except (TypeError, ValueError):
+            raise ValueError(f"Geofence {name!r}: min_alt and max_alt must be numbers.")
+        if min_alt > max_alt:
+            raise ValueError(f"Geofence {name!r}: min_alt is above max_alt.")
+        return cls(name, kind, lat, lon, min_alt, max_alt)
+
+    def violations(self, lat: np.ndarray, lon: np.ndarray, alt: np.ndarray) -> np.ndarray:
+        """Boolean mask of the path points breaching this fence."""
+        in_band = (alt >= self.min_alt) & (alt <= self.max_alt)
+        if self.vertices is not None:
+            x, y = local_projection(self.vertices[0][0], self.vertices[1][0]).forward(lat, lon)
+            inside = _edge_index(*self.vertices).contains(x, y)
+        else:
+            inside = np.ones(lat.shape, dtype=bool)
+        if self.kind == "inclusion":
+            return ~(inside & in_band)
+        return inside & in_band
+
+
+def parse_fences(mission: Dict) -> Tuple[List[Fence], List[str]]:
+    """The fences of a mission, and an error message for each malformed one (which is skipped)."""
+    fences, errors = [], []
+    for number, data in enumerate(mission.get("geofences") or [], 1):
+        try:
+            fences.append(Fence.from_dict(data, number))
+        except ValueError as e:
+            errors.append(str(e))
+    return fences, errors
+
+
+def check_fences(fences: List[Fence], lat: np.ndarray, lon: np.ndarray, alt: np.ndarray) -> List[Dict[str, Any]]:
+    """
+    Check every point of a flight path against the fences.
+    Returns:
+        one dict per breached fence: 'fence' (name), 'type' and 'indices',
+        the flight path indices of the breaching points.
+    """
+    lat, lon, alt = (np.asarray(v, dtype=float) for v in (lat, lon, alt))
+    if not fences or not lat.size:
+        return []
+    out = []
+    for fence in fences:
+        indices = np.flatnonzero(fence.violations(lat, lon, alt))
+        if indices.size:
+            out.append({"fence": fence.name, "type": fence.kind, "indices": indices.tolist()})
+    return out
+
+
+def describe(violation: Dict[str, Any], max_runs: int = 5) -> str:
+    """Error message for one entry of check_fences(), with the breaching index ranges."""
+    indices = np.asarray(violation["indices"])
+    breaks = np.flatnonzero(np.diff(indices) != 1)
+    starts = np.concatenate(([indices[0]], indices[breaks + 1]))
+    ends = np.concatenate((indices[breaks], [indices[-1]]))
+    runs = [f"{a}" if a == b else f"{a}-{b}" for a, b in zip(starts[:max_runs].tolist(), ends[:max_runs].tolist())]
+    if len(starts) > max_runs:
+        runs.append("...")
+    return (f"Flight path breaches {violation['type']} geofence {violation['fence']!r} at "
+            f"{len(indices)} point(s): {', '.join(runs)}.")
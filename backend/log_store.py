@@ -0,0 +1,193 @@
+"""
+log_store.py
+
+Bounded, indexed storage for GCS log entries.
+
+Log IDs follow the CCSIXX format from logs_template.json (category, severity,
+importance, incremental id). Entries are partitioned by (category, severity,
+importance), and each partition is kept sorted by (timestamp, seq) so that a
+filtered time-range query is a handful of binary searches followed by a lazy
+k-way merge, instead of a scan over every log ever received.
+"""
+
+import bisect
+import heapq
+import itertools
+from typing import Dict, Any, Optional, Iterable, List, Tuple, Iterator
+
+DEFAULT_CAPACITY = 50_000
+
+# Order used for "minimum severity" filters; the template numbers severities
+# 0=Info, 1=Warning, 2=Error, 3=System, 4=Debug, which is not a ranking.
+SEVERITY_RANK = {4: 0, 0: 1, 3: 2, 1: 3, 2: 4}
+
+Key = Tuple[int, int]  # (timestamp, seq)
+PartitionKey = Tuple[str, Optional[int], Optional[int]]
+
+
+def parse_log_id(log_id: str) -> PartitionKey:
+    """
+    Split a CCSIXX log ID into (category, severity, importance).
+    Severity and importance are None when not numeric (e.g. hashed EA/ER IDs).
+    """
+    category = log_id[:2]
+    severity = int(log_id[2]) if len(log_id) > 2 and log_id[2].isdigit() else None
+    importance = int(log_id[3]) if len(log_id) > 3 and log_id[3].isdigit() else None
+    return category, severity, importance
+
+
+def encode_cursor(key: Key) -> str:
+    return f"{key[0]}:{key[1]}"
+
+
+def decode_cursor(cursor: str) -> Key:
+    try:
+        ts, seq = cursor.split(":")
+        return int(ts), int(seq)
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+class _Partition:
+    """Entries of one (category, severity, importance), sorted by key."""
+
+    def __init__(self) -> None:
+        self.keys: List[Key] = []
+        self.entries: List[Dict[str, Any]] = []
+        self.head = 0  # index of the oldest live entry; compacted lazily
+
+    def __len__(self) -> int:
+        return len(self.keys) - self.head
+
+    def add(self, key: Key, entry: Dict[str, Any]) -> None:
+        if not self.keys or key >= self.keys[-1]:
+            self.keys.append(key)
+            self.entries.append(entry)
+        else:
+            # late entry (e.g. buffered on the Pi during a dropout)
+            i = bisect.bisect_right(self.keys, key, lo=self.head)
+            self.keys.insert(i, key)
+            self.entries.insert(i, entry)
+
+    def oldest(self) -> Key:
+        return self.keys[self.head]
+
+    def pop_oldest(self) -> None:
+        self.keys[self.head] = None
+        self.entries[self.head] = None
+        self.head += 1
+        if self.head > 1024 and self.head * 2 > len(self.keys):
+            del self.keys[:self.head]
+            del self.entries[:self.head]
+            self.head = 0
+
+    def range(self, lo_key: Key, hi_key: Key, newest_first: bool) -> Iterator[Tuple[Key, Dict[str, Any]]]:
+        """Entries with lo_key < key < hi_key."""
+        lo = bisect.bisect_right(self.keys, lo_key, lo=self.head)
+        hi = bisect.bisect_left(self.keys, hi_key, lo=lo)
+        indexes = range(hi - 1, lo - 1, -1) if newest_first else range(lo, hi)
+        return ((self.keys[i], self.entries[i]) for i in indexes)
+
+
+class LogStore:
+    """
+    Bounded log storage with time, category, severity and importance indexes.
+
+    Args:
+        capacity: Maximum number of entries kept; the oldest (by timestamp)
+            are evicted first.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY) -> None:
+        self.capacity = capacity
+        self.partitions: Dict[PartitionKey, _Partition] = {}
+        self._seq = itertools.count()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """Every entry, newest first, like the log list this store replaced (and the CSV export)."""
+        return iter(self.query()[0])
+
+    def append(self, entry: Dict[str, Any]) -> int:
+        """Store an entry with "log_id" and "timestamp"; returns its sequence number."""
+        seq = next(self._seq)
+        part_key = parse_log_id(entry["log_id"])
+        part = self.partitions.get(part_key)
+        if part is None:
+            part = self.partitions[part_key] = _Partition()
+        part.add((int(entry["timestamp"]), seq), entry)
+        self._size += 1
+
+        while self._size > self.capacity:
+            self._evict_oldest()
+        return seq
+
+    def _evict_oldest(self) -> None:
+        part_key, part = min(self.partitions.items(), key=lambda kp: kp[1].oldest())
+        part.pop_oldest()
+        self._size -= 1
+        if not len(part):
+            del self.partitions[part_key]
+
+    def query(
+            self,
+            start: Optional[int] = None,
+            end: Optional[int] = None,
+            categories: Optional[Iterable[str]] = None,
+            severities: Optional[Iterable[int]] = None,
+            importances: Optional[Iterable[int]] = None,
+            min_severity: Optional[int] = None,
+            cursor: Optional[str] = None,
+            limit: Optional[int] = None,
+            newest_first: bool = True,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Return entries with start <= timestamp <= end that match every filter.
+
+        Args:
+            start, end: Inclusive timestamp bounds in ns; None means open-ended.
+            categories, severities, importances: Allowed values; None allows all.
+            min_severity: Lowest severity to include, ranked by SEVERITY_RANK.
+            cursor: next_cursor from a previous call, to continue after it.
+            limit: Maximum number of entries to return.
+            newest_first: Sort order, newest first by default.
+        Returns:
+            (entries, next_cursor); next_cursor is None when nothing is left.
+        """
+        categories = set(categories) if categories is not None else None
+        severities = set(severities) if severities is not None else None
+        importances = set(importances) if importances is not None else None
+        min_rank = SEVERITY_RANK.get(min_severity, 0) if min_severity is not None else None
+
+        lo_key: Key = (start - 1, float("inf")) if start is not None else (float("-inf"), 0)
+        hi_key: Key = (end + 1, -1) if end is not None else (float("inf"), 0)
+        if cursor is not None:
+            after = decode_cursor(cursor)
+            if newest_first:
+                hi_key = min(hi_key, after)
+            else:
+                lo_key = max(lo_key, after)
+
+        streams = []
+        for (cat, sev, imp), part in self.partitions.items():
+            if categories is not None and cat not in categories:
+                continue
+            if severities is not None and sev not in severities:
+                continue
+            if importances is not None and imp not in importances:
+                continue
+            # IDs without a ranked severity (hashed EA/ER, PH5-7) always pass
+            if min_rank is not None and SEVERITY_RANK.get(sev, min_rank) < min_rank:
+                continue
+            streams.append(part.range(lo_key, hi_key, newest_first))
+
+        merged = heapq.merge(*streams, key=lambda item: item[0], reverse=newest_first)
+        if limit is None:
+            return [entry for _, entry in merged], None
+
+        page = list(itertools.islice(merged, limit + 1))
+        next_cursor = encode_cursor(page[limit - 1][0]) if len(page) > limit and limit > 0 else None
+        return [entry for _, entry in page[:limit]], next_cursor
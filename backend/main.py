@@ -4,37 +4,75 @@ from typing import Optional, Any, Dict, List, Callable, Awaitable
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from contextlib import asynccontextmanager
 from pathlib import Path
 import hashlib
 import asyncio
 import atexit
+import os
 import time
 
-from process_mission import process_mission
+from mission_session import MissionSession
 from update_server import start_update_server
 from uav_comms import UavComms
 from pixhawk_client import PixHawkClient
+from replay_client import ReplayClient
+from telemetry_store import TelemetryStore
+from log_store import LogStore
+from broadcast import BroadcastHub, ClientChannel, Subscription, encode
+from metrics import REGISTRY
+
+import _paths  # puts onboard/rpi on sys.path
+from loop_monitor import LoopMonitor
 
 # <editor-fold desc="global variables">
-telemetry_log = []
+# telemetry history is bounded to GCS_TELEMETRY_MB in total, split between the message types
+telemetry_store = TelemetryStore(max_bytes=int(os.environ.get("GCS_TELEMETRY_MB", "64")) * 1024 * 1024)
 result = None  # global placeholder
+# keeps the last planned path so waypoint edits only re-plan what they change
+mission_session = MissionSession()
 mission_data = None
 ats_mission_data = None
 
 with (Path(__file__).resolve().parent.parent / "logs_template.json").open("r", encoding="utf-8") as f:
     template = json.load(f)
 
-log_entries = []
+# maximum number of log entries kept in memory
+LOG_RETENTION = 50_000
+
+log_store = LogStore(capacity=LOG_RETENTION)
 error_entries = []
 
 # TODO: Remember to implement
 drone_state = defaultdict(dict)
 
-send_cmd = Callable[[dict], Awaitable[Any]]
-
-use_pi = False
+send_cmd = Callable[..., Awaitable[str]]  # send_command(command, params, timeout=, frame=) of the UAV source
+send_msg: Optional[Callable[[dict], Awaitable[None]]] = None  # control messages to the Pi, None without a Pi link
+command_tasks: set = set()  # commands sent from browsers, running concurrently
+
+# where telemetry comes from: "pi" (UavComms link), "pixhawk" (local serial) or "replay" (a .tlog or recorder
+# segment at GCS_REPLAY_SPEED times real time, 0 = as fast as possible)
+uav_source = os.environ.get("GCS_SOURCE", "pixhawk")
+replay_path = os.environ.get("GCS_REPLAY")
+replay_speed = float(os.environ.get("GCS_REPLAY_SPEED", "1"))
+replay_loop = os.environ.get("GCS_REPLAY_LOOP", "0") == "1"
+# with GCS_SOURCE=pi, the raw MAVLink frames of a Pi in passthrough mode are appended to this .tlog
+tlog_path = os.environ.get("GCS_TLOG")
+uav_comms = None  # UavComms, PixHawkClient or ReplayClient, set in lifespan
+
+LOGS = REGISTRY.counter("gcs_logs_total", "Logs added, by severity digit of the log ID", ["severity"])
+PUBLISHED = REGISTRY.counter("gcs_published_total", "Messages fanned out to browser clients, by type", ["type"])
+PUBLISH_TIME = REGISTRY.histogram("gcs_send_to_client", "Time spent in send_to_client")
+LOOP_LAG = REGISTRY.histogram("gcs_event_loop_lag", "How late the event loop runs a task that is due")
+
+loop_monitor = LoopMonitor(
+    threshold=0.1,
+    report_path=Path(__file__).resolve().parent / "loop_report.jsonl",
+    on_stall=lambda stall: add_log("GC1100", {"duration_ms": stall["duration_ms"], "where": stall["where"]}),
+    on_lag=LOOP_LAG.observe,
+)
+update_server = None  # UAVServer, also receives flight recorder segments
 
 
 # </editor-fold>
@@ -43,18 +81,22 @@ use_pi = False
 # <editor-fold desc="setup">
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global drone_state, log_entries, send_cmd
+    global drone_state, send_cmd, send_msg, uav_comms, update_server
+    if uav_source == "replay" and not (replay_path and Path(replay_path).is_file()):
+        raise RuntimeError(f"GCS_SOURCE=replay needs GCS_REPLAY set to a .tlog or recorder segment "
+                           f"(got {replay_path!r}).")
     # start the directory‐serving HTTP server in a daemon thread
-    start_update_server()
+    update_server = start_update_server()
 
-    if use_pi:
-        uav_comms = UavComms()
+    if uav_source == "pi":
+        uav_comms = UavComms(tlog_path=tlog_path)
 
-        send_cmd = uav_comms.send
+        send_cmd = uav_comms.send_command
+        send_msg = uav_comms.send
         uav_comms.log_callback = add_log
         uav_comms.telem_callback = send_to_client
+        uav_comms.telemetry_store = telemetry_store
         drone_state = uav_comms.state
-        log_entries = uav_comms.logs
 
         uav_client_task = asyncio.create_task(uav_comms.mainloop())
     else:
@@ -62,28 +104,40 @@ async def lifespan(app: FastAPI):
             add_log(log_id, variables)
 
         async def pixhawk_send_msg(msg: dict):
+            if msg["type"] == "telemetry":
+                # match the {msg_type: fields} shape the Pi link and frontend use
+                fields = dict(msg["data"])
+                msg = {"type": "telemetry", "data": {fields.pop("mavpackettype"): fields}}
             await send_to_client(msg)
 
-        uav_comms = PixHawkClient(
-            device="COM4",  # <-- change to Linux path if needed
-            baud=115200,
-            send_log=pixhawk_send_log,
-            send_msg=pixhawk_send_msg
-        )
+        if uav_source == "replay":
+            uav_comms = ReplayClient(replay_path, send_log=pixhawk_send_log, send_msg=pixhawk_send_msg,
+                                     speed=replay_speed, loop=replay_loop)
+        else:
+            uav_comms = PixHawkClient(
+                device="COM4",  # <-- change to Linux path if needed
+                baud=115200,
+                send_log=pixhawk_send_log,
+                send_msg=pixhawk_send_msg
+            )
 
         # Expose shared structures
         send_cmd = uav_comms.send_command
         drone_state = uav_comms.state
-        log_entries = []  # pixhawk does not keep log history—your backend does
+        uav_comms.telemetry_store = telemetry_store
 
         uav_client_task = asyncio.create_task(uav_comms.mainloop())
 
+    # loop lag feeds the metrics; any callback blocking the loop for 100 ms is logged with its stack
+    loop_monitor.start()
+
     add_log("GC0001")
     try:
         yield
     finally:
         # on shutdown, cancel mainloop and stop HTTP server cleanly
         uav_client_task.cancel()
+        loop_monitor.stop()
         print("Update server stopped.")
 
 
@@ -109,8 +163,7 @@ def write_csv_log(data, prefix):
 
 def save_telemetry_to_csv():
     add_log("GC0100")
-    write_csv_log(telemetry_log, "telemetry")
-    write_csv_log(log_entries, "logs")
+    write_csv_log(list(log_store), "logs")
 
 
 app = FastAPI(lifespan=lifespan)
@@ -148,6 +201,8 @@ def add_log(
     if not timestamp:
         timestamp = time.time_ns()
 
+    LOGS.labels(log_id[2:3]).inc()
+
     if not error:
         print(f"log_id: {log_id}, variables: {variables}, timestamp: {timestamp}")
 
@@ -157,8 +212,7 @@ def add_log(
             "variables": variables,
         }
 
-        # insert newest at front
-        log_entries.insert(0, payload)
+        log_store.append(payload)
 
         if log_id == "PH2000":
             if variables["text"].startswith("PreArm: "):
@@ -174,14 +228,7 @@ def add_log(
                 add_log(log_id="EA" + next_id, timestamp=timestamp,
                         variables={"text": template[log_id].format(**variables)}, error=True)'''
 
-        # optional: print or broadcast here, e.g.:
-        try:
-            loop = asyncio.get_running_loop()
-            loop.create_task(
-                send_to_client(
-                    {"type": "log", "data": {"timestamp": timestamp, "log_id": log_id, "variables": variables}}))
-        except RuntimeError:
-            pass
+        hub.publish({"type": "log", "data": payload})
     else:
         # Error log path
         text = variables.get("text")
@@ -205,14 +252,9 @@ def add_log(
             "variables": variables,
         }
 
-        log_entries.insert(0, payload)
+        log_store.append(payload)
 
-        try:
-            loop = asyncio.get_running_loop()
-            loop.create_task(
-                send_to_client({"type": "log", "data": payload}))
-        except RuntimeError:
-            pass
+        hub.publish({"type": "log", "data": payload})
 
 
 # === Mainloop ===
@@ -235,17 +277,81 @@ def read_status():
     return {"status": "running"}
 
 
+@app.get("/api/telemetry/stats")
+def get_telemetry_stats():
+    """Memory budget and use of the telemetry history, with rows and capacity per message type."""
+    return telemetry_store.stats()
+
+
 @app.get("/api/telemetry/historical")
-def get_telemetry(start: int = 0, end: Optional[int] | None = None) -> List[Dict[str, Any]]:
-    return [{"telemetry": drone_state}]
+def get_telemetry(
+        start: int = 0,
+        end: Optional[int] = None,
+        msg_type: Optional[str] = None,
+        fields: Optional[str] = None,
+        every: int = 1,
+        bucket: Optional[float] = None,
+        agg: Optional[str] = None,
+        max_points: Optional[int] = None,
+):
+    """
+    Columnar telemetry history per message type.
+
+    msg_type and fields are comma separated (all types/fields when omitted),
+    bucket is in seconds. Returns {msg_type: {"timestamp": [...], field: [...]}}.
+    """
+    types = msg_type.split(",") if msg_type else telemetry_store.types()
+    projection = fields.split(",") if fields else None
+    bucket_ns = int(bucket * 1e9) if bucket is not None else None
+
+    try:
+        return {
+            t: telemetry_store.query(t, start=start, end=end, fields=projection, every=every,
+                                     bucket_ns=bucket_ns, agg=agg, max_points=max_points)
+            for t in types
+        }
+    except KeyError as e:
+        return JSONResponse(status_code=404, content={"error": f"No telemetry for {e.args[0]}"})
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
 
 
 @app.get("/api/log/historical")
-def get_logs(start: int = 0, end: Optional[int] = None) -> List[Dict[str, Any]]:
-    return [
-        log for log in log_entries
-        if start <= log["timestamp"] <= (end if end is not None else int(time.time_ns()))
-    ]
+def get_logs(
+        response: Response,
+        start: int = 0,
+        end: Optional[int] = None,
+        category: Optional[str] = None,
+        severity: Optional[str] = None,
+        importance: Optional[str] = None,
+        min_severity: Optional[int] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+        oldest_first: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Logs newest first. category/severity/importance are comma separated.
+    When `limit` cuts the result short, the X-Next-Cursor header holds the
+    cursor for the next page.
+    """
+    try:
+        logs, next_cursor = log_store.query(
+            start=start,
+            end=end if end is not None else time.time_ns(),
+            categories=category.split(",") if category else None,
+            severities=[int(s) for s in severity.split(",")] if severity else None,
+            importances=[int(i) for i in importance.split(",")] if importance else None,
+            min_severity=min_severity,
+            cursor=cursor,
+            limit=limit,
+            newest_first=not oldest_first,
+        )
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return logs
 
 
 @app.post("/api/log/logs")
@@ -267,7 +373,9 @@ async def upload_mission(mission: dict):
     mission_data = mission
     ats_mission_data = mission  # autosave here
     # add_log("MP0001")
-    result = process_mission(mission_data)
+    # with "base_revision" set to the revision the client holds, the analysis carries a patch
+    # of the flight path instead of all of it
+    result = mission_session.process(mission_data)
     return JSONResponse(content={"result": "Mission received", "analysis": result})
 
 
@@ -275,7 +383,7 @@ async def upload_mission(mission: dict):
 async def get_mission_result():
     if result is None:
         return JSONResponse(status_code=404, content={"error": "No mission processed yet"})
-    return result
+    return mission_session.full_result()
 
 
 @app.get("/api/mission/autosave")
@@ -289,12 +397,31 @@ def get_autosave():
 @app.post("/api/command/command_long")
 async def get_command_long(
         command: str | int = None,
-        params: List[Any] = None
+        params: List[Any] = None,
+        frame: str | int = None,
+        timeout: float = 3.0
 ):
+    """Send a command (COMMAND_INT if a frame is given) and wait for its result; commands may run concurrently."""
     if command is None:
-        pass
+        return JSONResponse(status_code=400, content={"error": "No command given"})
     add_log("NW0102", {"command": command})
-    await send_cmd({"type": "command", "msg": {"command": command, "params": params}})
+    try:
+        result = await send_cmd(command, params or [], timeout=timeout, frame=frame)
+    except TimeoutError as e:
+        return JSONResponse(status_code=504, content={"error": str(e)})
+    except (ConnectionError, RuntimeError, ValueError, TypeError) as e:
+        return JSONResponse(status_code=502, content={"error": str(e)})
+    return {"command": command, "result": result}
+
+
+async def run_command(command, params) -> None:
+    """Send a command on behalf of a browser and log the result, without holding up its socket."""
+    try:
+        result = await send_cmd(command, params or [])
+    except Exception as e:
+        add_log("NW2106", {"command": command, "e": repr(e)})
+        return
+    add_log("NW0105", {"command": command, "result": result})
 
 
 @app.post("/api/setting/update")
@@ -333,20 +460,124 @@ def get_command_int():
 
 # === WebSocket for real-time telemetry and control ===
 
-def json_safe(obj):
-    if isinstance(obj, bytearray):
-        return list(obj)  # or obj.hex()
-    if isinstance(obj, bytes):
-        return obj.decode(errors="replace")
-    if isinstance(obj, dict):
-        return {k: json_safe(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [json_safe(v) for v in obj]
-    return obj
+hub = BroadcastHub(queue_size=100)
+
+
+def _client_name(channel: ClientChannel) -> str:
+    client = channel.websocket.client
+    return f"{client.host}:{client.port}" if client else "?"
+
+
+def _link_counter(attr: str) -> Callable[[], float]:
+    # the Pi link only exists with GCS_SOURCE=pi; scraping skips it otherwise
+    return lambda: getattr(uav_comms.link_stats, attr)
+
+
+def _reader_counter(attr: str) -> Callable[[], float]:
+    return lambda: getattr(uav_comms.reader, attr)
+
+
+REGISTRY.callback("gcs_telemetry_store_bytes", "gauge", "Memory held by the telemetry history",
+                  lambda: telemetry_store.stats()["bytes"])
+REGISTRY.callback("gcs_telemetry_store_max_bytes", "gauge", "Memory budget of the telemetry history",
+                  lambda: telemetry_store.max_bytes)
+REGISTRY.callback("gcs_ws_clients", "gauge", "Connected /ws/telemetry clients", lambda: len(hub.clients))
+REGISTRY.callback("gcs_ws_queue_depth", "gauge", "Frames waiting in each client's send queue",
+                  lambda: {(_client_name(c),): c.queue.qsize() for c in hub.clients}, ["client"])
+REGISTRY.callback("gcs_ws_dropped_total", "counter", "Frames dropped because a client's queue was full",
+                  lambda: hub.dropped)
+REGISTRY.callback("gcs_link_frames_total", "counter", "WebSocket frames received from the Pi",
+                  _link_counter("frames"))
+REGISTRY.callback("gcs_link_messages_total", "counter", "Messages received from the Pi", _link_counter("messages"))
+REGISTRY.callback("gcs_link_bytes_total", "counter", "Bytes received from the Pi", _link_counter("bytes"))
+REGISTRY.callback("gcs_reader_packets_total", "counter", "MAVLink packets read from the serial port",
+                  _reader_counter("packets"))
+REGISTRY.callback("gcs_reader_parse_errors_total", "counter", "Bad MAVLink data on the serial port",
+                  _reader_counter("parse_errors"))
+REGISTRY.callback("gcs_reader_queue_depth", "gauge", "Messages read but not yet processed",
+                  lambda: uav_comms.reader.stats()["queue_depth"])
+
+
+@app.get("/api/ws/clients")
+def get_ws_clients():
+    """Queue depth and sent/dropped counters per connected WebSocket client."""
+    return hub.stats()
+
+
+@app.get("/api/metrics")
+def get_metrics(format: str = "prometheus"):
+    """Metrics registry as Prometheus text, or JSON with ?format=json."""
+    if not REGISTRY.enabled:
+        return JSONResponse(status_code=404, content={"error": "Metrics are disabled (GCS_METRICS=0)"})
+    if format == "json":
+        return {"uptime_s": round(time.time() - REGISTRY.started, 1), "metrics": REGISTRY.to_json()}
+    return Response(content=REGISTRY.prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/loop")
+def get_loop():
+    """Event-loop lag histogram and the most recent stalls."""
+    return loop_monitor.stats()
+
 
+@app.get("/api/loop/stalls")
+def get_loop_stalls():
+    """Recent event-loop stalls with the stacks sampled while the loop was blocked."""
+    return loop_monitor.recent_stalls()
 
-connections: set[tuple[WebSocket, asyncio.Queue]] = set()
-connections_lock = asyncio.Lock()
+
+@app.get("/api/mavlink/reader")
+def get_mavlink_reader():
+    """Packets/s, parse errors and queue depth of the direct serial reader."""
+    reader = getattr(uav_comms, "reader", None)
+    if reader is None:
+        return JSONResponse(status_code=404, content={"error": "No local MAVLink reader running"})
+    return reader.stats()
+
+
+@app.get("/api/link")
+def get_link_stats():
+    """Frames/s versus messages/s received on the Pi link."""
+    link_stats = getattr(uav_comms, "link_stats", None)
+    if link_stats is None:
+        return JSONResponse(status_code=404, content={"error": "No Pi link in use"})
+    return link_stats.stats()
+
+
+@app.get("/api/replay")
+def get_replay():
+    """Progress and pacing of the replay source."""
+    if not isinstance(uav_comms, ReplayClient):
+        return JSONResponse(status_code=404, content={"error": "No replay running"})
+    return uav_comms.stats()
+
+
+@app.get("/api/mavlink/handlers")
+def get_mavlink_handlers():
+    """Handler timing histogram per MAVLink message type, busiest first."""
+    dispatcher = getattr(uav_comms, "dispatcher", None)
+    if dispatcher is None:
+        return JSONResponse(status_code=404, content={"error": "No local MAVLink dispatcher running"})
+    return dispatcher.stats()
+
+
+@app.post("/api/recordings/pull")
+async def pull_recordings():
+    """Ask the Pi to upload its finished flight recorder segments to the update server."""
+    if send_msg is None:
+        return JSONResponse(status_code=404, content={"error": "No Pi link in use"})
+    await send_msg({"type": "recordings_pull", "msg": {"port": update_server.port}})
+    return {"status": "requested"}
+
+
+@app.get("/api/recordings")
+def get_recordings():
+    """Flight recorder segments received from the Pi, oldest first."""
+    directory = Path(update_server.recordings_dir)
+    if not directory.is_dir():
+        return []
+    segments = sorted(directory.glob("*.seg"), key=lambda p: p.stat().st_mtime)
+    return [{"name": p.name, "size": p.stat().st_size, "received": p.stat().st_mtime} for p in segments]
 
 
 @app.websocket("/ws/telemetry")
@@ -354,16 +585,11 @@ async def live_socket(websocket: WebSocket):
     await websocket.accept()
     add_log("UI0000", {"ip": websocket.client.host})
 
-    send_queue: asyncio.Queue = asyncio.Queue(maxsize=100)
-
-    async with connections_lock:
-        connections.add((websocket, send_queue))
+    channel = hub.register(websocket)
 
     async def sender_loop():
         try:
-            while True:
-                msg = await send_queue.get()
-                await websocket.send_json(msg)
+            await channel.sender_loop()
         except Exception as e:
             print("Sender loop ended:", repr(e))
 
@@ -371,17 +597,15 @@ async def live_socket(websocket: WebSocket):
         try:
             while True:
                 msg = await websocket.receive_json()
-                await process_client_command(msg)
+                await process_client_command(msg, channel)
         except Exception as e:
             print("Command loop ended:", repr(e))
 
     async def heartbeat_loop():
-        try:
-            while True:
-                await asyncio.sleep(30)
-                await websocket.send_json({"type": "ping"})
-        except Exception:
-            pass
+        ping = encode({"type": "ping"})
+        while True:
+            await asyncio.sleep(30)
+            channel.put(ping)
 
     sender_task = asyncio.create_task(sender_loop())
     command_task = asyncio.create_task(command_loop())
@@ -396,49 +620,59 @@ async def live_socket(websocket: WebSocket):
         for task in (sender_task, command_task, heartbeat_task):
             task.cancel()
 
-        async with connections_lock:
-            connections.discard((websocket, send_queue))
+        hub.unregister(channel)
 
         print("WebSocket cleaned up")
 
 
 async def send_to_client(payload: dict) -> None:
-    payload = json_safe(payload)
-    async with connections_lock:
-        for _, queue in connections:
-            if queue.full():
-                # Drop message for slow client
-                continue
-            await queue.put(payload)
+    PUBLISHED.labels(payload.get("type")).inc()
+    with PUBLISH_TIME.time():
+        hub.publish(payload)
 
 
-async def process_client_command(msg: dict):
+async def process_client_command(msg: dict, channel: Optional[ClientChannel] = None):
     if not isinstance(msg, dict):
         return
 
     msg_type = msg.get("type")
     msg_body = msg.get("message")
 
-    if not msg_type or not msg_body:
+    # an empty body is valid: {"type": "subscribe", "message": {}} subscribes to everything
+    if not msg_type or msg_body is None:
         return
 
     print("Received WS command:", msg)
 
     match msg_type:
         case "command_raw":
+            if not msg_body.get("command"):
+                return
             add_log("NW0102", {"command": msg})
-            await send_cmd({
-                "type": "command",
-                "msg": {
-                    "command": msg_body.get("command"),
-                    "params": msg_body.get("params"),
-                }
-            })
+            task = asyncio.create_task(run_command(msg_body.get("command"), msg_body.get("params")))
+            command_tasks.add(task)
+            task.add_done_callback(command_tasks.discard)
 
         case "command":
             add_log("EX4200", {"msg": msg})
 
+        case "resync":
+            if channel is not None and channel.delta is not None:
+                channel.delta.request_keyframe(msg_body.get("streams"))
+
+        case "subscribe":
+            if channel is None:
+                return
+            try:
+                channel.subscribe(Subscription.parse(msg_body))
+            except (ValueError, TypeError) as e:
+                add_log("UI1100", {"ip": channel.websocket.client.host, "e": repr(e)})
+                return
+            add_log("UI0001", {"ip": channel.websocket.client.host, "topics": channel.stats()["subscribed"]})
+
         case "log":
+            if not msg_body.get("log_id"):
+                return
             add_log(
                 msg_body.get("log_id"),
                 msg_body.get("variables"),
@@ -0,0 +1,318 @@
+# metrics.py
+"""
+Lightweight metrics registry for the backend hot path.
+
+Counters, gauges and latency histograms, optionally labelled, exported as
+Prometheus text or JSON (GET /api/metrics). Values that already live
+somewhere else (queue depths, hub drop counters, link stats) are registered
+as callbacks and only read at scrape time, so they cost nothing per message.
+
+Histograms are HDR style: log-linear buckets (16 per power of two, ~6%
+relative error) over integer microseconds, recorded in O(1) with
+int.bit_length(), so percentiles come out of the same counts without
+keeping samples.
+
+With GCS_METRICS=0 in the environment the registry hands out no-op metrics;
+instrumented code keeps calling inc()/observe() on them at the cost of an
+empty method call.
+"""
+
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Union
+
+Labels = Tuple[str, ...]
+
+# Prometheus "le" bounds for histograms, in seconds
+EXPORT_BOUNDS_S = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                   2.5, 5.0, 10.0)
+
+_LINEAR = 32  # values below this get one bucket each
+_SUB = 16  # buckets per power of two above that
+_MAX_SHIFT = 40  # ~12 days in us; larger values land in the last bucket
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class Gauge:
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+
+class Histogram:
+    """Log-linear latency histogram over microseconds."""
+    __slots__ = ("counts", "count", "total_us", "max_us")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (_LINEAR + _MAX_SHIFT * _SUB)
+        self.count = 0
+        self.total_us = 0.0
+        self.max_us = 0.0
+
+    def observe(self, us: float) -> None:
+        v = int(us) if us > 0 else 0
+        if v < _LINEAR:
+            idx = v
+        else:
+            shift = v.bit_length() - 5
+            idx = _LINEAR + (shift - 1) * _SUB + (v >> shift) - _SUB if shift <= _MAX_SHIFT else len(self.counts) - 1
+        self.counts[idx] += 1
+        self.count += 1
+        self.total_us += us
+        if us > self.max_us:
+            self.max_us = us
+
+    def time(self) -> "_Timer":
+        """Context manager observing the wall time of its block."""
+        return _Timer(self)
+
+    @staticmethod
+    def bucket_upper(idx: int) -> int:
+        if idx < _LINEAR:
+            return idx + 1
+        shift, sub = divmod(idx - _LINEAR, _SUB)
+        return (sub + _SUB + 1) << (shift + 1)
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for idx, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return min(float(self.bucket_upper(idx)), self.max_us)
+        return self.max_us
+
+    def cumulative(self, bounds_us: Iterable[float]) -> List[int]:
+        """Number of observations at or below each bound (by bucket upper edge)."""
+        out = []
+        idx = seen = 0
+        for bound in bounds_us:
+            while idx < len(self.counts) and self.bucket_upper(idx) <= bound:
+                seen += self.counts[idx]
+                idx += 1
+            out.append(seen)
+        return out
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean_us": round(self.total_us / self.count, 2) if self.count else 0.0,
+            "p50_us": self.percentile(0.5),
+            "p90_us": self.percentile(0.9),
+            "p99_us": self.percentile(0.99),
+            "p999_us": self.percentile(0.999),
+            "max_us": round(self.max_us, 2),
+        }
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram) -> None:
+        self.histogram = histogram
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter_ns()
+
+    def __exit__(self, *exc) -> None:
+        self.histogram.observe((time.perf_counter_ns() - self.start) / 1000)
+
+
+class _Null:
+    """Stands in for every metric when metrics are disabled."""
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+    def dec(self, amount: float = 1) -> None:
+        pass
+
+    def set(self, value: float) -> None:
+        pass
+
+    def observe(self, us: float) -> None:
+        pass
+
+    def labels(self, *values: str) -> "_Null":
+        return self
+
+    def time(self) -> "_Timer":
+        return _Timer(self)
+
+
+NULL = _Null()
+
+_KINDS = {"counter": Counter, "gauge": Gauge, "histogram": Histogram}
+
+
+class Family:
+    """A metric with a fixed set of label names; one child per label values."""
+
+    def __init__(self, name: str, kind: str, help: str, labelnames: Labels = ()) -> None:
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.labelnames = labelnames
+        self._factory = _KINDS[kind]
+        self.children: Dict[Labels, Any] = {}
+        if not labelnames:
+            self._default = self.children[()] = self._factory()
+
+    def labels(self, *values: str):
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = self._factory()
+        return child
+
+    # unlabelled families forward to their single child
+    def inc(self, amount: float = 1) -> None:
+        self._default.inc(amount)
+
+    def set(self, value: float) -> None:
+        self._default.set(value)
+
+    def observe(self, us: float) -> None:
+        self._default.observe(us)
+
+    def time(self) -> _Timer:
+        return _Timer(self._default)
+
+    def samples(self) -> Dict[Labels, Any]:
+        return self.children
+
+
+class CallbackFamily:
+    """A counter or gauge whose values are read from `fn` at scrape time."""
+
+    def __init__(self, name: str, kind: str, help: str, fn: Callable[[], Union[float, Dict[Labels, float]]],
+                 labelnames: Labels = ()) -> None:
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.labelnames = labelnames
+        self.fn = fn
+
+    def samples(self) -> Dict[Labels, Any]:
+        value = self.fn()
+        return value if isinstance(value, dict) else {(): value}
+
+
+class MetricsRegistry:
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self.started = time.time()
+        self._families: Dict[str, Union[Family, CallbackFamily]] = {}
+
+    def _get(self, name: str, kind: str, help: str, labelnames: Iterable[str]):
+        if not self.enabled:
+            return NULL
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = Family(name, kind, help, tuple(labelnames))
+        return family
+
+    def counter(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        return self._get(name, "counter", help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        return self._get(name, "gauge", help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        """Latency histogram; observe() takes microseconds, exported in seconds."""
+        return self._get(name, "histogram", help, labelnames)
+
+    def callback(self, name: str, kind: str, help: str, fn: Callable[[], Union[float, Dict[Labels, float]]],
+                 labelnames: Iterable[str] = ()) -> None:
+        """Counter or gauge computed by `fn` when scraped; fn returns a value or {label values: value}."""
+        if self.enabled:
+            self._families[name] = CallbackFamily(name, kind, help, fn, tuple(labelnames))
+
+    def unregister(self, name: str) -> None:
+        self._families.pop(name, None)
+
+    # <editor-fold desc="export">
+
+    def prometheus(self) -> str:
+        lines: List[str] = []
+        for name, family in sorted(self._families.items()):
+            try:
+                samples = family.samples()
+            except Exception:
+                continue  # a callback whose source went away
+            if family.kind == "histogram":
+                lines.append(f"# HELP {name}_seconds {family.help}")
+                lines.append(f"# TYPE {name}_seconds histogram")
+                for values, hist in samples.items():
+                    base = _label_pairs(family.labelnames, values)
+                    counts = hist.cumulative(b * 1e6 for b in EXPORT_BOUNDS_S)
+                    for bound, n in zip(EXPORT_BOUNDS_S, counts):
+                        lines.append(f"{name}_seconds_bucket{_labels(base + [('le', repr(bound))])} {n}")
+                    lines.append(f"{name}_seconds_bucket{_labels(base + [('le', '+Inf')])} {hist.count}")
+                    lines.append(f"{name}_seconds_sum{_labels(base)} {hist.total_us / 1e6}")
+                    lines.append(f"{name}_seconds_count{_labels(base)} {hist.count}")
+            else:
+                lines.append(f"# HELP {name} {family.help}")
+                lines.append(f"# TYPE {name} {family.kind}")
+                for values, value in samples.items():
+                    if not isinstance(value, (int, float)):
+                        value = value.value
+                    lines.append(f"{name}{_labels(_label_pairs(family.labelnames, values))} {value}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for name, family in sorted(self._families.items()):
+            try:
+                samples = family.samples()
+            except Exception:
+                continue
+            values = []
+            for labels, value in samples.items():
+                if family.kind == "histogram":
+                    value = value.summary()
+                elif not isinstance(value, (int, float)):
+                    value = value.value
+                values.append({"labels": dict(zip(family.labelnames, labels)), "value": value})
+            out[name] = {"type": family.kind, "help": family.help, "values": values}
+        return out
+
+    # </editor-fold>
+
+
+def _label_pairs(names: Labels, values: Labels) -> List[Tuple[str, str]]:
+    return list(zip(names, values))
+
+
+def _labels(pairs: List[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{_escape(str(v))}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+REGISTRY = MetricsRegistry(enabled=os.environ.get("GCS_METRICS", "1") != "0")
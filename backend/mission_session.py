@@ -0,0 +1,194 @@
+"""
+mission_session.py
+
+Incremental re-planning for /api/mission/process.
+
+The session keeps the segments and per-segment samples of the last processed
+mission. A new waypoint list is diffed against the previous one (common
+prefix and suffix); turns are recomputed with plan_turn() from the first
+affected waypoint on, and once a recomputed turn lies within `tolerance_m` of
+the old one past the edited waypoints, the rest of the old path is reused,
+since every turn only depends on the one before it. Only the segments that
+changed are resampled.
+
+The change is reported as a patch over the previous flight path: replace
+`delete` points from index `start` with `points`. A client that sends the
+revision it holds as `base_revision` gets the patch instead of the full
+flight_path. A change of the first waypoint, loiter radius, speed or
+planner moves everything and rebuilds the whole path; so does every change
+with the dubins planner, which is fast enough to rebuild.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from process_mission import (PLANNERS, LineSeg, Segment, build_path_geometry, latlon_to_xy, path_points,
+                             plan_turn, process_mission, segment_samples, summarize_path, waypoints_to_xy,
+                             xy_to_latlon)
+
+Samples = Tuple[np.ndarray, np.ndarray, np.ndarray]  # lat, lon, alt of one segment, rounded
+
+
+class MissionSession:
+    def __init__(self, tolerance_m: float = 0.001, dt: float = 0.2) -> None:
+        self.tolerance_m = tolerance_m
+        self.dt = dt
+        self.revision = 0
+
+        self._params: Optional[Tuple[float, float, float, float]] = None  # lat0, lon0, loiter radius, speed
+        self._planner = "tangent"
+        self._waypoints: List[Tuple[float, float, float]] = []
+        self._xy: List[np.ndarray] = []
+        self.segments: List[Segment] = []
+        self._samples: List[Samples] = []
+        # full flight path of the last revision, first waypoint included
+        self._lat = self._lon = self._alt = np.empty(0)
+        self._summary: Optional[Dict[str, Any]] = None
+
+    def process(self, mission: Dict) -> Dict[str, Any]:
+        """process_mission() with reuse of the previous revision; see the module docstring."""
+        wps = mission.get("waypoints", [])
+        base_revision = mission.get("base_revision")
+        self.revision += 1
+
+        if len(wps) < 2:
+            self._params = None
+            self._summary = process_mission(mission)
+            self._lat, self._lon, self._alt = (np.array([p[key] for p in self._summary["flight_path"]], dtype=float)
+                                               for key in ("lat", "lon", "alt"))
+            return dict(self._summary, revision=self.revision)
+
+        cruise_kmh = mission.get("cruise_speed", 10.0)
+        params = (wps[0]["lat"], wps[0]["lon"], mission.get("loiter_radius", 30.0), cruise_kmh * 1000.0 / 3600.0)
+        waypoints = [(wp["lat"], wp["lon"], wp["alt"]) for wp in wps]
+
+        planner = mission.get("planner", "tangent")
+
+        patch = None
+        if (params == self._params and planner == self._planner == "tangent"
+                and len(self._waypoints) >= 3 and len(waypoints) >= 3):
+            patch = self._update(waypoints)
+        if patch is None:
+            self._planner = planner
+            self._rebuild(wps, waypoints, params)
+
+        result = summarize_path(mission, self._lat, self._lon, self._alt)
+        self._summary = result
+        result = dict(result, revision=self.revision)
+        if patch is not None and base_revision == self.revision - 1:
+            start, delete, samples, recomputed = patch
+            result["patch"] = {"base_revision": base_revision, "start": start, "delete": delete,
+                               "points": path_points(*_concat(samples)), "segments_recomputed": recomputed}
+            result["flight_path_length"] = len(self._lat)
+        else:
+            result["flight_path"] = path_points(self._lat, self._lon, self._alt)
+        return result
+
+    def full_result(self) -> Optional[Dict[str, Any]]:
+        """The last revision with its full flight path, or None before the first mission."""
+        if self._summary is None:
+            return None
+        return dict(self._summary, revision=self.revision, flight_path=path_points(self._lat, self._lon, self._alt))
+
+    # <editor-fold desc="planning">
+
+    def _rebuild(self, wps: List[Dict], waypoints: List[Tuple[float, float, float]],
+                 params: Tuple[float, float, float, float]) -> None:
+        lat0, lon0, loiter_radius, _ = params
+        self._params = params
+        self._waypoints = waypoints
+        self._xy = list(waypoints_to_xy(lat0, lon0, wps))
+        self.segments = PLANNERS.get(self._planner, build_path_geometry)(wps, loiter_radius)["segments"]
+        self._samples = self._sample(self.segments, 0, len(self.segments), None)
+        self._join()
+
+    def _update(self, waypoints: List[Tuple[float, float, float]]) -> Optional[Tuple[int, int, List[Samples], int]]:
+        """Re-plan after a waypoint edit; returns (start, delete, new samples, segments recomputed) or None to rebuild."""
+        lat0, lon0, loiter_radius, _ = self._params
+        old = self._waypoints
+        n_old, n_new = len(old), len(waypoints)
+
+        # common prefix and suffix; the waypoints in between were edited, added or removed
+        limit = min(n_old, n_new)
+        p = 0
+        while p < limit and old[p] == waypoints[p]:
+            p += 1
+        if p == n_old == n_new:
+            return self._path_offset(len(self.segments)), 0, [], 0
+        if p == 0:
+            return None
+        s = 0
+        while s < limit - p and old[n_old - 1 - s] == waypoints[n_new - 1 - s]:
+            s += 1
+
+        xy = (self._xy[:p] + [latlon_to_xy(lat0, lon0, lat, lon) for lat, lon, _ in waypoints[p:n_new - s]]
+              + self._xy[n_old - s:])
+
+        # turn j (at waypoint j, towards j + 1) is segments 2j - 1 and 2j; turns before p - 1 are unchanged
+        first = max(1, min(p - 1, n_new - 1))
+        if p == 1:
+            start = 0
+            segments = [LineSeg(start=xy[0], end=xy[1], alt=waypoints[0][2])]
+        else:
+            start = 2 * first - 1
+            segments = self.segments[:start]
+
+        shift = 2 * (n_old - n_new)  # old segment index - new segment index past the edit
+        converged = False
+        for j in range(first, n_new - 1):
+            arc, line = plan_turn(segments[-1], xy[j], xy[j + 1], waypoints[j][2], loiter_radius)
+            segments += [arc, line]
+            if j >= n_new - s:
+                old_arc, old_line = self.segments[2 * j - 1 + shift], self.segments[2 * j + shift]
+                if (arc.direction == old_arc.direction
+                        and np.hypot(*(arc.center - old_arc.center)) <= self.tolerance_m
+                        and np.hypot(*(line.start - old_line.start)) <= self.tolerance_m):
+                    converged = True
+                    break
+        end = len(segments)
+        if converged:
+            segments += self.segments[end + shift:]
+        old_end = end + shift if converged else len(self.segments)
+
+        # the segment after the recomputed ones starts at the new altitude, so it is resampled too
+        new_stop = min(end + 1, len(segments))
+        old_stop = min(old_end + 1, len(self.segments))
+        samples = self._sample(segments, start, new_stop, self.segments[start - 1].alt if start else None)
+
+        offset = self._path_offset(start)
+        delete = sum(len(lat) for lat, _, _ in self._samples[start:old_stop])
+        self._samples = self._samples[:start] + samples + self._samples[old_stop:]
+        self._waypoints = waypoints
+        self._xy = xy
+        self.segments = segments
+        self._join()
+        return offset, delete, samples, end - start
+
+    def _sample(self, segments: List[Segment], start: int, stop: int, prev_alt: Optional[float]) -> List[Samples]:
+        lat0, lon0, _, speed_mps = self._params
+        spacing = speed_mps * self.dt
+        out = []
+        for seg in segments[start:stop]:
+            x, y, alt = segment_samples(seg, seg.alt if prev_alt is None else prev_alt, spacing)
+            lat, lon = xy_to_latlon(lat0, lon0, x, y)
+            out.append((np.round(lat, 6), np.round(lon, 6), np.round(alt, 1)))
+            prev_alt = seg.alt
+        return out
+
+    def _path_offset(self, segment: int) -> int:
+        """Index in the flight path of the first sample of `segment` (the first waypoint is index 0)."""
+        return 1 + sum(len(lat) for lat, _, _ in self._samples[:segment])
+
+    def _join(self) -> None:
+        lat0, lon0, _ = self._waypoints[0]
+        first = ([round(lat0, 6)], [round(lon0, 6)], [round(self._waypoints[0][2], 1)])
+        self._lat, self._lon, self._alt = _concat([first] + self._samples)
+
+    # </editor-fold>
+
+
+def _concat(samples: List[Samples]) -> Samples:
+    if not samples:
+        return np.empty(0), np.empty(0), np.empty(0)
+    return tuple(np.concatenate([s[i] for s in samples]).astype(float) for i in range(3))
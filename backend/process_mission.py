@@ -8,10 +8,14 @@ a detailed flight path with metadata.
 """
 
 import math
-from typing import List, Dict, Union, NamedTuple
+from typing import List, Dict, Union, NamedTuple, Tuple
 import numpy as np
 import ast
 
+from dubins import FAMILIES, shortest_paths, waypoint_headings
+from geodesy import local_projection, track
+from geofence import check_fences, describe, parse_fences
+
 
 
 class LineSeg(NamedTuple):
@@ -50,31 +54,31 @@ Segment = Union[LineSeg, ArcSeg]
 def latlon_to_xy(lat0: float, lon0: float, lat: float, lon: float) -> np.ndarray:
     """
     Convert geographical coordinates (lat, lon) to local Cartesian (x, y)
-    using equirectangular projection around reference point (lat0, lon0).
+    in the transverse Mercator plane around reference point (lat0, lon0)
+    (see geodesy.LocalProjection).
     Returns:
-        numpy array [x, y] in meters.
+        numpy array [x, y] in meters (x east, y north).
     """
-    R = 6371000  # Earth radius in meters
-    dlat = math.radians(lat - lat0)
-    dlon = math.radians(lon - lon0)
-    x = R * dlon * math.cos(math.radians(lat0))  # East offset
-    y = R * dlat  # North offset
+    x, y = local_projection(lat0, lon0).forward(lat, lon)
     return np.array([x, y])
 
 
+def waypoints_to_xy(lat0: float, lon0: float, waypoints: List[Dict[str, float]]) -> np.ndarray:
+    """Local (x, y) of all waypoints at once, as an (n, 2) array."""
+    lat = np.array([wp["lat"] for wp in waypoints], dtype=float)
+    lon = np.array([wp["lon"] for wp in waypoints], dtype=float)
+    return np.column_stack(local_projection(lat0, lon0).forward(lat, lon))
+
+
 def xy_to_latlon(lat0: float, lon0: float, x: float, y: float) -> (float, float):
     """
     Convert local Cartesian coordinates (x, y) back to geographical
-    coordinates (lat, lon) using inverse equirectangular projection.
+    coordinates (lat, lon), inverse of latlon_to_xy.
+    x and y may be numpy arrays, converting many points at once.
     Returns:
         (lat, lon) tuple in degrees.
     """
-    R = 6371000
-    dlat = y / R
-    dlon = x / (R * math.cos(math.radians(lat0)))
-    lat = lat0 + math.degrees(dlat)
-    lon = lon0 + math.degrees(dlon)
-    return lat, lon
+    return local_projection(lat0, lon0).inverse(x, y)
 
 
 def angle_to(p: np.ndarray, q: np.ndarray) -> float:
@@ -96,6 +100,78 @@ def shortest(a: float, b: float) -> float:
     return diff
 
 
+def plan_turn(prev: Segment, P: np.ndarray, Q: np.ndarray, alt: float,
+              loiter_radius: float) -> Tuple[ArcSeg, LineSeg]:
+    """
+    Turn at waypoint P towards the next waypoint Q: the ArcSeg from P to the
+    tangent point and the LineSeg from there to Q (see build_path_geometry).
+    Only depends on the previous segment's direction, so a waypoint edit
+    affects the turns after it until they converge back to the old path.
+    """
+    # Determine direction vector of previous segment
+    if isinstance(prev, LineSeg):
+        A, B = prev.start, prev.end
+    else:
+        # Arc end point
+        theta = math.radians(prev.end_ang)
+        A = prev.center + prev.radius * np.array([math.cos(theta), math.sin(theta)])
+        B = P
+    dir_vec = (B - A) / np.linalg.norm(B - A)
+
+    # Compute circle center on the “toward Q” side, flipping if needed
+    normals = [np.array([-dir_vec[1], dir_vec[0]]), np.array([dir_vec[1], -dir_vec[0]])]
+    dists = [np.dot(Q - P, n) for n in normals]
+    side = 0 if dists[0] > dists[1] else 1
+    center = P + loiter_radius * normals[side]
+    flipped = False
+    if np.linalg.norm(Q - center) < loiter_radius:
+        side ^= 1
+        center = P + loiter_radius * normals[side]
+        flipped = True
+
+    # Compute tangent points from circle to Q
+    v = Q - center
+    d = np.linalg.norm(v)
+    alpha = math.acos(loiter_radius / d)
+    base_ang = math.atan2(v[1], v[0])
+    t1 = base_ang + alpha
+    t2 = base_ang - alpha
+    pts = [
+        center + loiter_radius * np.array([math.cos(t1), math.sin(t1)]),
+        center + loiter_radius * np.array([math.cos(t2), math.sin(t2)])
+    ]
+
+    # --- NEW: Angle‐based selection of tangent point ---
+    # For each candidate, get vector from P and compute its angle against dir_vec
+    angles = []
+    for pt in pts:
+        vec = (pt - P) / np.linalg.norm(pt - P)
+        # Clip dot to [-1,1] to avoid numerical issues
+        dot = max(-1.0, min(1.0, float(np.dot(dir_vec, vec))))
+        angles.append(math.degrees(math.acos(dot)))
+    # If not flipped, pick index with minimum angle; if flipped, pick maximum
+    idx = int(np.argmax(angles) if flipped else np.argmin(angles))
+    tangent_pt = pts[idx]
+
+    # Compute start/end angles and turning direction
+    start_ang = math.degrees(math.atan2(P[1] - center[1], P[0] - center[0])) % 360
+    end_ang = math.degrees(math.atan2(tangent_pt[1] - center[1], tangent_pt[0] - center[0])) % 360
+    # Determine CW vs CCW by cross product sign
+    cross = dir_vec[0] * (tangent_pt[1] - P[1]) - dir_vec[1] * (tangent_pt[0] - P[0])
+    direction = 1 if cross > 0 else -1
+
+    # The arc and final line segment
+    arc = ArcSeg(
+        center=center,
+        radius=loiter_radius,
+        start_ang=start_ang,
+        end_ang=end_ang,
+        direction=direction,
+        alt=alt
+    )
+    return arc, LineSeg(start=tangent_pt, end=Q, alt=alt)
+
+
 def build_path_geometry(waypoints: List[Dict[str, float]], loiter_radius: float) -> Dict[str, Union[float, List[Segment]]]:
     """
     Build a smooth flight path through a series of waypoints, using line segments
@@ -117,7 +193,7 @@ def build_path_geometry(waypoints: List[Dict[str, float]], loiter_radius: float)
     # Reference origin for lat/lon
     lat0, lon0 = waypoints[0]["lat"], waypoints[0]["lon"]
     # Convert all waypoints to local XY
-    xy = [latlon_to_xy(lat0, lon0, wp["lat"], wp["lon"]) for wp in waypoints]
+    xy = list(waypoints_to_xy(lat0, lon0, waypoints))
 
     segments: List[Segment] = []
     # 1) First straight leg
@@ -125,81 +201,143 @@ def build_path_geometry(waypoints: List[Dict[str, float]], loiter_radius: float)
 
     # 2) Iterate each interior waypoint
     for i in range(1, num_wp - 1):
-        P = xy[i]
-        Q = xy[i + 1]
-        alt = waypoints[i]["alt"]
-
-        # Determine direction vector of previous segment
-        prev = segments[-1]
-        if isinstance(prev, LineSeg):
-            A, B = prev.start, prev.end
-        else:
-            # Arc end point
-            theta = math.radians(prev.end_ang)
-            A = prev.center + prev.radius * np.array([math.cos(theta), math.sin(theta)])
-            B = P
-        dir_vec = (B - A) / np.linalg.norm(B - A)
-
-        # Compute circle center on the “toward Q” side, flipping if needed
-        normals = [np.array([-dir_vec[1], dir_vec[0]]), np.array([dir_vec[1], -dir_vec[0]])]
-        dists = [np.dot(Q - P, n) for n in normals]
-        side = 0 if dists[0] > dists[1] else 1
-        center = P + loiter_radius * normals[side]
-        flipped = False
-        if np.linalg.norm(Q - center) < loiter_radius:
-            side ^= 1
-            center = P + loiter_radius * normals[side]
-            flipped = True
-
-        # Compute tangent points from circle to Q
-        v = Q - center
-        d = np.linalg.norm(v)
-        alpha = math.acos(loiter_radius / d)
-        base_ang = math.atan2(v[1], v[0])
-        t1 = base_ang + alpha
-        t2 = base_ang - alpha
-        pts = [
-            center + loiter_radius * np.array([math.cos(t1), math.sin(t1)]),
-            center + loiter_radius * np.array([math.cos(t2), math.sin(t2)])
-        ]
-
-        # --- NEW: Angle‐based selection of tangent point ---
-        # For each candidate, get vector from P and compute its angle against dir_vec
-        angles = []
-        for pt in pts:
-            vec = (pt - P) / np.linalg.norm(pt - P)
-            # Clip dot to [-1,1] to avoid numerical issues
-            dot = max(-1.0, min(1.0, float(np.dot(dir_vec, vec))))
-            angles.append(math.degrees(math.acos(dot)))
-        # If not flipped, pick index with minimum angle; if flipped, pick maximum
-        idx = int(np.argmax(angles) if flipped else np.argmin(angles))
-        tangent_pt = pts[idx]
-
-        # Compute start/end angles and turning direction
-        start_ang = math.degrees(math.atan2(P[1] - center[1], P[0] - center[0])) % 360
-        end_ang = math.degrees(math.atan2(tangent_pt[1] - center[1], tangent_pt[0] - center[0])) % 360
-        # Determine CW vs CCW by cross product sign
-        cross = dir_vec[0] * (tangent_pt[1] - P[1]) - dir_vec[1] * (tangent_pt[0] - P[0])
-        direction = 1 if cross > 0 else -1
-
-        # Append the arc and final line segment
-        segments.append(ArcSeg(
-            center=center,
-            radius=loiter_radius,
-            start_ang=start_ang,
-            end_ang=end_ang,
-            direction=direction,
-            alt=alt
-        ))
-        segments.append(LineSeg(start=tangent_pt, end=Q, alt=alt))
+        segments.extend(plan_turn(segments[-1], xy[i], xy[i + 1], waypoints[i]["alt"], loiter_radius))
 
     return {"lat0": lat0, "lon0": lon0, "segments": segments}
 
-def sample_geometry(
+def build_dubins_geometry(waypoints: List[Dict[str, float]], loiter_radius: float) -> Dict[str, Union[float, List[Segment]]]:
+    """
+    Build the flight path as a chain of Dubins paths (see dubins.py): for
+    every leg the shortest combination of minimum-radius turns and straight
+    lines that leaves a waypoint with its heading and reaches the next one
+    with its heading. All legs are solved in one batch.
+
+    A waypoint may set 'heading' (degrees, 0 = north, clockwise) to be
+    flown through in that direction, and 'radius' (m) for the turns of the
+    leg starting at it; otherwise the heading bisects the adjacent legs and
+    the radius is loiter_radius. Every segment of a leg has the altitude of
+    the waypoint it ends at, so the climb happens over its first segment.
+    """
+    num_wp = len(waypoints)
+    if num_wp < 2:
+        raise ValueError("At least two waypoints are required.")
+
+    lat0, lon0 = waypoints[0]["lat"], waypoints[0]["lon"]
+    xy = waypoints_to_xy(lat0, lon0, waypoints)
+    given = np.array([math.radians(90 - wp["heading"]) if wp.get("heading") is not None else np.nan
+                      for wp in waypoints])
+    headings = waypoint_headings(xy[:, 0], xy[:, 1], given)
+    radius = np.array([wp.get("radius") or loiter_radius for wp in waypoints[:-1]], dtype=float)
+
+    family, params = shortest_paths(xy[:-1, 0], xy[:-1, 1], headings[:-1],
+                                    xy[1:, 0], xy[1:, 1], headings[1:], radius)
+
+    segments: List[Segment] = []
+    for i in range(num_wp - 1):
+        x, y = xy[i]
+        heading = headings[i]
+        r = radius[i]
+        alt = waypoints[i + 1]["alt"]
+        for kind, length in zip(FAMILIES[family[i]], params[i]):
+            if length < 1e-9:
+                continue
+            if kind == "S":
+                end = np.array([x + length * r * math.cos(heading), y + length * r * math.sin(heading)])
+                segments.append(LineSeg(start=np.array([x, y]), end=end, alt=alt))
+                x, y = end
+                continue
+            # turn around the center on the left (L, CCW) or right (R, CW) of the heading
+            direction = 1 if kind == "L" else -1
+            center = np.array([x - direction * r * math.sin(heading), y + direction * r * math.cos(heading)])
+            start_ang = math.atan2(y - center[1], x - center[0])
+            end_ang = start_ang + direction * length
+            segments.append(ArcSeg(
+                center=center,
+                radius=r,
+                start_ang=math.degrees(start_ang) % 360,
+                end_ang=math.degrees(end_ang) % 360,
+                direction=direction,
+                alt=alt
+            ))
+            x, y = center[0] + r * math.cos(end_ang), center[1] + r * math.sin(end_ang)
+            heading += direction * length
+
+    return {"lat0": lat0, "lon0": lon0, "segments": segments}
+
+
+# mission "planner" -> geometry builder
+PLANNERS = {"tangent": build_path_geometry, "dubins": build_dubins_geometry}
+
+
+def segment_samples(seg: Segment, start_alt: float, spacing: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Local x, y and altitude of the samples along one segment, ~spacing meters
+    apart, with altitude interpolated from start_alt to the segment's alt.
+    """
+    end_alt = seg.alt
+
+    if isinstance(seg, LineSeg):
+        vec = seg.end - seg.start
+        n_samples = max(1, int(np.linalg.norm(vec) / spacing))
+        frac = np.arange(1, n_samples + 1) / (n_samples + 1)
+        x = seg.start[0] + vec[0] * frac
+        y = seg.start[1] + vec[1] * frac
+
+    else:
+        raw_diff = (seg.end_ang - seg.start_ang + 360) % 360
+        ang_span = raw_diff if seg.direction > 0 else raw_diff - 360
+        arc_length = abs(math.radians(ang_span) * seg.radius)
+        n_samples = max(1, int(arc_length / spacing))
+        frac = np.arange(1, n_samples + 1) / (n_samples + 1)
+        rad = np.radians((seg.start_ang + seg.direction * frac * abs(ang_span)) % 360)
+        x = seg.center[0] + seg.radius * np.cos(rad)
+        y = seg.center[1] + seg.radius * np.sin(rad)
+
+    # Linear interpolation of altitude:
+    return x, y, start_alt + (end_alt - start_alt) * frac
+
+
+def sample_geometry_columns(
     geom: Dict[str, Union[float, List]],
     speed_mps: float,
     dt: float = 0.2
-) -> List[Dict[str, float]]:
+) -> Dict[str, np.ndarray]:
+    """
+    Vectorized sampler behind sample_geometry: all samples of a segment are
+    generated as numpy arrays in one go and converted to lat/lon together.
+    Returns:
+        dict of parallel arrays 'lat', 'lon' (rounded to 6 decimals) and
+        'alt' (rounded to 1 decimal).
+    """
+    lat0 = geom["lat0"]
+    lon0 = geom["lon0"]
+    spacing = speed_mps * dt  # desired meters between samples
+    xs: List[np.ndarray] = []
+    ys: List[np.ndarray] = []
+    alts: List[np.ndarray] = []
+
+    prev_alt = None
+
+    for seg in geom["segments"]:
+        x, y, alt = segment_samples(seg, seg.alt if prev_alt is None else prev_alt, spacing)
+        xs.append(x)
+        ys.append(y)
+        alts.append(alt)
+        prev_alt = seg.alt
+
+    if not xs:
+        return {"lat": np.empty(0), "lon": np.empty(0), "alt": np.empty(0)}
+
+    lat, lon = xy_to_latlon(lat0, lon0, np.concatenate(xs), np.concatenate(ys))
+    return {"lat": np.round(lat, 6), "lon": np.round(lon, 6), "alt": np.round(np.concatenate(alts), 1)}
+
+
+def sample_geometry(
+    geom: Dict[str, Union[float, List]],
+    speed_mps: float,
+    dt: float = 0.2,
+    columnar: bool = False
+) -> Union[List[Dict[str, float]], Dict[str, List[float]]]:
     """
     Sample the abstract geometry into discrete points based on speed and
     time delta, with a smooth altitude gradient between segments.
@@ -215,69 +353,18 @@ def sample_geometry(
                 - alt   (float): target altitude at the end of this segment
         speed_mps: Speed in meters per second.
         dt: Time interval per sample in seconds.
+        columnar: Return parallel 'lat', 'lon', 'alt' lists instead of one
+            dict per point.
     Returns:
         List of points with keys 'lat', 'lon', 'alt', sampled at intervals
         of ~speed_mps*dt meters along each segment, with altitude interpolated
         from the previous segment’s altitude to the current segment’s alt.
     """
-    lat0 = geom["lat0"]
-    lon0 = geom["lon0"]
-    spacing = speed_mps * dt  # desired meters between samples
-    out_points: List[Dict[str, float]] = []
-
-    prev_alt = None
-
-    for seg in geom["segments"]:
-        end_alt = seg.alt
-        # Determine the starting altitude for this segment:
-        if prev_alt is None:
-            start_alt = end_alt
-        else:
-            start_alt = prev_alt
-
-        # Compute number of samples along this segment:
-        if isinstance(seg, LineSeg):
-            # Straight‐line distance:
-            vec = seg.end - seg.start
-            length = np.linalg.norm(vec)
-            n_samples = max(1, int(length / spacing))
-
-            for i in range(1, n_samples + 1):
-                frac = i / (n_samples + 1)
-                point_xy = seg.start + vec * frac
-                lat, lon = xy_to_latlon(lat0, lon0, point_xy[0], point_xy[1])
-                # Linear interpolation of altitude:
-                alt = start_alt + (end_alt - start_alt) * frac
-                out_points.append({
-                    "lat": round(lat, 6),
-                    "lon": round(lon, 6),
-                    "alt": round(alt, 1)
-                })
-
-        else:
-            # Arc segment:
-            raw_diff = (seg.end_ang - seg.start_ang + 360) % 360
-            ang_span = raw_diff if seg.direction > 0 else raw_diff - 360
-            arc_length = abs(math.radians(ang_span) * seg.radius)
-            n_samples = max(1, int(arc_length / spacing))
-
-            for i in range(1, n_samples + 1):
-                frac = i / (n_samples + 1)
-                ang = seg.start_ang + seg.direction * frac * abs(ang_span)
-                ang %= 360
-                rad = math.radians(ang)
-                point_xy = seg.center + seg.radius * np.array([math.cos(rad), math.sin(rad)])
-                lat, lon = xy_to_latlon(lat0, lon0, point_xy[0], point_xy[1])
-                alt = start_alt + (end_alt - start_alt) * frac
-                out_points.append({
-                    "lat": round(lat, 6),
-                    "lon": round(lon, 6),
-                    "alt": round(alt, 1)
-                })
-
-        prev_alt = end_alt
-
-    return out_points
+    columns = sample_geometry_columns(geom, speed_mps, dt)
+    if columnar:
+        return {key: values.tolist() for key, values in columns.items()}
+    return [{"lat": lat, "lon": lon, "alt": alt}
+            for lat, lon, alt in zip(columns["lat"].tolist(), columns["lon"].tolist(), columns["alt"].tolist())]
 
 
 
@@ -326,9 +413,10 @@ def extract_callable_methods_from_file(code: str, filename: str):
     return logic_entries
 
 
-def validate_processed_mission(mission: Dict,result: List[Dict]) -> List[str]:
+def validate_processed_mission(mission: Dict, result: Dict[str, np.ndarray]) -> List[str]:
     """
-    Performs validation checks on the processed mission result.
+    Performs validation checks on the processed mission result (the sampled
+    path as lat/lon/alt columns).
     Returns a list of error messages if issues are detected.
     """
     errors = []
@@ -343,6 +431,9 @@ def validate_processed_mission(mission: Dict,result: List[Dict]) -> List[str]:
     if not isinstance(mission.get("cruise_speed", 10.0), (int, float)) or mission.get("cruise_speed", 10.0) <= 0:
         errors.append("Cruise speed must be a positive number.")
 
+    if mission.get("planner", "tangent") not in PLANNERS:
+        errors.append(f"Unknown planner {mission.get('planner')!r}; using tangent (choose from {', '.join(PLANNERS)}).")
+
     return errors
 
 
@@ -352,55 +443,94 @@ def process_mission(mission: Dict) -> Dict[str, Union[str, float, int, List]]:
     computes total distance and estimated time.
     Args:
         mission: dict with keys 'waypoints', optional 'cruise_speed' (km/h),
-                 optional 'loiter_radius' (m).
+                 optional 'loiter_radius' (m), optional 'planner'
+                 ('tangent' or 'dubins', see PLANNERS), optional
+                 'geofences' (see geofence.py).
     Returns:
         dict with status, waypoint_count, total_distance_km,
-        estimated_time_min, errors, and flight_path.
+        estimated_time_min, errors, flight_path and, with geofences,
+        geofence_violations.
     """
     wps = mission.get("waypoints", [])
     cruise_kmh = mission.get("cruise_speed", 10.0)
     loiter_radius = mission.get("loiter_radius", 30.0)
 
-    errors = []
-
     # Convert speed to m/s
     speed_mps = cruise_kmh * 1000.0 / 3600.0
 
     # Trivial case: fewer than 2 waypoints
     if len(wps) < 2:
         path = [{"lat": round(w["lat"], 6), "lon": round(w["lon"], 6), "alt": round(w.get("alt", 0), 1)} for w in wps]
-        return {"status": "processed", "waypoint_count": len(wps),
-                "total_distance_km": 0.0, "estimated_time_min": 0.0,
-                "errors": [], "flight_path": path}
+        fences, errors = parse_fences(mission)
+        trivial = {"status": "processed", "waypoint_count": len(wps),
+                   "total_distance_km": 0.0, "estimated_time_min": 0.0,
+                   "errors": errors, "flight_path": path}
+        if fences:
+            lat, lon, alt = (np.array([p[key] for p in path], dtype=float) for key in ("lat", "lon", "alt"))
+            trivial["geofence_violations"] = check_fences(fences, lat, lon, alt)
+            trivial["errors"] += [describe(v) for v in trivial["geofence_violations"]]
+        if mission.get("columnar"):
+            trivial["flight_path_columns"] = {key: [p[key] for p in path] for key in ("lat", "lon", "alt")}
+            trivial["flight_path_columns"].update(distance_km=[0.0] * len(path), eta_min=[0.0] * len(path))
+        return trivial
 
     # Build geometry and sample
-    geometry = build_path_geometry(wps, loiter_radius)
-    sampled = sample_geometry(geometry, speed_mps)
+    planner = PLANNERS.get(mission.get("planner", "tangent"), build_path_geometry)
+    geometry = planner(wps, loiter_radius)
+    columns = sample_geometry_columns(geometry, speed_mps)
 
     # Prepend exact first waypoint
     first_wp = wps[0]
-    flight_path = [{"lat": round(first_wp["lat"], 6), "lon": round(first_wp["lon"], 6),
-                    "alt": round(first_wp.get("alt", 0), 1)}] + sampled
-
-    # Compute total distance (approx.) in km
-    from math import sqrt
-    def dist3d(p1, p2):
-        dx = (p2["lat"] - p1["lat"]) * 111.32  # km per degree latitude
-        dy = (p2["lon"] - p1["lon"]) * 111.32  # km per degree longitude
-        dz = (p2["alt"] - p1["alt"]) / 1000.0  # convert meters to km
-        return sqrt(dx * dx + dy * dy + dz * dz)
-
-    total_km = sum(dist3d(a, b) for a, b in zip(flight_path, flight_path[1:]))
+    lat = np.concatenate(([round(first_wp["lat"], 6)], columns["lat"]))
+    lon = np.concatenate(([round(first_wp["lon"], 6)], columns["lon"]))
+    alt = np.concatenate(([round(first_wp.get("alt", 0), 1)], columns["alt"]))
+
+    result = summarize_path(mission, lat, lon, alt)
+    result["flight_path"] = path_points(lat, lon, alt)
+    return result
+
+
+def path_points(lat: np.ndarray, lon: np.ndarray, alt: np.ndarray) -> List[Dict[str, float]]:
+    """The flight path as one {'lat', 'lon', 'alt'} dict per point."""
+    return [{"lat": a, "lon": b, "alt": c} for a, b, c in zip(lat.tolist(), lon.tolist(), alt.tolist())]
+
+
+def summarize_path(mission: Dict, lat: np.ndarray, lon: np.ndarray, alt: np.ndarray) -> Dict[str, Union[str, float, int, List]]:
+    """
+    Everything process_mission reports besides the path itself: distance,
+    estimated time, validation errors and the logic found in logic_files.
+    lat, lon and alt are the full flight path, first waypoint included.
+    With mission["columnar"] the path is added as parallel lists, together
+    with the cumulative distance (km) and time (min) at every point.
+    """
+    cruise_kmh = mission.get("cruise_speed", 10.0)
+
+    # geodesic 3D distance and time along the path, see geodesy.track
+    along = track(lat, lon, alt, cruise_kmh / 3.6 if cruise_kmh > 0 else 0.0)
+    total_km = float(along["cumulative_m"][-1]) / 1000.0 if len(lat) else 0.0
     est_min = (total_km / cruise_kmh * 60.0) if cruise_kmh > 0 else 0.0
 
     available_logic = []
     for filename, code in mission.get("logic_files", {}).items():
         available_logic.extend(extract_callable_methods_from_file(code, filename))
 
-    return {"status": "processed",
-            "waypoint_count": len(wps),
-            "total_distance_km": round(total_km, 2),
-            "estimated_time_min": round(est_min, 1),
-            "errors": errors + validate_processed_mission(mission, sampled),
-            "flight_path": flight_path,
-            "available_logic": available_logic}
+    errors = validate_processed_mission(mission, {"lat": lat[1:], "lon": lon[1:], "alt": alt[1:]})
+    fences, fence_errors = parse_fences(mission)
+    violations = check_fences(fences, lat, lon, alt)
+    errors += fence_errors + [describe(v) for v in violations]
+
+    result = {"status": "processed",
+              "waypoint_count": len(mission.get("waypoints", [])),
+              "total_distance_km": round(total_km, 2),
+              "estimated_time_min": round(est_min, 1),
+              "errors": errors,
+              "available_logic": available_logic}
+    if fences:
+        # flight_path indices of every breaching point, per fence
+        result["geofence_violations"] = violations
+    # parallel lists, much cheaper to serialize and draw than one dict per point
+    if mission.get("columnar"):
+        result["flight_path_columns"] = {"lat": lat.tolist(), "lon": lon.tolist(), "alt": alt.tolist(),
+                                         "distance_km": np.round(along["cumulative_m"] / 1000.0, 4).tolist(),
+                                         "eta_min": np.round(along["eta_s"] / 60.0, 3).tolist()}
+    return result
@@ -0,0 +1,178 @@
+# replay_client.py
+"""
+Replay source with the PixHawkClient interface.
+
+Reads a MAVLink .tlog (8 byte big endian timestamp in us + frame, as written
+by mavproxy/mission planner and UavComms) or a flight recorder segment (see
+onboard/rpi/recorder.py) and feeds every message through the normal
+_process_message() / dispatcher path, so telemetry, logs, the telemetry
+store and WebSocket fan-out see exactly what a live Pixhawk would produce.
+
+speed is a multiple of real time; 0 replays as fast as possible, yielding
+to the event loop every `chunk` messages so clients are still served.
+Logs recorded in a segment are replayed through send_log as well.
+"""
+
+import asyncio
+import json
+import struct
+import time
+from pathlib import Path
+from typing import Any, Callable, Coroutine, Dict, Iterator, Optional, Sequence, Tuple, Union
+
+from pixhawk_client import PixHawkClient
+
+import _paths  # puts onboard/rpi on sys.path
+from recorder import MAGIC, REC_LOG, REC_MAVLINK, read_segment
+from wire import mavlink_v2
+
+# MAVLink v1/v2 start byte -> bytes around the payload (v2 adds 13 when signed)
+_OVERHEAD = {0xFE: 8, 0xFD: 12}
+
+
+def iter_tlog(path: Union[str, Path]) -> Iterator[Tuple[int, int, bytes]]:
+    """Yield (REC_MAVLINK, timestamp_us, frame) for every complete frame of a .tlog."""
+    data = Path(path).read_bytes()
+    pos, end = 0, len(data)
+    while pos + 10 <= end:
+        (timestamp_us,) = struct.unpack_from(">Q", data, pos)
+        start = data[pos + 8]
+        if start not in _OVERHEAD:
+            pos += 1  # lost sync; scan for the next record
+            continue
+        size = data[pos + 9] + _OVERHEAD[start]
+        if start == 0xFD and pos + 11 <= end and data[pos + 10] & 0x01:
+            size += 13  # signature
+        if pos + 8 + size > end:
+            return
+        yield REC_MAVLINK, timestamp_us, data[pos + 8:pos + 8 + size]
+        pos += 8 + size
+
+
+def iter_records(path: Union[str, Path]) -> Iterator[Tuple[int, int, bytes]]:
+    """Records of a recorder segment or a .tlog, told apart by the segment magic."""
+    with open(path, "rb") as f:
+        magic = f.read(len(MAGIC))
+    return read_segment(path) if magic == MAGIC else iter_tlog(path)
+
+
+class ReplayClient(PixHawkClient):
+    def __init__(
+            self,
+            path: Union[str, Path],
+            send_log: Callable[..., Coroutine[Any, Any, None]],
+            send_msg: Callable[[Dict[str, Any]], Coroutine[Any, Any, None]],
+            speed: float = 1.0,
+            loop: bool = False,
+            chunk: int = 256,
+    ) -> None:
+        super().__init__(device=str(path), baud=0, send_log=send_log, send_msg=send_msg)
+        self.path = Path(path)
+        self.speed = speed
+        self.loop = loop
+        self.chunk = chunk
+        self._mav = None
+
+        self.messages = 0
+        self.logs = 0
+        self.bad_frames = 0
+        self.passes = 0
+        self.max_lag_ms = 0.0
+        self._started = 0.0
+
+    async def mainloop(self) -> None:
+        try:
+            await self._connect()
+            self._tasks.append(asyncio.create_task(self._reader_loop()))
+            await self._stop.wait()
+        except asyncio.CancelledError:
+            pass
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            await self._shutdown()
+
+    async def _connect(self) -> None:
+        self._mav = mavlink_v2().MAVLink(None)
+        self._mav.robust_parsing = True
+        self.state["connected"] = True
+        self._started = time.monotonic()
+        self._log("PX0104", {"path": str(self.path), "speed": f"{self.speed}x" if self.speed > 0 else "max"})
+
+    async def _reader_loop(self) -> None:
+        while True:
+            self.passes += 1
+            await self._replay_once()
+            if not self.loop:
+                break
+        self._log("PX0105", {"path": str(self.path), "messages": self.messages,
+                             "duration": round(time.monotonic() - self._started, 2)})
+
+    async def _replay_once(self) -> None:
+        clock = asyncio.get_running_loop()
+        first_ts: Optional[int] = None
+        wall_start = clock.time()
+        since_yield = 0
+
+        for kind, timestamp_us, payload in iter_records(self.path):
+            if self.speed > 0:
+                if first_ts is None:
+                    first_ts = timestamp_us
+                due = wall_start + (timestamp_us - first_ts) / 1e6 / self.speed
+                delay = due - clock.time()
+                if delay > 0.001:
+                    await asyncio.sleep(delay)
+                    since_yield = 0
+                elif delay < 0:
+                    self.max_lag_ms = max(self.max_lag_ms, -delay * 1000)
+            since_yield += 1
+            if since_yield >= self.chunk:
+                await asyncio.sleep(0)
+                since_yield = 0
+
+            if kind == REC_MAVLINK:
+                for msg in self._mav.parse_buffer(payload) or ():
+                    if msg.get_type() == "BAD_DATA":
+                        self.bad_frames += 1
+                        continue
+                    self.messages += 1
+                    await self._process_message(msg)
+            elif kind == REC_LOG:
+                record = json.loads(payload)
+                self.logs += 1
+                await self.send_log(log_id=record["log_id"], variables=record["variables"])
+
+    # nothing to talk to: commands and stream rates are dropped
+
+    async def send_command(self,
+                           command: Union[int, str],
+                           params: Sequence[Union[float, int, str]] = (),
+                           timeout: float = 3.0,
+                           frame: Optional[Union[int, str]] = None
+                           ) -> str:
+        self._log("PX1105", {"command": command})
+        return "MAV_RESULT_UNSUPPORTED"
+
+    def request_rate(self, stream: str, rate: int) -> None:
+        pass
+
+    async def fetch_param(self):
+        pass
+
+    async def _shutdown(self) -> None:
+        self._log("PX0004")
+        await asyncio.sleep(0.1)
+
+    def stats(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self._started if self._started else 0.0
+        return {
+            "path": str(self.path),
+            "speed": self.speed,
+            "passes": self.passes,
+            "messages": self.messages,
+            "messages_per_s": round(self.messages / elapsed, 1) if elapsed else 0.0,
+            "logs": self.logs,
+            "bad_frames": self.bad_frames,
+            "max_lag_ms": round(self.max_lag_ms, 2),
+        }
@@ -0,0 +1,276 @@
+"""
+telemetry_store.py
+
+Columnar, fixed-capacity ring buffers for MAVLink telemetry history.
+
+Every message type (ATTITUDE, GLOBAL_POSITION_INT, VFR_HUD, ...) gets its own
+ring of preallocated NumPy columns plus a monotonic int64 timestamp column
+(nanoseconds, same clock as the log timestamps). Because timestamps are
+non-decreasing, a time-range query is a binary search plus a slice, and the
+result can be projected and downsampled before it is turned into lists for
+JSON.
+
+Memory is bounded in bytes, not rows: the store has a total budget that is
+split evenly between the message types seen so far (or fixed per type), and
+each ring holds as many rows as its share allows for its number of columns.
+When a new type arrives, the other rings shrink to their smaller share,
+dropping their oldest rows.
+"""
+
+import math
+import time
+from typing import Dict, Any, Optional, Iterable, List
+
+import numpy as np
+
+# whole store; e.g. ~15 streamed types of ~10 fields get ~4.5 MB each, about 1.5 hours at 50 Hz
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# Columns start small and double until they reach the capacity, so quiet
+# streams never pay for their whole share.
+INITIAL_ROWS = 1024
+
+AGGREGATES = ("min", "max", "mean")
+
+
+class RingBuffer:
+    """
+    Columnar ring for a single message type, bounded to max_bytes.
+
+    Numeric fields become float64 columns on first sight (exact for scaled
+    lat/lon and microsecond timestamps). Missing values are NaN. Non-numeric
+    fields (strings, arrays, bytes) are not stored. The row capacity follows
+    from max_bytes and the number of columns, and drops if columns are added.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        if max_bytes < 1:
+            raise ValueError("max_bytes must be positive")
+        self.max_bytes = max_bytes
+        self.columns: Dict[str, np.ndarray] = {}
+        self._rows = min(INITIAL_ROWS, self.capacity)
+        self.timestamps = np.zeros(self._rows, dtype=np.int64)
+        self._next = 0  # physical index of the next write
+        self._size = 0
+        self._last_ts = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def nbytes(self) -> int:
+        return self.timestamps.nbytes + sum(col.nbytes for col in self.columns.values())
+
+    @property
+    def row_bytes(self) -> int:
+        # int64 timestamp plus one float64 per column
+        return 8 * (1 + len(self.columns))
+
+    @property
+    def capacity(self) -> int:
+        """Rows that fit in max_bytes with the current columns (at least one)."""
+        return max(1, self.max_bytes // self.row_bytes)
+
+    def set_max_bytes(self, max_bytes: int) -> None:
+        """Change the budget; shrinks right away (dropping the oldest rows) if it no longer fits."""
+        self.max_bytes = max_bytes
+        if self._rows > self.capacity:
+            self._resize(self.capacity)
+
+    def append(self, timestamp: int, fields: Dict[str, Any]) -> None:
+        # keep the timestamp column sorted even if the wall clock steps back
+        if timestamp < self._last_ts:
+            timestamp = self._last_ts
+        self._last_ts = timestamp
+
+        if self._size == self._rows and self._rows < self.capacity:
+            self._resize(min(self._rows * 2, self.capacity))
+
+        added = False
+        for key, val in fields.items():
+            if key not in self.columns and isinstance(val, (int, float)):
+                self.columns[key] = np.full(self._rows, np.nan)
+                added = True
+        if added and self._rows > self.capacity:
+            # wider rows: fewer of them fit the budget
+            self._resize(self.capacity)
+
+        i = self._next
+        self.timestamps[i] = timestamp
+
+        for key, col in self.columns.items():
+            val = fields.get(key)
+            col[i] = val if isinstance(val, (int, float)) else np.nan
+
+        self._next = (i + 1) % self._rows
+        self._size = min(self._size + 1, self._rows)
+
+    def _resize(self, rows: int) -> None:
+        """Reallocate to `rows` rows, keeping the newest ones in order from index 0."""
+        keep = min(self._size, rows)
+        first = self._size - keep
+        ts = np.zeros(rows, dtype=np.int64)
+        ts[:keep] = self._slice(self.timestamps, first, self._size)
+        columns = {}
+        for key, col in self.columns.items():
+            columns[key] = np.full(rows, np.nan)
+            columns[key][:keep] = self._slice(col, first, self._size)
+        self.timestamps, self.columns = ts, columns
+        self._rows = rows
+        self._size = keep
+        self._next = keep % rows
+
+    def _head(self) -> int:
+        """Physical index of the oldest row."""
+        return (self._next - self._size) % self._rows
+
+    def _locate(self, t: int, side: str) -> int:
+        """Binary search for t over the logical (oldest-first) order."""
+        head = self._head()
+        if head + self._size <= self._rows:
+            return int(np.searchsorted(self.timestamps[head:head + self._size], t, side=side))
+        older = self.timestamps[head:]
+        if t < older[-1] or (side == "left" and t == older[-1]):
+            return int(np.searchsorted(older, t, side=side))
+        return len(older) + int(np.searchsorted(self.timestamps[:self._next], t, side=side))
+
+    def _slice(self, col: np.ndarray, i: int, j: int) -> np.ndarray:
+        """Logical rows [i, j) of a column; copies only when the range wraps."""
+        a = (self._head() + i) % self._rows
+        n = j - i
+        if a + n <= self._rows:
+            return col[a:a + n]
+        return np.concatenate((col[a:], col[:a + n - self._rows]))
+
+    def query(
+            self,
+            start: Optional[int] = None,
+            end: Optional[int] = None,
+            fields: Optional[Iterable[str]] = None,
+            every: int = 1,
+            bucket_ns: Optional[int] = None,
+            agg: Optional[str] = None,
+            max_points: Optional[int] = None,
+    ) -> Dict[str, List[Any]]:
+        """
+        Return rows with start <= timestamp <= end as parallel lists.
+
+        Args:
+            start, end: Inclusive bounds in ns; None means open-ended.
+            fields: Columns to project; None returns every column.
+            every: Keep every Nth row, or aggregate groups of N rows with `agg`.
+            bucket_ns: Group rows into fixed time buckets instead of counts.
+            agg: "min", "max" or "mean" per group; without it the first row
+                of each group is returned.
+            max_points: Upper bound on returned rows; raises `every` as needed.
+        Returns:
+            dict with "timestamp" plus one list per projected field. NaN
+            (field missing from that message) is returned as None.
+        """
+        if agg is not None and agg not in AGGREGATES:
+            raise ValueError(f"Unknown aggregate: {agg}")
+        if every < 1:
+            raise ValueError("every must be >= 1")
+
+        names = list(self.columns) if fields is None else [f for f in fields if f in self.columns]
+
+        i = 0 if start is None else self._locate(start, "left")
+        j = self._size if end is None else self._locate(end, "right")
+        j = max(i, j)
+
+        ts = self._slice(self.timestamps, i, j)
+        cols = {name: self._slice(self.columns[name], i, j) for name in names}
+        n = len(ts)
+
+        if max_points and bucket_ns is None and n > max_points:
+            every = max(every, math.ceil(n / max_points))
+
+        if bucket_ns is not None and n:
+            if bucket_ns <= 0:
+                raise ValueError("bucket must be positive")
+            ids = (ts - ts[0]) // bucket_ns
+            starts = np.concatenate(([0], np.flatnonzero(np.diff(ids)) + 1))
+        elif every > 1:
+            starts = np.arange(0, n, every)
+        else:
+            starts = None
+
+        if starts is not None:
+            ts = ts[starts]
+            if agg is None:
+                cols = {name: col[starts] for name, col in cols.items()}
+            else:
+                cols = {name: _reduce(col, starts, agg) for name, col in cols.items()}
+
+        out: Dict[str, List[Any]] = {"timestamp": ts.tolist()}
+        for name, col in cols.items():
+            nan = np.isnan(col)
+            out[name] = np.where(nan, None, col).tolist() if nan.any() else col.tolist()
+        return out
+
+
+def _reduce(col: np.ndarray, starts: np.ndarray, agg: str) -> np.ndarray:
+    """NaN-ignoring reduction of consecutive groups beginning at `starts`."""
+    if agg == "min":
+        return np.fmin.reduceat(col, starts)
+    if agg == "max":
+        return np.fmax.reduceat(col, starts)
+    valid = ~np.isnan(col)
+    total = np.add.reduceat(np.where(valid, col, 0), starts)
+    count = np.add.reduceat(valid, starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return total / count
+
+
+class TelemetryStore:
+    """
+    Per-message-type collection of RingBuffers within one byte budget.
+
+    Args:
+        max_bytes: Budget of the whole store.
+        budgets: Optional fixed per-type budgets in bytes, e.g. {"ATTITUDE": 16 << 20};
+            they are taken out of max_bytes and the rest is split evenly between the other types.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, budgets: Optional[Dict[str, int]] = None) -> None:
+        self.budgets = budgets or {}
+        self.max_bytes = max_bytes
+        if sum(self.budgets.values()) > max_bytes:
+            raise ValueError("per-type budgets exceed max_bytes")
+        self.streams: Dict[str, RingBuffer] = {}
+
+    def append(self, msg_type: str, fields: Dict[str, Any], timestamp: Optional[int] = None) -> None:
+        ring = self.streams.get(msg_type)
+        if ring is None:
+            # starts at INITIAL_ROWS; _rebalance() then gives it (and the others) their share
+            ring = self.streams[msg_type] = RingBuffer(self.budgets.get(msg_type, self.max_bytes))
+            self._rebalance()
+        ring.append(timestamp if timestamp is not None else time.time_ns(), fields)
+
+    def _share(self) -> int:
+        """Budget of each message type without a fixed one."""
+        shared = [name for name in self.streams if name not in self.budgets]
+        return (self.max_bytes - sum(self.budgets.values())) // max(1, len(shared))
+
+    def _rebalance(self) -> None:
+        share = self._share()
+        for name, ring in self.streams.items():
+            if name not in self.budgets:
+                ring.set_max_bytes(share)
+
+    def types(self) -> List[str]:
+        return sorted(self.streams)
+
+    def query(self, msg_type: str, **kwargs) -> Dict[str, List[Any]]:
+        ring = self.streams.get(msg_type)
+        if ring is None:
+            raise KeyError(msg_type)
+        return ring.query(**kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        """Memory bound and use of the store, and rows, capacity and bytes per message type."""
+        return {
+            "max_bytes": self.max_bytes,
+            "bytes": sum(ring.nbytes for ring in self.streams.values()),
+            "types": {name: {"rows": len(ring), "capacity": ring.capacity, "bytes": ring.nbytes,
+                             "max_bytes": ring.max_bytes} for name, ring in sorted(self.streams.items())},
+        }
@@ -1,24 +1,52 @@
 import asyncio
+import itertools
 import json
 import logging
+import struct
 import time
 from collections import defaultdict
 from pathlib import Path
 import websockets
 
+import _paths  # puts onboard/rpi on sys.path
+from delta import DeltaDecoder
+from wire import FRAME_BATCH, FRAME_MAVLINK, TELEMETRY_TYPES, LinkStats, MavStructCodec, choose_codec, mavlink_v2, \
+    unpack_batch
+
+from metrics import REGISTRY
+
+MESSAGES = REGISTRY.counter("gcs_mavlink_messages_total", "MAVLink messages received, by type", ["type"])
+COMMAND_RTT = REGISTRY.histogram("gcs_command_ack_rtt", "Time from sending a command to its COMMAND_ACK")
+
 
 class UavComms:
-    def __init__(self, host: str = "0.0.0.0", port: int = 55052):
+    def __init__(self, host: str = "0.0.0.0", port: int = 55052, tlog_path: str | None = None):
         self.host = host
         self.port = port
         self._stop = asyncio.Event()
         self.websocket = None
         self.state = defaultdict(dict)
-        self.logs = []
         self.params = None
         self.data = None
         self.log_callback = None
         self.telem_callback = None
+        self.telemetry_store = None
+        self.delta = DeltaDecoder()
+        self.mavstruct = MavStructCodec()
+        # raw MAVLink passthrough from the Pi
+        self.mav_parser = mavlink_v2().MAVLink(None)
+        self.mav_parser.robust_parsing = True
+        # bit-exact copy of passthrough frames in .tlog format (µs timestamp + frame)
+        self.tlog_path = tlog_path
+        self._tlog = None
+        # frames vs. messages received from the Pi
+        self.link_stats = LinkStats()
+        # last sequence number received per Pi stream, for resuming after a reconnect
+        self.stream: str | None = None
+        self.last_seq: dict[str, int] = {}
+        # command id -> (future, time sent), completed by the Pi's command_response
+        self._commands: dict[int, tuple[asyncio.Future, float]] = {}
+        self._command_ids = itertools.count(1)
 
     async def mainloop(self):
         # Load log template
@@ -40,6 +68,9 @@ class UavComms:
     async def _accept_once(self, websocket):
         """Accept a client, then block on messages until it disconnects."""
         self.websocket = websocket
+        self.stream = None
+        self.mav_parser.buf = bytearray()
+        self.mav_parser.buf_index = 0
         client = websocket.remote_address
         self._log_task("NW0101", {"ip": str(client[0])})
 
@@ -48,7 +79,7 @@ class UavComms:
         try:
             while True:
                 raw = await websocket.recv()  # blocking wait
-                await self._handle_message(raw)
+                await self._handle_frame(raw)
         except websockets.exceptions.ConnectionClosed:
             self._log_task("NW1100", {"ip": str(client[0])})
         except Exception as e:
@@ -56,10 +87,48 @@ class UavComms:
         finally:
             self.websocket = None
 
-    async def _handle_message(self, raw: str):
+    async def _handle_frame(self, raw: str | bytes):
+        """One WebSocket frame from the Pi: a single message, a batch of them, or raw MAVLink."""
+        kind = raw[0] if isinstance(raw, bytes) and raw else None
+        if kind == FRAME_BATCH:
+            try:
+                seq, items = unpack_batch(raw)
+            except Exception as e:
+                self._log_task("NW2100", {"location": "unpacking batch", "e": repr(e), "message": len(raw)})
+                return
+            self.link_stats.record(len(items), len(raw))
+            if seq and self.stream:
+                items = self._check_sequence(seq, items)
+            for item in items:
+                await self._handle_message(item)
+        elif kind == FRAME_MAVLINK:
+            self.link_stats.record(await self._handle_mavlink(raw[1:]), len(raw))
+        else:
+            self.link_stats.record(1, len(raw))
+            await self._handle_message(raw)
+
+    def _check_sequence(self, seq: int, items: list) -> list:
+        """Track the stream position; drops items already seen and reports holes."""
+        last = self.last_seq.get(self.stream)
+        if last is not None:
+            if seq <= last:
+                items = items[last + 1 - seq:]  # retransmitted overlap
+                seq = last + 1
+            elif seq > last + 1:
+                self._log_task("NW1101", {"first": last + 1, "last": seq - 1, "ip": str(self.websocket.remote_address[0])})
+        if items:
+            self.last_seq[self.stream] = seq + len(items) - 1
+        return items
+
+    async def _handle_message(self, raw: str | bytes):
+        if isinstance(raw, bytes) and raw[:1] == bytes((FRAME_MAVLINK,)):
+            await self._handle_mavlink(raw[1:])
+            return
+
         msg = None
         try:
-            msg = json.loads(raw)
+            # binary frames are mavstruct telemetry or change records, text frames are JSON
+            msg = self.mavstruct.decode(raw) if isinstance(raw, bytes) else json.loads(raw)
             assert isinstance(msg, dict)
             assert "type" in msg
 
@@ -87,6 +156,21 @@ class UavComms:
             case "pong":
                 pass  # acknowledge pong, no-op
 
+            case "hello":
+                codec = choose_codec(msg_body.get("codecs", []))
+                self._log_task("NW0103", {"ip": str(self.websocket.remote_address[0]), "codec": codec})
+                # batch frames are understood here, so accept them whenever the Pi offers
+                reply = {"codec": codec, "batch": bool(msg_body.get("batch"))}
+                resume = msg_body.get("resume")
+                last_seq = None
+                if isinstance(resume, dict) and resume.get("stream"):
+                    self.stream = resume["stream"]
+                    last_seq = self.last_seq.get(self.stream)
+                    reply["resume"] = {"last_seq": last_seq}
+                if last_seq is None:
+                    self.delta.reset()  # new stream; resumed ones continue where they left off
+                await self.send({"type": "codec", "msg": reply})
+
             case "Log":
                 self._log_task(
                     log_id=msg.get("log_id", "XE9999"),
@@ -98,18 +182,43 @@ class UavComms:
                 pkt = msg["msg"]
                 pkt_type = pkt.pop("mavpackettype", None)
                 if pkt_type:
-                    await self.telem_callback({
-                        "type": "telemetry",
-                        "data": {pkt_type: pkt}
-                    })
+                    await self._on_telemetry(pkt_type, pkt)
+
+            case "telemetry_delta":
+                pkt = self.delta.decode(msg_body)
+                if pkt is not None:
+                    await self._on_telemetry(msg_body["t"], pkt)
+                streams = self.delta.pop_resync()
+                if streams:
+                    await self.send({"type": "resync", "msg": {"streams": streams}})
+
+            case "snapshot":
+                # compacted state covering messages the Pi could no longer replay
+                for pkt_type, pkt in msg_body["state"].items():
+                    self.state[pkt_type].update(pkt)
+                    await self.telem_callback({"type": "telemetry", "data": {pkt_type: pkt}})
 
             case "changelog_batch":
-                pass
+                # {msg_type: [[timestamp_ms, {field: value}], ...]}, see onboard/rpi/changelog.py;
+                # these types arrive only this way, so pass the merged state on as telemetry
+                for msg_type, rows in msg_body.items():
+                    state = self.state[msg_type]
+                    for _, changes in rows:
+                        state.update(changes)
+                    await self._on_telemetry(msg_type, dict(state))
 
             case "params":
                 self.params = msg_body
 
             case "command_response":
+                pending = self._commands.get(msg_body.get("id")) if isinstance(msg_body, dict) else None
+                if pending is not None:
+                    fut, sent = pending
+                    COMMAND_RTT.observe((time.monotonic() - sent) * 1e6)
+                    if not fut.done() and "error" in msg_body:
+                        fut.set_exception(RuntimeError(msg_body["error"]))
+                    elif not fut.done():
+                        fut.set_result(msg_body.get("result"))
                 print(f"command response: {msg}")
 
             case "requested_telemetry":
@@ -128,6 +237,67 @@ class UavComms:
                     "message": msg_body
                 })
 
+    async def _handle_mavlink(self, frames: bytes) -> int:
+        """Parse a batch of raw MAVLink frames forwarded by the Pi; returns the number of messages."""
+        try:
+            msgs = self.mav_parser.parse_buffer(frames) or []
+        except Exception as e:
+            self._log_task("NW2100", {"location": "parsing MAVLink batch", "e": repr(e), "message": len(frames)})
+            return 0
+
+        for m in msgs:
+            pkt_type = m.get_type()
+            if pkt_type == "BAD_DATA":
+                continue
+            if self.tlog_path:
+                self._write_tlog(m.get_msgbuf())
+            if pkt_type in TELEMETRY_TYPES:
+                pkt = m.to_dict()
+                pkt.pop("mavpackettype", None)
+                await self._on_telemetry(pkt_type, pkt)
+        return len(msgs)
+
+    def _write_tlog(self, frame: bytes):
+        try:
+            if self._tlog is None:
+                self._tlog = open(self.tlog_path, "ab")
+            self._tlog.write(struct.pack(">Q", time.time_ns() // 1000) + bytes(frame))
+        except OSError as e:
+            self._log_task("NW2100", {"location": "writing tlog", "e": repr(e), "message": self.tlog_path})
+            self.tlog_path = None
+
+    async def _on_telemetry(self, pkt_type: str, pkt: dict):
+        MESSAGES.labels(pkt_type).inc()
+        if self.telemetry_store is not None:
+            self.telemetry_store.append(pkt_type, pkt)
+        await self.telem_callback({
+            "type": "telemetry",
+            "data": {pkt_type: pkt}
+        })
+
+    async def send_command(self, command: int | str, params=(), timeout: float = 3.0, frame: int | str | None = None) -> str:
+        """
+        Have the Pi send a command to the Pixhawk and return the MAV_RESULT name.
+        Commands carry an id, so any number can be in flight; the Pi retries
+        within `timeout`.
+        """
+        if not self.websocket:
+            raise ConnectionError("Pi is not connected")
+        command_id = next(self._command_ids)
+        fut = asyncio.get_running_loop().create_future()
+        self._commands[command_id] = (fut, time.monotonic())
+        body = {"id": command_id, "command": command, "params": list(params or ()), "timeout": timeout}
+        if frame is not None:
+            body["frame"] = frame
+        try:
+            await self.send({"type": "command", "msg": body})
+            # allow for the link in both directions on top of the Pi's own timeout
+            return await asyncio.wait_for(fut, timeout + 2.0)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"No response from the Pi for command {command}")
+        finally:
+            self._commands.pop(command_id, None)
+
     async def send(self, msg: dict):
         """Send a message to the connected client."""
         try:
@@ -197,6 +367,9 @@ class UavComms:
     async def stop(self):
         """Signal the server to stop."""
         self._stop.set()
+        if self._tlog is not None:
+            self._tlog.close()
+            self._tlog = None
 
 
 def run_server():
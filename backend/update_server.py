@@ -3,14 +3,17 @@ import os
 import json
 import logging
 import hashlib
+import tempfile
 from http.server import BaseHTTPRequestHandler, HTTPServer
 from threading import Thread
 
 
 class UAVServer:
-    def __init__(self, port=55051, base_dir="onboard/rpi"):
+    def __init__(self, port=55051, base_dir="onboard/rpi", recordings_dir="recordings"):
         self.port = port
         self.base_dir = os.path.abspath(base_dir)
+        # flight recorder segments uploaded by the Pi (PUT /recordings/<name>)
+        self.recordings_dir = os.path.abspath(recordings_dir)
 
         # set up a dedicated logger (console only)
         self.logger = logging.getLogger(f"UpdateServer:{port}")
@@ -28,6 +31,7 @@ class UAVServer:
 
     def _make_handler(self):
         base_dir = self.base_dir
+        recordings_dir = self.recordings_dir
         logger = self.logger
 
         class CustomHandler(BaseHTTPRequestHandler):
@@ -105,6 +109,35 @@ class UAVServer:
                 self.end_headers()
                 logger.warning(f"Path not found: {self.path} from {client_ip}")
 
+            def do_PUT(self):
+                client_ip = self.client_address[0]
+                name = self.path[len("/recordings/"):] if self.path.startswith("/recordings/") else ""
+
+                # only plain segment file names, nothing that could leave recordings_dir
+                if not name.endswith(".seg") or os.path.basename(name) != name or name.startswith("."):
+                    self.send_response(404)
+                    self.end_headers()
+                    logger.warning(f"Rejected upload to {self.path} from {client_ip}")
+                    return
+
+                length = int(self.headers.get("Content-Length", 0))
+                data = self.rfile.read(length)
+                expected = self.headers.get("X-Content-SHA256")
+                if len(data) != length or (expected and hashlib.sha256(data).hexdigest() != expected):
+                    self.send_response(400)
+                    self.end_headers()
+                    logger.warning(f"Corrupt upload of {name} from {client_ip}")
+                    return
+
+                os.makedirs(recordings_dir, exist_ok=True)
+                # atomic replace, a half written segment never shows up under its name
+                with tempfile.NamedTemporaryFile(dir=recordings_dir, delete=False) as tf:
+                    tf.write(data)
+                os.replace(tf.name, os.path.join(recordings_dir, name))
+                self.send_response(201)
+                self.end_headers()
+                logger.info(f"Stored recording {name} ({length} bytes) from {client_ip}")
+
             def log_message(self, format, *args):
                 # suppress default logging
                 return
@@ -128,8 +161,10 @@ def start_update_server():
     current_dir = os.path.dirname(os.path.abspath(__file__))
     project_dir = os.path.dirname(current_dir)
     base_dir = os.path.join(project_dir, "onboard", "rpi")
+    recordings_dir = os.path.join(current_dir, "recordings")
 
-    server = UAVServer(port=55051, base_dir=base_dir)
+    server = UAVServer(port=55051, base_dir=base_dir, recordings_dir=recordings_dir)
     thread = Thread(target=server.start, daemon=True)
     thread.start()
+    return server
 
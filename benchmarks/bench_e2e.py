@@ -0,0 +1,356 @@
+# bench_e2e.py
+"""
+End-to-end latency and throughput of the Pi -> GCS -> browser path.
+
+Starts the backend (uvicorn main:app with GCS_SOURCE=pi), a fake Pi in its
+own process and N fake browsers on /ws/telemetry, then pushes synthetic
+MAVLink telemetry for --duration seconds.
+
+The fake Pi runs the real onboard code: synthetic messages go through the
+Pi PixHawkClient._process_message (dispatcher, change tracking) into
+WebSocketClient (outbound lanes, codec, batching) and on to UavComms. One
+SYSTEM_TIME probe per --probe-rate tick carries the time it was generated
+in time_unix_usec; browsers turn it into latency when they receive it.
+
+Reported as JSON: latency percentiles, generated/received messages per
+second, frames dropped per browser in send_to_client (BroadcastHub), link
+frame stats, and backend CPU/RSS (psutil if installed, else /proc, else
+null).
+
+Usage:
+    python benchmarks/bench_e2e.py [--clients N] [--rate HZ] [--types A,B] [--duration S]
+                                   [--codec json|mavstruct] [--batch-ms MS] [--out FILE]
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import websockets
+
+from synthetic import TELEMETRY_TYPES, make_message, mavlink, message_class
+
+ROOT = Path(__file__).resolve().parent.parent
+PI_DIR = ROOT / "onboard" / "rpi"
+BACKEND_DIR = ROOT / "backend"
+
+# distinct messages generated per type, cycled so values keep changing
+POOL_SIZE = 32
+
+
+# <editor-fold desc="fake Pi">
+
+def _build_pool(types: List[str], seed: int) -> Dict[str, List[Any]]:
+    rng = random.Random(seed)
+    packer = mavlink.MAVLink(None, srcSystem=1, srcComponent=1)
+    pool = {}
+    for name in types:
+        msgs = [make_message(name, rng) for _ in range(POOL_SIZE)]
+        for msg in msgs:
+            msg.pack(packer)  # sets the msgbuf the recorder / passthrough use
+        pool[name] = msgs
+    return pool
+
+
+async def _fake_pi(args: argparse.Namespace, types: List[str], results) -> None:
+    sys.path.append(str(PI_DIR))
+    from pixhawk_client import PixHawkClient
+    from websocket_client import WebSocketClient
+    from wire import CODECS
+
+    ws_client = WebSocketClient("ws://127.0.0.1:55052", codecs=[args.codec] if args.codec else CODECS,
+                                batch_interval=args.batch_ms / 1000)
+    pix = PixHawkClient(device="bench", baud=0, send_log=ws_client.send_log, send_msg=ws_client.send_msg)
+    ws_client.state = pix.telemetry
+    ws_client.changelog = pix.changelog
+    ws_task = asyncio.create_task(ws_client.mainloop())
+
+    pool = _build_pool(types, args.seed)
+    loop = asyncio.get_running_loop()
+    period = 1.0 / args.rate
+    probe_every = max(1, round(args.rate / args.probe_rate))
+
+    # wait for the link, then give the browsers time to subscribe
+    while not ws_client._negotiated.is_set():
+        await asyncio.sleep(0.05)
+    await asyncio.sleep(0.5)
+
+    generated = probes = ticks = late_ticks = 0
+    start = next_tick = loop.time()
+    end = start + args.duration
+    while loop.time() < end:
+        for name in types:
+            await pix._process_message(pool[name][ticks % POOL_SIZE])
+        generated += len(types)
+        if ticks % probe_every == 0:
+            probe = mavlink.MAVLink_system_time_message(time.time_ns() // 1000, ticks)
+            await pix._process_message(probe)
+            probes += 1
+        ticks += 1
+
+        next_tick += period
+        delay = next_tick - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            late_ticks += 1
+    elapsed = loop.time() - start
+
+    await asyncio.sleep(1.0)  # let the queues drain
+    results.put({
+        "generated": generated,
+        "generated_per_s": round(generated / elapsed, 1),
+        "probes": probes,
+        "late_ticks": late_ticks,
+        "outbound": ws_client.outbound.stats(),
+        "link": ws_client.link_stats.stats(),
+    })
+    await ws_client.stop()
+    ws_task.cancel()
+
+
+def _run_fake_pi(args: argparse.Namespace, types: List[str], results) -> None:
+    # the onboard code prints every log; keep the report readable
+    sys.stdout = open(os.devnull, "w")
+    asyncio.run(_fake_pi(args, types, results))
+
+# </editor-fold>
+
+
+# <editor-fold desc="fake browsers">
+
+class Browser:
+    def __init__(self, url: str, warmup_until: float) -> None:
+        self.url = url
+        self.warmup_until = warmup_until
+        self.messages = 0
+        self.latencies_us: List[int] = []
+        self.probes = 0
+        self.first = self.last = 0.0
+
+    async def run(self, stop: asyncio.Event) -> None:
+        async with websockets.connect(self.url, max_size=None) as ws:
+            while not stop.is_set():
+                try:
+                    raw = await asyncio.wait_for(ws.recv(), 0.5)
+                except asyncio.TimeoutError:
+                    continue
+                now_us = time.time_ns() // 1000
+                msg = json.loads(raw)
+                if msg.get("type") != "telemetry":
+                    continue
+                self.messages += 1
+                self.last = time.monotonic()
+                self.first = self.first or self.last
+                probe = msg["data"].get("SYSTEM_TIME")
+                if probe is not None and "time_unix_usec" in probe:
+                    self.probes += 1
+                    if time.monotonic() >= self.warmup_until:
+                        self.latencies_us.append(now_us - probe["time_unix_usec"])
+
+    def stats(self) -> Dict[str, Any]:
+        span = self.last - self.first
+        return {
+            "messages": self.messages,
+            "messages_per_s": round(self.messages / span, 1) if span > 0 else 0.0,
+            "probes": self.probes,
+        }
+
+# </editor-fold>
+
+
+# <editor-fold desc="backend process">
+
+class ProcessMonitor:
+    """CPU and RSS of one process, sampled periodically."""
+
+    def __init__(self, pid: int) -> None:
+        self.pid = pid
+        self.samples: List[Dict[str, float]] = []
+        try:
+            import psutil
+            self._psutil = psutil.Process(pid)
+        except ImportError:
+            self._psutil = None
+        self._last = self._cpu_seconds()
+
+    def _cpu_seconds(self) -> Optional[float]:
+        if self._psutil is not None:
+            times = self._psutil.cpu_times()
+            return times.user + times.system
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        except (OSError, ValueError, AttributeError):
+            return None
+
+    def _rss_mb(self) -> Optional[float]:
+        if self._psutil is not None:
+            return self._psutil.memory_info().rss / 2 ** 20
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return None
+
+    async def run(self, stop: asyncio.Event, interval: float = 0.5) -> None:
+        last_time = time.monotonic()
+        while not stop.is_set():
+            await asyncio.sleep(interval)
+            cpu, now = self._cpu_seconds(), time.monotonic()
+            if cpu is not None and self._last is not None:
+                self.samples.append({"cpu_percent": 100 * (cpu - self._last) / (now - last_time),
+                                     "rss_mb": self._rss_mb() or 0.0})
+            self._last, last_time = cpu, now
+
+    def stats(self) -> Optional[Dict[str, float]]:
+        if not self.samples:
+            return None
+        cpu = [s["cpu_percent"] for s in self.samples]
+        return {
+            "cpu_percent_mean": round(sum(cpu) / len(cpu), 1),
+            "cpu_percent_max": round(max(cpu), 1),
+            "rss_mb_max": round(max(s["rss_mb"] for s in self.samples), 1),
+        }
+
+
+def _start_backend(port: int) -> subprocess.Popen:
+    env = dict(os.environ, GCS_SOURCE="pi")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+
+
+def _get_json(url: str) -> Any:
+    with urllib.request.urlopen(url, timeout=5) as resp:
+        return json.loads(resp.read())
+
+
+async def _wait_for_backend(backend: subprocess.Popen, port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            await asyncio.to_thread(_get_json, f"http://127.0.0.1:{port}/status")
+            return
+        except Exception:
+            if backend.poll() is not None:
+                raise RuntimeError(f"backend exited with code {backend.returncode}")
+            if time.monotonic() > deadline:
+                raise RuntimeError("backend did not start")
+            await asyncio.sleep(0.2)
+
+# </editor-fold>
+
+
+def percentiles(values: List[int]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] / 1000, 3)
+
+    return {
+        "samples": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) / 1000, 3),
+        "p50_ms": pick(0.50),
+        "p90_ms": pick(0.90),
+        "p99_ms": pick(0.99),
+        "p999_ms": pick(0.999),
+        "max_ms": round(ordered[-1] / 1000, 3),
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    types = [t for t in (args.types.split(",") if args.types else TELEMETRY_TYPES)
+             if t != "SYSTEM_TIME" and message_class(t)]
+
+    backend = _start_backend(args.port)
+    ctx = multiprocessing.get_context("spawn")
+    pi_results = ctx.Queue()
+    pi = None
+    try:
+        await _wait_for_backend(backend, args.port)
+        monitor = ProcessMonitor(backend.pid)
+        stop = asyncio.Event()
+        warmup_until = time.monotonic() + args.warmup + 0.5
+        browsers = [Browser(f"ws://127.0.0.1:{args.port}/ws/telemetry", warmup_until) for _ in range(args.clients)]
+        tasks = [asyncio.create_task(b.run(stop)) for b in browsers]
+        monitor_task = asyncio.create_task(monitor.run(stop))
+        await asyncio.sleep(0.5)  # browsers registered with the hub
+
+        pi = ctx.Process(target=_run_fake_pi, args=(args, types, pi_results), daemon=True)
+        pi.start()
+        pi_stats = await asyncio.to_thread(pi_results.get, True, args.duration + 60)
+
+        hub = await asyncio.to_thread(_get_json, f"http://127.0.0.1:{args.port}/api/ws/clients")
+        link = await asyncio.to_thread(_get_json, f"http://127.0.0.1:{args.port}/api/link")
+        stop.set()
+        await asyncio.gather(*tasks, monitor_task, return_exceptions=True)
+    finally:
+        if pi is not None:
+            pi.join(5)
+            if pi.is_alive():
+                pi.terminate()
+        backend.terminate()
+        backend.wait(10)
+
+    latencies = [us for b in browsers for us in b.latencies_us]
+    return {
+        "config": {
+            "clients": args.clients, "rate_hz": args.rate, "types": len(types), "duration_s": args.duration,
+            "warmup_s": args.warmup, "probe_rate_hz": args.probe_rate, "codec": args.codec or "negotiated",
+            "batch_ms": args.batch_ms,
+        },
+        "latency": percentiles(latencies),
+        "pi": pi_stats,
+        "probes_received": [b.probes for b in browsers],
+        "clients": [b.stats() for b in browsers],
+        "send_to_client": {
+            "dropped": sum(c.get("dropped", 0) for c in hub),
+            "per_client": hub,
+        },
+        "gcs_link": link,
+        "backend": monitor.stats(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=4, help="fake browsers on /ws/telemetry")
+    parser.add_argument("--rate", type=float, default=50.0, help="messages per second per telemetry type")
+    parser.add_argument("--types", type=str, default=None, help="comma separated types (default: all)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load")
+    parser.add_argument("--warmup", type=float, default=1.0, help="seconds of latency samples to ignore")
+    parser.add_argument("--probe-rate", type=float, default=10.0, help="latency probes per second")
+    parser.add_argument("--codec", choices=("json", "mavstruct"), default=None)
+    parser.add_argument("--batch-ms", type=float, default=20.0, help="Pi batching window (0 disables)")
+    parser.add_argument("--port", type=int, default=55060, help="HTTP port for the backend under test")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", type=str, default=None, help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# bench_wire.py
+"""
+Compare the Pi <-> GCS link codecs per telemetry message type.
+
+For every type handled in PixHawkClient._process_message this reports bytes
+per message and encode/decode time for:
+    json-sanitize  the original path (recursive sanitize walk + json.dumps)
+    json           json.dumps with a default hook (wire.encode_json)
+    mavstruct      schema-aware struct packing (wire.MavStructCodec)
+
+Usage:
+    python benchmarks/bench_wire.py [--iterations N] [--json]
+"""
+
+import argparse
+import json
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / "onboard" / "rpi"))
+from wire import MavStructCodec, encode_json
+
+from synthetic import sample_messages
+
+
+def _sanitize(obj):
+    # copy of the pre-codec WebSocketClient.send_msg helper
+    if isinstance(obj, bytearray):
+        return obj.hex()
+    elif isinstance(obj, dict):
+        return {k: _sanitize(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [_sanitize(v) for v in obj]
+    else:
+        return obj
+
+
+def _us(fn, iterations: int) -> float:
+    return min(timeit.repeat(fn, number=iterations, repeat=3)) / iterations * 1e6
+
+
+def run(iterations: int) -> dict:
+    codec = MavStructCodec()
+    results = {}
+    for name, msg in sample_messages().items():
+        fields = msg.to_dict()
+        envelope = {"type": "telemetry", "msg": fields}
+
+        legacy = json.dumps(_sanitize(envelope))
+        text = encode_json(envelope)
+        binary = codec.encode_telemetry(fields)
+        assert codec.decode(binary)["msg"] == json.loads(text)["msg"], name
+
+        results[name] = {
+            "json-sanitize": {
+                "bytes": len(legacy.encode()),
+                "encode_us": _us(lambda: json.dumps(_sanitize(envelope)), iterations),
+                "decode_us": _us(lambda: json.loads(legacy), iterations),
+            },
+            "json": {
+                "bytes": len(text.encode()),
+                "encode_us": _us(lambda: encode_json(envelope), iterations),
+                "decode_us": _us(lambda: json.loads(text), iterations),
+            },
+            "mavstruct": {
+                "bytes": len(binary),
+                "encode_us": _us(lambda: codec.encode_telemetry(fields), iterations),
+                "decode_us": _us(lambda: codec.decode(binary), iterations),
+            },
+        }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--json", action="store_true", help="print raw results as JSON")
+    args = parser.parse_args()
+
+    results = run(args.iterations)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    codecs = ("json-sanitize", "json", "mavstruct")
+    print(f"{'message':28}" + "".join(f"{c:>30}" for c in codecs))
+    print(f"{'':28}" + "".join(f"{'bytes  enc_us  dec_us':>30}" for _ in codecs))
+    totals = {c: [0, 0.0, 0.0] for c in codecs}
+    for name, row in results.items():
+        line = f"{name:28}"
+        for c in codecs:
+            r = row[c]
+            line += f"{r['bytes']:>16}{r['encode_us']:>7.1f}{r['decode_us']:>7.1f}"
+            totals[c][0] += r["bytes"]
+            totals[c][1] += r["encode_us"]
+            totals[c][2] += r["decode_us"]
+        print(line)
+    n = len(results)
+    print(f"{'mean':28}" + "".join(f"{t[0] / n:>16.0f}{t[1] / n:>7.1f}{t[2] / n:>7.1f}" for t in totals.values()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# synthetic.py
+"""
+Synthetic MAVLink telemetry for benchmarks.
+
+Messages are real pymavlink message objects filled with random values that
+respect each field's wire type, so to_dict(), pack() and the link codecs see
+the same shapes they would see from a Pixhawk.
+"""
+
+import importlib
+import random
+import struct
+from typing import Dict, Any, List, Optional
+
+from pymavlink import mavutil
+
+# ArduPilot speaks MAVLink 2, so generate messages with the v2 definitions
+mavlink = importlib.import_module(f"pymavlink.dialects.v20.{mavutil.current_dialect}")
+
+# the telemetry types handled by PixHawkClient._process_message
+# (UNKNOWN_295 has no definition in the dialect and is skipped)
+TELEMETRY_TYPES = [
+    "AHRS", "ATTITUDE", "GLOBAL_POSITION_INT", "VFR_HUD", "SYS_STATUS", "POWER_STATUS", "MEMINFO",
+    "MISSION_CURRENT", "SERVO_OUTPUT_RAW", "RC_CHANNELS", "RAW_IMU", "SCALED_IMU2", "SCALED_IMU3",
+    "SCALED_PRESSURE", "SCALED_PRESSURE2", "GPS_RAW_INT", "SYSTEM_TIME", "WIND", "TERRAIN_REPORT",
+    "EKF_STATUS_REPORT", "VIBRATION", "BATTERY_STATUS", "AOA_SSA", "MCU_STATUS",
+    "POSITION_TARGET_GLOBAL_INT", "NAV_CONTROLLER_OUTPUT", "EXTENDED_SYS_STATE", "LOCAL_POSITION_NED",
+    "AHRS2", "GPS_GLOBAL_ORIGIN", "HOME_POSITION",
+]
+
+_INT_RANGES = {
+    "int8_t": (-128, 127), "uint8_t": (0, 255), "int16_t": (-32768, 32767), "uint16_t": (0, 65535),
+    "int32_t": (-2 ** 31, 2 ** 31 - 1), "uint32_t": (0, 2 ** 32 - 1),
+    "int64_t": (-2 ** 63, 2 ** 63 - 1), "uint64_t": (0, 2 ** 64 - 1),
+}
+
+
+def _f32(x: float) -> float:
+    return struct.unpack("<f", struct.pack("<f", x))[0]
+
+
+def _value(ftype: str, n: int, rng: random.Random) -> Any:
+    if ftype == "char":
+        # v20 constructors take char arrays as bytes and decode them
+        return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(1, max(n, 1)))).encode()
+    if ftype in ("float", "double"):
+        one = (lambda: _f32(rng.uniform(-1000, 1000))) if ftype == "float" else (lambda: rng.uniform(-1000, 1000))
+    else:
+        lo, hi = _INT_RANGES[ftype]
+        one = lambda: rng.randint(lo, hi)
+    return [one() for _ in range(n)] if n else one()
+
+
+def message_class(name: str):
+    return getattr(mavlink, f"MAVLink_{name.lower()}_message", None)
+
+
+def make_message(name: str, rng: Optional[random.Random] = None):
+    """A pymavlink message of type `name` with random field values."""
+    rng = rng or random.Random()
+    cls = message_class(name)
+    if cls is None:
+        raise KeyError(name)
+    lengths = dict(zip(cls.ordered_fieldnames, cls.array_lengths))
+    args = [_value(t, lengths.get(f, 0), rng) for f, t in zip(cls.fieldnames, cls.fieldtypes)]
+    return cls(*args)
+
+
+def sample_messages(types: Optional[List[str]] = None, seed: int = 0) -> Dict[str, Any]:
+    """One random message object per available telemetry type."""
+    rng = random.Random(seed)
+    return {name: make_message(name, rng) for name in (types or TELEMETRY_TYPES) if message_class(name)}
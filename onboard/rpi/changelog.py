@@ -0,0 +1,259 @@
+# changelog.py
+"""
+Field-level change detection for telemetry and the bounded changelog it feeds.
+
+ChangeTracker keeps the last reported value of every field per message type
+(PixHawkClient.telemetry) and counts the fields that changed. A field with a
+deadband only counts as changed once it has moved more than the deadband
+away from the last value that was reported, so slow drift still gets through
+but jitter doesn't.
+
+Slow-moving status types (CHANGELOG_TYPES) reach the GCS only as change
+records: every change becomes a (timestamp_ms, msg_type, field, value)
+record, and the records go out grouped per type (group_records()). Every
+other type is sent as a full message, and only when one of its fields
+changed beyond its deadband (see PixHawkClient._on_telemetry), so each type
+crosses the link exactly one way.
+
+Before looking at single fields the tracker compares all tracked values of
+the message as one tuple against the previous message; unchanged messages
+(common for SYS_STATUS, HOME_POSITION, ...) cost one C-level comparison.
+
+ChangeLog is a fixed-size buffer with one preallocated ring per priority.
+When it is full, the oldest record of the lowest non-empty priority is
+dropped, and drain() hands out higher priorities first.
+"""
+
+import time
+from operator import itemgetter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+LOW, NORMAL, HIGH = 0, 1, 2
+
+# fields whose changes are never worth a record
+IGNORED_FIELDS = frozenset({"mavpackettype", "time_boot_ms", "time_usec"})
+
+DEFAULT_PRIORITIES: Dict[str, int] = {
+    "SYS_STATUS": HIGH, "BATTERY_STATUS": HIGH, "EKF_STATUS_REPORT": HIGH, "EXTENDED_SYS_STATE": HIGH,
+    "MISSION_CURRENT": HIGH, "HOME_POSITION": HIGH, "GPS_GLOBAL_ORIGIN": HIGH,
+    "RAW_IMU": LOW, "SCALED_IMU2": LOW, "SCALED_IMU3": LOW, "SCALED_PRESSURE": LOW, "SCALED_PRESSURE2": LOW,
+    "VIBRATION": LOW, "SERVO_OUTPUT_RAW": LOW, "RC_CHANNELS": LOW, "MEMINFO": LOW, "MCU_STATUS": LOW,
+    "SYSTEM_TIME": LOW,
+}
+
+# message types sent to the GCS as change records instead of full messages
+CHANGELOG_TYPES = frozenset({
+    "SYS_STATUS", "BATTERY_STATUS", "EKF_STATUS_REPORT", "EXTENDED_SYS_STATE", "MISSION_CURRENT",
+    "HOME_POSITION", "GPS_GLOBAL_ORIGIN", "POWER_STATUS", "MEMINFO", "MCU_STATUS",
+})
+
+# "MSG_TYPE.field": minimum change to report, in the field's own units
+DEFAULT_DEADBANDS: Dict[str, float] = {
+    "GLOBAL_POSITION_INT.alt": 50,  # mm
+    "GLOBAL_POSITION_INT.relative_alt": 50,  # mm
+    "GLOBAL_POSITION_INT.vx": 5,  # cm/s
+    "GLOBAL_POSITION_INT.vy": 5,  # cm/s
+    "GLOBAL_POSITION_INT.vz": 5,  # cm/s
+    "VFR_HUD.alt": 0.05,  # m
+    "VFR_HUD.climb": 0.05,  # m/s
+    "VFR_HUD.airspeed": 0.05,  # m/s
+    "VFR_HUD.groundspeed": 0.05,  # m/s
+    "LOCAL_POSITION_NED.x": 0.05,  # m
+    "LOCAL_POSITION_NED.y": 0.05,  # m
+    "LOCAL_POSITION_NED.z": 0.05,  # m
+    "LOCAL_POSITION_NED.vx": 0.05,  # m/s
+    "LOCAL_POSITION_NED.vy": 0.05,  # m/s
+    "LOCAL_POSITION_NED.vz": 0.05,  # m/s
+    "AHRS2.altitude": 0.05,  # m
+    "ATTITUDE.roll": 0.002,  # rad, ~0.1 deg
+    "ATTITUDE.pitch": 0.002,  # rad
+    "ATTITUDE.yaw": 0.002,  # rad
+    "ATTITUDE.rollspeed": 0.005,  # rad/s
+    "ATTITUDE.pitchspeed": 0.005,  # rad/s
+    "ATTITUDE.yawspeed": 0.005,  # rad/s
+    "AHRS2.roll": 0.002,  # rad
+    "AHRS2.pitch": 0.002,  # rad
+    "AHRS2.yaw": 0.002,  # rad
+    "NAV_CONTROLLER_OUTPUT.nav_roll": 0.1,  # deg
+    "NAV_CONTROLLER_OUTPUT.nav_pitch": 0.1,  # deg
+    "SCALED_PRESSURE.press_abs": 0.05,  # hPa
+    "SCALED_PRESSURE.temperature": 10,  # cdegC
+    "SCALED_PRESSURE2.press_abs": 0.05,  # hPa
+    "SCALED_PRESSURE2.temperature": 10,  # cdegC
+    "VIBRATION.vibration_x": 0.05,  # m/s/s
+    "VIBRATION.vibration_y": 0.05,  # m/s/s
+    "VIBRATION.vibration_z": 0.05,  # m/s/s
+    "WIND.speed": 0.1,  # m/s
+    "WIND.direction": 1,  # deg
+    "SYS_STATUS.voltage_battery": 50,  # mV
+    "SYS_STATUS.current_battery": 10,  # cA
+    "SYS_STATUS.load": 20,  # d%
+    "BATTERY_STATUS.current_battery": 10,  # cA
+    "POWER_STATUS.Vcc": 20,  # mV
+    "POWER_STATUS.Vservo": 20,  # mV
+    "MEMINFO.freemem": 256,  # bytes
+    "MEMINFO.freemem32": 256,  # bytes
+    "MCU_STATUS.MCU_temperature": 50,  # cdegC
+    "MCU_STATUS.MCU_voltage": 20,  # mV
+}
+
+Record = Tuple[int, str, str, Any]
+
+
+class ChangeLog:
+    def __init__(self, capacity: int = 16384, levels: int = HIGH + 1) -> None:
+        self.capacity = capacity
+        self._rings: List[List[Optional[Record]]] = [[None] * capacity for _ in range(levels)]
+        self._head = [0] * levels
+        self._size = [0] * levels
+        self._total = 0
+        self.dropped = [0] * levels
+
+    def __len__(self) -> int:
+        return self._total
+
+    def append(self, record: Record, priority: int = NORMAL) -> None:
+        if self._total >= self.capacity:
+            victim = next(p for p in range(len(self._rings)) if self._size[p])
+            if victim > priority:
+                # everything queued matters more than this record
+                self.dropped[priority] += 1
+                return
+            self._pop(victim)
+            self.dropped[victim] += 1
+        ring = self._rings[priority]
+        ring[(self._head[priority] + self._size[priority]) % self.capacity] = record
+        self._size[priority] += 1
+        self._total += 1
+
+    def _pop(self, priority: int) -> Record:
+        ring = self._rings[priority]
+        head = self._head[priority]
+        record = ring[head]
+        ring[head] = None
+        self._head[priority] = (head + 1) % self.capacity
+        self._size[priority] -= 1
+        self._total -= 1
+        return record
+
+    def drain(self, limit: Optional[int] = None) -> List[Record]:
+        """Remove and return up to `limit` records, highest priority first, oldest first within a priority."""
+        limit = self._total if limit is None else min(limit, self._total)
+        out: List[Record] = []
+        for priority in range(len(self._rings) - 1, -1, -1):
+            while self._size[priority] and len(out) < limit:
+                out.append(self._pop(priority))
+        return out
+
+    def clear(self) -> None:
+        self.drain()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self._total,
+            "capacity": self.capacity,
+            "queued_by_priority": list(self._size),
+            "dropped_by_priority": list(self.dropped),
+        }
+
+
+class ChangeTracker:
+    def __init__(
+            self,
+            state: Dict[str, Dict[str, Any]],
+            changelog: Optional[ChangeLog] = None,
+            deadbands: Optional[Dict[str, float]] = None,
+            priorities: Optional[Dict[str, int]] = None,
+            ignored: Iterable[str] = IGNORED_FIELDS,
+            logged: Iterable[str] = CHANGELOG_TYPES,
+    ) -> None:
+        self.state = state
+        self.changelog = changelog
+        self.logged = frozenset(logged)  # types whose changes become changelog records
+        self.priorities = DEFAULT_PRIORITIES if priorities is None else priorities
+        self.ignored = frozenset(ignored)
+        self._deadbands: Dict[str, Dict[str, float]] = {}
+        for key, band in (DEFAULT_DEADBANDS if deadbands is None else deadbands).items():
+            msg_type, field = key.split(".", 1)
+            self._deadbands.setdefault(msg_type, {})[field] = band
+        # per type: field names, a getter for them, and their values last time
+        self._layout: Dict[str, Tuple[Tuple[str, ...], Callable[[Dict[str, Any]], Tuple[Any, ...]]]] = {}
+        self._last: Dict[str, Tuple[Any, ...]] = {}
+        self.changed_fields = 0
+
+    def set_deadband(self, msg_type: str, field: str, band: Optional[float]) -> None:
+        bands = self._deadbands.setdefault(msg_type, {})
+        if band:
+            bands[field] = band
+        else:
+            bands.pop(field, None)
+
+    def observe(self, msg_type: str, fields: Dict[str, Any], timestamp_ms: Optional[int] = None) -> int:
+        """Update state from one message; returns the number of fields that changed beyond their deadband."""
+        layout = self._layout.get(msg_type)
+        if layout is None:
+            names = tuple(k for k in fields if k not in self.ignored)
+            layout = self._layout[msg_type] = (names, _tuple_getter(names))
+            self._last.pop(msg_type, None)
+        names, getter = layout
+
+        try:
+            values = getter(fields)
+        except KeyError:
+            # layout changed (different dialect/firmware); learn it again
+            del self._layout[msg_type]
+            return self.observe(msg_type, fields, timestamp_ms)
+        if self._last.get(msg_type) == values:
+            return 0
+        self._last[msg_type] = values
+
+        prev = self.state[msg_type]
+        bands = self._deadbands.get(msg_type)
+        changed: List[Tuple[str, Any]] = []
+        for name, value in zip(names, values):
+            old = prev.get(name, _MISSING)
+            if old == value:
+                continue
+            if bands and old is not _MISSING:
+                band = bands.get(name)
+                if band is not None and isinstance(value, (int, float)) and abs(value - old) < band:
+                    continue
+            prev[name] = value
+            changed.append((name, value))
+
+        if changed and self.changelog is not None and msg_type in self.logged:
+            ts = int(time.time() * 1000) if timestamp_ms is None else timestamp_ms
+            priority = self.priorities.get(msg_type, NORMAL)
+            for name, value in changed:
+                self.changelog.append((ts, msg_type, name, value), priority)
+        self.changed_fields += len(changed)
+        return len(changed)
+
+
+_MISSING = object()
+
+
+def group_records(records: Iterable[Record]) -> Dict[str, List[List[Any]]]:
+    """
+    Per-type batches of change records, the changelog_batch body:
+    {msg_type: [[timestamp_ms, {field: value, ...}], ...]}, one row per
+    message (records of one type and timestamp), oldest first.
+    """
+    out: Dict[str, List[List[Any]]] = {}
+    for ts, msg_type, field, value in records:
+        rows = out.setdefault(msg_type, [])
+        if rows and rows[-1][0] == ts:
+            rows[-1][1][field] = value
+        else:
+            rows.append([ts, {field: value}])
+    return out
+
+
+def _tuple_getter(names: Tuple[str, ...]) -> Callable[[Dict[str, Any]], Tuple[Any, ...]]:
+    # itemgetter returns a bare value for a single name and can't take none
+    if len(names) > 1:
+        return itemgetter(*names)
+    if names:
+        name = names[0]
+        return lambda d: (d[name],)
+    return lambda d: ()
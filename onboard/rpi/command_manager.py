@@ -0,0 +1,217 @@
+# command_manager.py
+"""
+Concurrent MAVLink command sender for COMMAND_LONG and COMMAND_INT, used by
+both PixHawkClients.
+
+Every request gets a local sequence number and is tracked under
+(command, seq) until it completes, so any number of commands can be in
+flight at once, several of the same command included. COMMAND_ACK only
+carries the command id, so an ACK completes the oldest outstanding request
+for that command; the autopilot answers a command id in order.
+
+A request that is not acknowledged within timeout / (retries + 1) is sent
+again, at most `retries` times. COMMAND_LONG retransmissions increment
+`confirmation` as the command protocol asks; COMMAND_INT has no such field
+and is resent as is. A MAV_RESULT_IN_PROGRESS ACK stops the retransmissions,
+reports its progress and waits up to `progress_timeout` for the next ACK.
+
+The autopilot may answer every transmission of a retried request, and the
+first final ACK completes it. So once a request sent n times completes, up
+to n - 1 more final ACKs for its command, arriving within one attempt
+timeout, are taken as duplicates and dropped (duplicate_acks). Otherwise
+they would complete the next request for that command with the wrong
+result. If the earlier ACKs were really lost, the next request loses its
+first ACK instead and is retransmitted.
+
+Round trip time is measured from the last transmission to the first ACK
+and kept per command id.
+"""
+
+import asyncio
+import itertools
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Optional, Sequence, Tuple
+
+from dispatch import TimingHistogram
+
+MAV_RESULT_ACCEPTED = 0
+MAV_RESULT_IN_PROGRESS = 5
+
+# command round trips, in microseconds
+RTT_BUCKETS_US = (1000, 5000, 10000, 25000, 50000, 100000, 250000, 500000, 1000000, 3000000)
+
+
+@dataclass(eq=False)
+class PendingCommand:
+    command: int
+    seq: int
+    params: Tuple[float, ...]
+    frame: Optional[int] = None  # COMMAND_INT frame; None sends a COMMAND_LONG
+    attempts: int = 0  # transmissions so far; confirmation is attempts - 1
+    attempt_timeout: float = 0.0  # seconds to wait for an ACK before retransmitting
+    first_sent: float = 0.0
+    sent: float = 0.0
+    rtt: Optional[float] = None  # seconds, first ACK after the last transmission
+    progress: Optional[int] = None  # percent from IN_PROGRESS ACKs, 255 if unknown
+    result: Optional[int] = None
+    ack: Any = None
+    updated: asyncio.Event = field(default_factory=asyncio.Event)
+
+    @property
+    def key(self) -> Tuple[int, int]:
+        return self.command, self.seq
+
+    @property
+    def confirmation(self) -> int:
+        return min(255, max(0, self.attempts - 1))
+
+
+class CommandManager:
+    def __init__(self, transmit: Callable[[PendingCommand], None], retries: int = 2,
+                 progress_timeout: float = 10.0,
+                 on_progress: Optional[Callable[[PendingCommand], None]] = None,
+                 on_rtt: Optional[Callable[[int, float], None]] = None) -> None:
+        self.transmit = transmit  # sends req as COMMAND_LONG/COMMAND_INT with req.confirmation
+        self.retries = retries
+        self.progress_timeout = progress_timeout
+        self.on_progress = on_progress  # called with the request on every IN_PROGRESS ACK
+        self.on_rtt = on_rtt  # called with (command, rtt in us) on the first ACK of a request
+
+        self.pending: Dict[Tuple[int, int], PendingCommand] = {}
+        # command id -> requests in the order they were first sent, for matching ACKs
+        self._by_command: Dict[int, Deque[PendingCommand]] = defaultdict(deque)
+        self._seq = itertools.count(1)
+        # command id -> (duplicate final ACKs still expected, until when), after a retried request completes
+        self._echoes: Dict[int, Tuple[int, float]] = {}
+
+        self.rtt: Dict[int, TimingHistogram] = defaultdict(lambda: TimingHistogram(RTT_BUCKETS_US))
+        self.sent = 0
+        self.retransmissions = 0
+        self.completed = 0
+        self.timeouts = 0
+        self.unmatched_acks = 0
+        self.duplicate_acks = 0
+
+    async def send(self, command: int, params: Sequence[float] = (), frame: Optional[int] = None,
+                   timeout: float = 3.0, retries: Optional[int] = None) -> PendingCommand:
+        """
+        Send a command and wait for its final ACK; returns the completed
+        request (result, rtt, attempts). Raises TimeoutError once all attempts
+        go unanswered, or an IN_PROGRESS command stops reporting.
+        """
+        retries = self.retries if retries is None else retries
+        attempt_timeout = timeout / (retries + 1)
+        req = PendingCommand(command, next(self._seq), tuple(params), frame, attempt_timeout=attempt_timeout)
+        self.pending[req.key] = req
+        self._by_command[command].append(req)
+        try:
+            while True:
+                if req.progress is None:
+                    if req.attempts > retries:
+                        self.timeouts += 1
+                        raise TimeoutError(f"COMMAND_ACK timeout for command {command} after {req.attempts} attempt(s)")
+                    self._transmit(req)
+                req.updated.clear()
+                wait = self.progress_timeout if req.progress is not None else attempt_timeout
+                try:
+                    await asyncio.wait_for(req.updated.wait(), wait)
+                except asyncio.TimeoutError:
+                    if req.progress is not None:
+                        self.timeouts += 1
+                        raise TimeoutError(f"Command {command} stopped reporting progress at {req.progress}%")
+                    continue
+                if req.result is not None:
+                    self.completed += 1
+                    return req
+        finally:
+            self._forget(req)
+
+    def _transmit(self, req: PendingCommand) -> None:
+        now = time.monotonic()
+        if not req.attempts:
+            req.first_sent = now
+        else:
+            self.retransmissions += 1
+        req.attempts += 1
+        req.sent = now
+        req.rtt = None
+        self.sent += 1
+        self.transmit(req)
+
+    def _forget(self, req: PendingCommand) -> None:
+        self.pending.pop(req.key, None)
+        queue = self._by_command.get(req.command)
+        if queue is not None:
+            try:
+                queue.remove(req)
+            except ValueError:
+                pass
+            if not queue:
+                del self._by_command[req.command]
+
+    def handle_ack(self, msg) -> Optional[PendingCommand]:
+        """
+        Match a COMMAND_ACK to the oldest outstanding request for its command.
+        Returns None if there is none, or if the ACK answers another
+        transmission of a retried request that already completed.
+        """
+        now = time.monotonic()
+        if self._is_echo(msg, now):
+            self.duplicate_acks += 1
+            return None
+        queue = self._by_command.get(msg.command)
+        if not queue:
+            self.unmatched_acks += 1
+            return None
+        req = queue[0]
+        if req.rtt is None:
+            req.rtt = now - req.sent
+            rtt_us = req.rtt * 1e6
+            self.rtt[req.command].observe(rtt_us)
+            if self.on_rtt is not None:
+                self.on_rtt(req.command, rtt_us)
+        req.ack = msg
+        if msg.result == MAV_RESULT_IN_PROGRESS:
+            req.progress = getattr(msg, "progress", 255)
+            if self.on_progress is not None:
+                self.on_progress(req)
+        else:
+            req.result = msg.result
+            # done: later ACKs for this command belong to the next request, except those for its other transmissions
+            queue.popleft()
+            if req.attempts > 1:
+                self._echoes[req.command] = (req.attempts - 1, now + req.attempt_timeout)
+        req.updated.set()
+        return req
+
+    def _is_echo(self, msg, now: float) -> bool:
+        """Whether msg is a duplicate ACK of the last retried request for its command (and consume it)."""
+        echo = self._echoes.get(msg.command)
+        if echo is None:
+            return False
+        remaining, until = echo
+        if now > until:
+            del self._echoes[msg.command]
+            return False
+        if msg.result != MAV_RESULT_IN_PROGRESS:
+            remaining -= 1
+        if remaining:
+            self._echoes[msg.command] = (remaining, until)
+        else:
+            del self._echoes[msg.command]
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": [{"command": r.command, "seq": r.seq, "attempts": r.attempts, "progress": r.progress,
+                           "age_s": round(time.monotonic() - r.first_sent, 3)} for r in self.pending.values()],
+            "sent": self.sent,
+            "retransmissions": self.retransmissions,
+            "completed": self.completed,
+            "timeouts": self.timeouts,
+            "unmatched_acks": self.unmatched_acks,
+            "duplicate_acks": self.duplicate_acks,
+            "rtt": {command: hist.stats() for command, hist in self.rtt.items()},
+        }
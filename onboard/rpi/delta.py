@@ -0,0 +1,115 @@
+# delta.py
+"""
+Keyframe + field-diff encoding for telemetry streams.
+
+Used on the Pi -> GCS link (UavComms) and the backend -> browser socket.
+Each message type is its own stream with its own sequence number. The encoder
+sends a full keyframe periodically (and whenever the receiver asks for one),
+and in between only the fields whose value changed. A message whose only
+changes are in VOLATILE_FIELDS (boot/usec timestamps) is not sent at all, which
+is what makes slow-changing messages like SYS_STATUS, POWER_STATUS and
+HOME_POSITION nearly free.
+
+Frame body:
+    {"t": msg_type, "seq": n, "key": bool, "d": {field: value, ...}}
+
+The decoder applies frames in sequence order; on a gap it drops the frame and
+records the stream as needing a resync until the next keyframe arrives.
+"""
+
+import time
+from typing import Dict, Any, Optional, Iterable, Set, List
+
+VOLATILE_FIELDS = frozenset({"mavpackettype", "time_boot_ms", "time_usec"})
+
+
+class DeltaEncoder:
+    def __init__(self, keyframe_interval: float = 5.0, volatile: Iterable[str] = VOLATILE_FIELDS) -> None:
+        self.keyframe_interval = keyframe_interval
+        self.volatile = frozenset(volatile)
+        self._last: Dict[str, Dict[str, Any]] = {}
+        self._seq: Dict[str, int] = {}
+        self._last_key: Dict[str, float] = {}
+
+    def reset(self) -> None:
+        """Forget all stream state; the next frame of every stream is a keyframe."""
+        self._last.clear()
+        self._seq.clear()
+        self._last_key.clear()
+
+    def request_keyframe(self, streams: Optional[Iterable[str]] = None) -> None:
+        for stream in (streams if streams is not None else list(self._last_key)):
+            self._last_key.pop(stream, None)
+
+    def encode(self, msg_type: str, fields: Dict[str, Any], now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Return the frame body for this message, or None if nothing worth sending changed."""
+        now = time.monotonic() if now is None else now
+        prev = self._last.get(msg_type)
+        seq = self._seq.get(msg_type, -1) + 1
+
+        if prev is None or now - self._last_key.get(msg_type, float("-inf")) >= self.keyframe_interval:
+            data = {k: v for k, v in fields.items() if k != "mavpackettype"}
+            self._last[msg_type] = data
+            self._last_key[msg_type] = now
+            self._seq[msg_type] = seq
+            return {"t": msg_type, "seq": seq, "key": True, "d": data}
+
+        diff = {}
+        significant = False
+        for k, v in fields.items():
+            if k == "mavpackettype" or prev.get(k) == v:
+                continue
+            diff[k] = v
+            if k not in self.volatile:
+                significant = True
+        if not significant:
+            return None
+
+        prev.update(diff)
+        self._seq[msg_type] = seq
+        return {"t": msg_type, "seq": seq, "key": False, "d": diff}
+
+
+class DeltaDecoder:
+    def __init__(self) -> None:
+        self._state: Dict[str, Dict[str, Any]] = {}
+        self._seq: Dict[str, int] = {}
+        self.resync: Set[str] = set()
+        self._requested: Set[str] = set()
+        self.gaps = 0
+
+    def reset(self) -> None:
+        self._state.clear()
+        self._seq.clear()
+        self.resync.clear()
+        self._requested.clear()
+
+    def decode(self, body: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Apply a frame body; returns the full current fields, or None on a gap."""
+        stream = body["t"]
+        seq = body["seq"]
+
+        if body["key"]:
+            self._state[stream] = dict(body["d"])
+            self.resync.discard(stream)
+            self._requested.discard(stream)
+        elif stream in self.resync:
+            return None
+        elif self._seq.get(stream) != seq - 1:
+            self.gaps += 1
+            self.resync.add(stream)
+            return None
+        else:
+            self._state[stream].update(body["d"])
+
+        self._seq[stream] = seq
+        return dict(self._state[stream])
+
+    def pop_resync(self) -> List[str]:
+        """
+        Streams that need a keyframe; each is reported once until it resyncs
+        (the periodic keyframe covers a lost request).
+        """
+        pending = sorted(self.resync - self._requested)
+        self._requested |= self.resync
+        return pending
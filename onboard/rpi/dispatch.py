@@ -0,0 +1,116 @@
+# dispatch.py
+"""
+MAVLink message dispatch shared by the backend and onboard PixHawkClient.
+
+Handlers are registered per message type (or as the default for types
+nobody registered) and can be added or removed at runtime. Each handler gets
+a Packet, which only calls msg.to_dict() the first time a handler asks for
+.fields, so HEARTBEAT, COMMAND_ACK and PARAM_VALUE never build a dict.
+
+Every dispatch is timed per message type into a TimingHistogram; stats()
+shows which types dominate handler CPU. Times are wall time of the handlers
+for that message, including any awaits inside them.
+"""
+
+import asyncio
+import bisect
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+# upper bounds of the histogram buckets, in microseconds (last bucket is +inf)
+BUCKETS_US = (5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class Packet:
+    """A received MAVLink message with a lazily built field dict."""
+    __slots__ = ("msg", "type", "_fields")
+
+    def __init__(self, msg) -> None:
+        self.msg = msg
+        self.type: str = msg.get_type()
+        self._fields: Optional[Dict[str, Any]] = None
+
+    @property
+    def fields(self) -> Dict[str, Any]:
+        if self._fields is None:
+            self._fields = self.msg.to_dict()
+        return self._fields
+
+
+Handler = Callable[[Packet], Union[None, Awaitable[None]]]
+
+
+class TimingHistogram:
+    def __init__(self, bounds: Tuple[float, ...] = BUCKETS_US) -> None:
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total_us = 0.0
+        self.max_us = 0.0
+
+    def observe(self, us: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, us)] += 1
+        self.count += 1
+        self.total_us += us
+        if us > self.max_us:
+            self.max_us = us
+
+    def stats(self) -> Dict[str, Any]:
+        labels = [f"<={b}us" for b in self.bounds] + [f">{self.bounds[-1]}us"]
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_us / 1000, 3),
+            "mean_us": round(self.total_us / self.count, 2) if self.count else 0.0,
+            "max_us": round(self.max_us, 2),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class MessageDispatcher:
+    def __init__(self) -> None:
+        # msg_type -> [(handler, is_coroutine)]
+        self._handlers: Dict[str, List[Tuple[Handler, bool]]] = defaultdict(list)
+        self._default: Optional[Tuple[Handler, bool]] = None
+        self.timings: Dict[str, TimingHistogram] = defaultdict(TimingHistogram)
+
+    def register(self, msg_types: Union[str, Iterable[str]], handler: Handler) -> None:
+        entry = (handler, asyncio.iscoroutinefunction(handler))
+        for msg_type in ([msg_types] if isinstance(msg_types, str) else msg_types):
+            self._handlers[msg_type].append(entry)
+
+    def unregister(self, msg_types: Union[str, Iterable[str]], handler: Handler) -> None:
+        for msg_type in ([msg_types] if isinstance(msg_types, str) else msg_types):
+            handlers = self._handlers.get(msg_type)
+            if not handlers:
+                continue
+            handlers[:] = [h for h in handlers if h[0] != handler]
+            if not handlers:
+                del self._handlers[msg_type]
+
+    def set_default(self, handler: Optional[Handler]) -> None:
+        """Handler for message types with no registered handler."""
+        self._default = (handler, asyncio.iscoroutinefunction(handler)) if handler else None
+
+    def handles(self, msg_type: str) -> bool:
+        return msg_type in self._handlers
+
+    async def dispatch(self, msg) -> Packet:
+        pkt = Packet(msg)
+        handlers = self._handlers.get(pkt.type)
+        if handlers is None:
+            handlers = (self._default,) if self._default else ()
+
+        start = time.perf_counter_ns()
+        for handler, is_coroutine in handlers:
+            if is_coroutine:
+                await handler(pkt)
+            else:
+                handler(pkt)
+        self.timings[pkt.type].observe((time.perf_counter_ns() - start) / 1000)
+        return pkt
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-type handler timings, most total time first."""
+        ranked = sorted(self.timings.items(), key=lambda kv: kv[1].total_us, reverse=True)
+        return {msg_type: hist.stats() for msg_type, hist in ranked}
@@ -0,0 +1,173 @@
+# loop_monitor.py
+"""
+Event-loop lag monitor and slow-callback profiler, used by the backend and
+the Pi.
+
+A heartbeat callback runs on the loop every `interval` seconds and records
+how late it ran (loop lag) into a TimingHistogram. A watchdog thread checks
+the heartbeat; once the loop has not run it for `threshold` seconds, the
+loop is stuck in one callback, so the thread grabs the loop thread's stack
+(sys._current_frames) and keeps sampling it every `threshold` while the
+stall lasts. When the loop comes back the stall is finished with its
+duration and written as one JSON line to the report file, which rotates to
+<report>.1 at `max_report_bytes`.
+
+Each stall names `where`: the innermost frame of our own code (outside the
+standard library and site-packages), e.g. main.py:412 in get_setting_full,
+which is what to fix.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import sysconfig
+import threading
+import time
+import traceback
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from dispatch import TimingHistogram
+
+# lag buckets in microseconds; stalls are usually milliseconds to seconds
+LAG_BUCKETS_US = (100, 500, 1000, 5000, 10000, 50000, 100000, 500000, 1000000, 5000000)
+
+_LIBRARY_PATHS = tuple({p for p in (sysconfig.get_paths().get("stdlib"), sysconfig.get_paths().get("platstdlib"),
+                                    sysconfig.get_paths().get("purelib"), sysconfig.get_paths().get("platlib"))
+                        if p})
+_MAX_STACKS = 5
+_STACK_DEPTH = 20
+
+
+class LoopMonitor:
+    def __init__(self, interval: float = 0.05, threshold: float = 0.1, report_path: Optional[str | Path] = None,
+                 max_report_bytes: int = 1024 * 1024, keep: int = 50,
+                 on_stall: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 on_lag: Optional[Callable[[float], None]] = None) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        self.report_path = Path(report_path) if report_path else None
+        self.max_report_bytes = max_report_bytes
+        self.on_stall = on_stall  # called on the loop with the finished stall record
+        self.on_lag = on_lag  # called on the loop with every lag sample in us
+
+        self.lag = TimingHistogram(LAG_BUCKETS_US)
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=keep)
+        self.stalls = 0
+        self.longest_ms = 0.0
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._beats = 0
+        self._last_beat = 0.0
+        self._max_lag = 0.0  # reset by the watchdog when a stall starts
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        self._loop = loop or asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._handle = self._loop.call_later(self.interval, self._beat, self._last_beat + self.interval)
+        self._thread = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._handle is not None:
+            self._handle.cancel()
+
+    def _beat(self, due: float) -> None:
+        now = time.monotonic()
+        lag_us = max(0.0, now - due) * 1e6
+        self.lag.observe(lag_us)
+        if self.on_lag is not None:
+            self.on_lag(lag_us)
+        if lag_us > self._max_lag:
+            self._max_lag = lag_us
+        self._last_beat = now
+        self._beats += 1
+        if not self._stop.is_set():
+            self._handle = self._loop.call_later(self.interval, self._beat, now + self.interval)
+
+    # <editor-fold desc="watchdog thread">
+
+    def _watch(self) -> None:
+        stall: Optional[Dict[str, Any]] = None
+        stall_beats = 0
+        next_sample = 0.0
+        while not self._stop.wait(self.threshold / 4):
+            now = time.monotonic()
+            if stall is not None:
+                if self._beats != stall_beats:
+                    self._finish(stall)
+                    stall = None
+                elif now >= next_sample and len(stall["stacks"]) < _MAX_STACKS:
+                    self._sample(stall)
+                    next_sample = now + self.threshold
+            elif now - self._last_beat - self.interval > self.threshold:
+                stall_beats = self._beats
+                self._max_lag = 0.0
+                stall = {"started": time.time() - (now - self._last_beat - self.interval), "stacks": []}
+                self._sample(stall)
+                next_sample = now + self.threshold
+
+    def _sample(self, stall: Dict[str, Any]) -> None:
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return
+        summary = traceback.extract_stack(frame)[-_STACK_DEPTH:]
+        del frame
+        stack = [f"{s.filename}:{s.lineno} in {s.name}" for s in summary]
+        if not stall["stacks"] or stall["stacks"][-1]["stack"] != stack:
+            stall["stacks"].append({"where": _where(summary), "stack": stack})
+        else:
+            stall["stacks"][-1]["samples"] = stall["stacks"][-1].get("samples", 1) + 1
+
+    def _finish(self, stall: Dict[str, Any]) -> None:
+        stall["duration_ms"] = round(self._max_lag / 1000, 1)
+        stall["where"] = stall["stacks"][0]["where"] if stall["stacks"] else None
+        self.stalls += 1
+        self.longest_ms = max(self.longest_ms, stall["duration_ms"])
+        self.recent.append(stall)
+        self._write(stall)
+        if self.on_stall is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self.on_stall, stall)
+
+    def _write(self, stall: Dict[str, Any]) -> None:
+        if self.report_path is None:
+            return
+        try:
+            if self.report_path.exists() and self.report_path.stat().st_size >= self.max_report_bytes:
+                os.replace(self.report_path, self.report_path.with_name(self.report_path.name + ".1"))
+            with self.report_path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(stall) + "\n")
+        except OSError:
+            self.report_path = None  # read-only or full disk; keep monitoring in memory
+
+    # </editor-fold>
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "lag": self.lag.stats(),
+            "stalls": self.stalls,
+            "longest_stall_ms": self.longest_ms,
+            "threshold_ms": self.threshold * 1000,
+            "report": str(self.report_path) if self.report_path else None,
+            "recent": [{k: v for k, v in s.items() if k != "stacks"} for s in self.recent],
+        }
+
+    def recent_stalls(self) -> List[Dict[str, Any]]:
+        """Recent stalls including their stacks, newest last."""
+        return list(self.recent)
+
+
+def _where(summary: traceback.StackSummary) -> Optional[str]:
+    for s in reversed(summary):
+        if not s.filename.startswith(_LIBRARY_PATHS) and not s.filename.startswith("<"):
+            return f"{os.path.basename(s.filename)}:{s.lineno} in {s.name}"
+    return f"{os.path.basename(summary[-1].filename)}:{summary[-1].lineno} in {summary[-1].name}" if summary else None
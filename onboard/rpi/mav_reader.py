@@ -0,0 +1,174 @@
+# mav_reader.py
+"""
+Bulk MAVLink reader for a mavutil connection.
+
+One long-lived daemon thread reads everything that is available on the port
+in one call and runs it through the connection's parser; it only waits when
+a read comes back empty. Ports with a file descriptor are waited on with
+select(); Windows serial ports have none (mavutil's select() is a plain
+0.5 s sleep there), so the thread polls them every `idle_wait` seconds,
+well within the driver buffer at serial baud rates. Decoded messages are
+queued and the event loop is woken at most once per read, so a burst of
+packets costs one thread -> loop handoff instead of one asyncio.to_thread()
+round trip per packet.
+
+The thread still calls mavutil's post_message() for every message, so
+target_system, master.messages etc. stay up to date exactly as with
+recv_match().
+
+Counters (see stats()): packets and packets/s, bytes, parse errors, read
+errors, current/peak queue depth and messages dropped because the queue was
+full.
+"""
+
+import asyncio
+import struct
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+
+class MavReader:
+    def __init__(self, master, max_queue: int = 10000, max_batch: int = 256, chunk_size: int = 4096,
+                 idle_wait: float = 0.005, on_error: Optional[Callable[[Exception], None]] = None) -> None:
+        self.master = master
+        self.max_batch = max_batch
+        self.chunk_size = chunk_size
+        self.idle_wait = idle_wait
+        self.on_error = on_error
+
+        self._queue: Deque[Any] = deque(maxlen=max_queue)
+        self._ready = asyncio.Event()
+        self._scheduled = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.packets = 0
+        self.bytes = 0
+        self.parse_errors = 0
+        self.read_errors = 0
+        self.dropped = 0
+        self.batch_count = 0
+        self.peak_depth = 0
+        self.packets_per_s = 0.0
+        self._window_start = time.monotonic()
+        self._window_packets = 0
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        self._loop = loop or asyncio.get_running_loop()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="mavlink-reader", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._ready.set)
+
+    # <editor-fold desc="reader thread">
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                data = self.master.recv(self.chunk_size)
+                if not data:
+                    self._wait_for_data()
+                    continue
+                self.bytes += len(data)
+                if self.master.first_byte:
+                    self.master.auto_mavlink_version(data)
+                msgs = self.master.mav.parse_buffer(data) or []
+            except Exception as e:
+                self.read_errors += 1
+                self._report(e)
+                if getattr(self.master, "autoreconnect", False) and hasattr(self.master, "reset"):
+                    self.master.reset()
+                self._stop.wait(0.5)
+                continue
+
+            for msg in msgs:
+                if msg.get_type() == "BAD_DATA":
+                    self.parse_errors += 1
+                    continue
+                if self.master.logfile:
+                    self.master.logfile.write(struct.pack(">Q", int(time.time() * 1.0e6) & ~3) + msg.get_msgbuf())
+                self.master.post_message(msg)
+                self._enqueue(msg)
+            self._count(len(msgs))
+            self._wake()
+
+    def _wait_for_data(self) -> None:
+        if getattr(self.master, "fd", None) is not None:
+            self.master.select(0.5)
+        else:
+            self._stop.wait(self.idle_wait)
+
+    def _enqueue(self, msg) -> None:
+        with self._lock:
+            if len(self._queue) == self._queue.maxlen:
+                self.dropped += 1  # deque drops the oldest
+            self._queue.append(msg)
+            if len(self._queue) > self.peak_depth:
+                self.peak_depth = len(self._queue)
+
+    def _count(self, n: int) -> None:
+        self.packets += n
+        self._window_packets += n
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed >= 1.0:
+            self.packets_per_s = self._window_packets / elapsed
+            self._window_start = now
+            self._window_packets = 0
+
+    def _wake(self) -> None:
+        with self._lock:
+            if self._scheduled or not self._queue:
+                return
+            self._scheduled = True
+        self._loop.call_soon_threadsafe(self._ready.set)
+
+    def _report(self, e: Exception) -> None:
+        if self.on_error is not None:
+            self._loop.call_soon_threadsafe(self.on_error, e)
+
+    # </editor-fold>
+
+    async def batches(self):
+        """Yield lists of decoded messages, oldest first, until stop() is called."""
+        while not self._stop.is_set():
+            await self._ready.wait()
+            self._ready.clear()
+            while True:
+                batch = self._drain()
+                if not batch:
+                    break
+                self.batch_count += 1
+                yield batch
+
+    def _drain(self) -> List[Any]:
+        with self._lock:
+            n = min(len(self._queue), self.max_batch)
+            batch = [self._queue.popleft() for _ in range(n)]
+            if not self._queue:
+                self._scheduled = False
+        return batch
+
+    def stats(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self._window_start
+        # the window only rolls over when packets arrive; don't report a stale rate
+        rate = self.packets_per_s if elapsed < 1.0 else self._window_packets / elapsed
+        return {
+            "packets": self.packets,
+            "packets_per_s": round(rate, 1),
+            "bytes": self.bytes,
+            "parse_errors": self.parse_errors,
+            "read_errors": self.read_errors,
+            "queue_depth": len(self._queue),
+            "peak_queue_depth": self.peak_depth,
+            "dropped": self.dropped,
+            "batches": self.batch_count,
+        }
@@ -0,0 +1,138 @@
+# outbound.py
+"""
+Outbound message scheduler for the Pi -> GCS WebSocket.
+
+Every message goes into one of three lanes and a single sender task drains
+them strictly in lane order:
+
+    CONTROL    command responses, link handshake, error and system logs
+    TELEMETRY  latest value per telemetry type; a newer message replaces a
+               queued one of the same type (requested_telemetry batches are
+               merged field by field), so a dropout never builds a backlog
+    BULK       everything else: other logs, changelog batches, params
+
+CONTROL and BULK are bounded. put() waits for room (backpressure for
+producers that can afford to wait); put_nowait() never waits and drops the
+oldest message of the lane instead. Messages are queued as dicts and only
+encoded when sent, so codec/delta state at send time applies.
+"""
+
+import asyncio
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+CONTROL, TELEMETRY, BULK = 0, 1, 2
+LANE_NAMES = ("control", "telemetry", "bulk")
+
+_CONTROL_TYPES = frozenset({"command_response", "hello", "pong"})
+
+
+def classify(msg: Dict[str, Any]) -> Tuple[int, Optional[str]]:
+    """Lane for a message and, for telemetry, its coalescing key."""
+    msg_type = msg.get("type")
+    if msg_type == "telemetry":
+        return TELEMETRY, msg["msg"].get("mavpackettype")
+    if msg_type == "requested_telemetry":
+        return TELEMETRY, msg_type
+    if msg_type in _CONTROL_TYPES:
+        return CONTROL, None
+    if msg_type == "Log":
+        log_id = msg.get("log_id") or ""
+        # severity digit: 2 = error, 3 = system
+        return (CONTROL if log_id[2:3] in ("2", "3") else BULK), None
+    return BULK, None
+
+
+class OutboundScheduler:
+    def __init__(self, control_size: int = 256, bulk_size: int = 512) -> None:
+        self._queues: Dict[int, Deque[Dict[str, Any]]] = {CONTROL: deque(), BULK: deque()}
+        self._limits = {CONTROL: control_size, BULK: bulk_size}
+        self._latest: Dict[str, Dict[str, Any]] = {}
+        self._ready = asyncio.Event()
+        self._space = {CONTROL: asyncio.Event(), BULK: asyncio.Event()}
+
+        self.queued = [0, 0, 0]
+        self.sent = [0, 0, 0]
+        self.dropped = [0, 0, 0]
+        self.coalesced = 0
+        self.waits = 0
+
+    def __len__(self) -> int:
+        return len(self._queues[CONTROL]) + len(self._latest) + len(self._queues[BULK])
+
+    def put_nowait(self, msg: Dict[str, Any]) -> None:
+        lane, key = classify(msg)
+        if lane == TELEMETRY:
+            self._put_latest(key, msg)
+        else:
+            queue = self._queues[lane]
+            if len(queue) >= self._limits[lane]:
+                queue.popleft()
+                self.dropped[lane] += 1
+            queue.append(msg)
+        self.queued[lane] += 1
+        self._ready.set()
+
+    async def put(self, msg: Dict[str, Any]) -> None:
+        """Queue a message, waiting while its lane is full."""
+        lane, _ = classify(msg)
+        if lane != TELEMETRY:
+            queue, space = self._queues[lane], self._space[lane]
+            while len(queue) >= self._limits[lane]:
+                self.waits += 1
+                space.clear()
+                await space.wait()
+        self.put_nowait(msg)
+
+    def _put_latest(self, key: str, msg: Dict[str, Any]) -> None:
+        queued = self._latest.get(key)
+        if queued is None:
+            self._latest[key] = msg
+            return
+        self.coalesced += 1
+        if msg["type"] == "requested_telemetry":
+            queued["msg"].update(msg["msg"])
+        else:
+            self._latest[key] = msg  # keeps its place in the lane
+
+    def get_nowait(self) -> Optional[Dict[str, Any]]:
+        if self._queues[CONTROL]:
+            return self._pop(CONTROL)
+        if self._latest:
+            key = next(iter(self._latest))
+            self.sent[TELEMETRY] += 1
+            return self._latest.pop(key)
+        if self._queues[BULK]:
+            return self._pop(BULK)
+        return None
+
+    def _pop(self, lane: int) -> Dict[str, Any]:
+        msg = self._queues[lane].popleft()
+        self._space[lane].set()
+        self.sent[lane] += 1
+        return msg
+
+    async def get(self) -> Dict[str, Any]:
+        while True:
+            msg = self.get_nowait()
+            if msg is not None:
+                return msg
+            self._ready.clear()
+            await self._ready.wait()
+
+    async def wait(self) -> None:
+        """Wait until at least one message is queued."""
+        while not len(self):
+            self._ready.clear()
+            await self._ready.wait()
+
+    def clear_telemetry(self) -> None:
+        self._latest.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        depth = (len(self._queues[CONTROL]), len(self._latest), len(self._queues[BULK]))
+        return {
+            name: {"depth": depth[lane], "queued": self.queued[lane], "sent": self.sent[lane],
+                   "dropped": self.dropped[lane]}
+            for lane, name in enumerate(LANE_NAMES)
+        } | {"coalesced": self.coalesced, "backpressure_waits": self.waits}
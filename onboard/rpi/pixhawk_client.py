@@ -9,6 +9,16 @@ from collections import defaultdict, deque
 import serial.tools.list_ports
 from pymavlink import mavutil
 
+from changelog import ChangeLog, ChangeTracker
+from command_manager import MAV_RESULT_IN_PROGRESS, CommandManager, PendingCommand
+from dispatch import MessageDispatcher, Packet
+from mav_reader import MavReader
+from recorder import FlightRecorder
+from wire import TELEMETRY_TYPES
+
+# a telemetry type that stays within its deadbands is still sent in full this often, in seconds
+FULL_REFRESH_S = 1.0
+
 streams = Literal["MAV_DATA_STREAM_RAW_SENSORS", "MAV_DATA_STREAM_EXTENDED_STATUS",
 "MAV_DATA_STREAM_RC_CHANNELS", "MAV_DATA_STREAM_RAW_CONTROLLER",
 "MAV_DATA_STREAM_POSITION", "MAV_DATA_STREAM_EXTRA1", "MAV_DATA_STREAM_EXTRA2",
@@ -35,23 +45,38 @@ class PixHawkClient:
         self.state["connected"] = False
         self.state["param_loaded"] = False
 
-        self.changelog: Deque[dict] = deque()
+        self.changelog = ChangeLog()
+        self.changes = ChangeTracker(self.telemetry, self.changelog)
+        self._last_full: Dict[str, float] = {}  # message type -> when it was last sent in full
         self.params: Dict[str, float] = {}
         self.dynamic_params = {}
 
-        self.futures: dict[str, Any] = {"command_ack": {},
-                                        "params": None}
+        self.futures: dict[str, Any] = {"params": None}
         self.temps: dict[str, Any] = {"params": {"buffer": {}, "expected": None, "received_indexes": set(), "last_received": time.time()}}
 
         self._hb_event = asyncio.Event()
         self._last_hb_time = time.time()
         self._stop = asyncio.Event()
         self._tasks: list[asyncio.Task] = []
-        # track pending ACKs with timestamp
-        self._ack_pending: Dict[int, float] = {}
+        # commands in flight, matched to their COMMAND_ACKs; see command_manager.py
+        self.commands = CommandManager(
+            self._transmit_command,
+            on_progress=lambda req: self._log("PX0106", {"command": req.command, "progress": req.progress}),
+        )
 
         self.message_rates = {}
 
+        self.reader: Optional[MavReader] = None
+
+        # message type -> handler; other components can register their own at runtime
+        self.dispatcher = MessageDispatcher()
+        self._register_handlers()
+
+        # raw passthrough: called with every MAVLink frame exactly as received
+        self.send_raw: Optional[Callable[[bytes], None]] = None
+        # flight data recorder, gets every frame as well
+        self.recorder: Optional[FlightRecorder] = None
+
     async def mainloop(self) -> None:
         try:
             await self._connect()
@@ -82,8 +107,15 @@ class PixHawkClient:
     async def send_command(self,
                            command: Union[int, str],
                            params: Sequence[Union[float, int, str]] = (),
-                           timeout: float = 3.0
+                           timeout: float = 3.0,
+                           frame: Optional[Union[int, str]] = None
                            ) -> str:
+        """
+        Send a command and return the MAV_RESULT name of its final ACK. With a
+        frame it goes out as COMMAND_INT, params 5 and 6 being x/y (degE7).
+        Any number of commands may be in flight; unanswered ones are retried
+        within `timeout`.
+        """
         # resolve command ID
         cmd_int = getattr(mavutil.mavlink, command, command)
 
@@ -96,7 +128,7 @@ class PixHawkClient:
                     try:
                         val = float(p)
                     except ValueError:
-                        self._log("PX02202", {"parameter": p})
+                        self._log("PX2202", {"parameter": p})
                         raise ValueError(f"Invalid parameter: {p}")
             elif isinstance(p, (int, float)):
                 val = float(p)
@@ -106,33 +138,35 @@ class PixHawkClient:
             processed.append(val)
 
         p = processed[:7] + [0.0] * max(0, 7 - len(processed))
-
-        '''# clear stale ACKs
-        for _ in range(10):
-            self.master.recv_match(type='COMMAND_ACK', blocking=False)'''
-
-        # create future
-        fut = asyncio.get_event_loop().create_future()
-        self.futures["command_ack"][cmd_int] = fut
-
-        # send command
-        self.master.mav.command_long_send(
-            self.master.target_system,
-            self.master.target_component,
-            cmd_int,
-            0,
-            *p
-        )
-
-        # track pending ack time (optional)
-        self._ack_pending[cmd_int] = time.time()
+        frame_int = None if frame is None else getattr(mavutil.mavlink, frame, frame)
 
         try:
-            result = await asyncio.wait_for(fut, timeout)
-            return result  # this is a MAV_RESULT name string
-        except asyncio.TimeoutError:
-            self.futures["command_ack"].pop(cmd_int, None)
-            raise TimeoutError(f"COMMAND_ACK timeout for command {cmd_int}")
+            req = await self.commands.send(cmd_int, p, frame=frame_int, timeout=timeout)
+        except TimeoutError:
+            self._log("PX2201", {"command": cmd_int, "duration": timeout})
+            raise
+        return _result_name(req.result)
+
+    def _transmit_command(self, req: PendingCommand) -> None:
+        if req.frame is None:
+            self.master.mav.command_long_send(
+                self.master.target_system,
+                self.master.target_component,
+                req.command,
+                req.confirmation,
+                *req.params
+            )
+        else:
+            p1, p2, p3, p4, x, y, z = req.params
+            self.master.mav.command_int_send(
+                self.master.target_system,
+                self.master.target_component,
+                req.frame,
+                req.command,
+                0, 0,  # current, autocontinue
+                p1, p2, p3, p4,
+                int(x), int(y), z
+            )
 
     def request_rate(self, stream: str, rate: int) -> None:
         sid = getattr(mavutil.mavlink, stream)
@@ -253,108 +287,107 @@ class PixHawkClient:
                 self.stop()
                 return
 
-            # check pending ACKs
-            now = time.time()
-            expired = [cmd for cmd, ts in self._ack_pending.items() if now - ts > 5]
-            for cmd in expired:
-                ts = self._ack_pending.pop(cmd, None)
-                timeout_duration = now - ts if ts else None
-                self._log("PX2201", {"command": cmd, "duration": round(timeout_duration, 2)})
-
     async def _reader_loop(self) -> None:
-        while not self._stop.is_set():
-            msg = await asyncio.to_thread(
-                self.master.recv_match, blocking=True, timeout=2
-            )
-            #print(msg)
-            if msg:
-                await self._process_message(msg)
+        # one long-lived thread drains the port; messages arrive here in batches
+        self.reader = MavReader(self.master, on_error=lambda e: self._log("PX2102", {"e": repr(e)}))
+        self.reader.start()
+        try:
+            async for batch in self.reader.batches():
+                for msg in batch:
+                    await self._process_message(msg)
+        finally:
+            self.reader.stop()
 
     async def _process_message(self, msg) -> None:
-        mtype = msg.get_type()
-        fields = msg.to_dict()
-
-        match msg.get_type():
-
-            case "HEARTBEAT":
-                self._hb_event.set()
-                self._last_hb_time = time.time()
+        if self.recorder is not None:
+            self.recorder.record_mavlink(msg.get_msgbuf())
+        if self.send_raw is not None:
+            self.send_raw(msg.get_msgbuf())
+
+        await self.dispatcher.dispatch(msg)
+
+    def _register_handlers(self) -> None:
+        self.dispatcher.register("HEARTBEAT", self._on_heartbeat)
+        self.dispatcher.register("COMMAND_ACK", self._on_command_ack)
+        self.dispatcher.register("PARAM_VALUE", self._on_param_value)
+        self.dispatcher.register(TELEMETRY_TYPES, self._on_telemetry)
+        self.dispatcher.register("STATUSTEXT", self._on_statustext)
+        self.dispatcher.register("TIMESYNC", self._on_timesync)
+        self.dispatcher.set_default(self._on_unknown)
+
+    def _on_heartbeat(self, pkt: Packet) -> None:
+        self._hb_event.set()
+        self._last_hb_time = time.time()
 
-            case "COMMAND_ACK":
-                cmd = msg.command
-                self._ack_pending.pop(cmd, None)
-
-                try:
-                    status = mavutil.mavlink.enums['MAV_RESULT'][msg.result].name
-                except KeyError:
-                    status = str(msg.result)
-
-                self._log("PX0103", {"command": cmd, "result": status})
-
-                fut = self.futures["command_ack"].pop(cmd, None)
-                if fut and not fut.done():
-                    fut.set_result(status)
-                else:
-                    self._log("PX0200", {"unexpected_ack": cmd, "result": status})
-
-            case "PARAM_VALUE":
-                pid = msg.param_id.strip('\x00')
-                pidx = msg.param_index
-                pcount = msg.param_count
-                pval = msg.param_value
-
-                state = self.temps.setdefault("params", {
-                    "buffer": {},  # indexed, completeable parameters
-                    "dynamic": {},  # 0xFFFF parameters
-                    "received_indexes": set(),
-                    "last_received": time.time(),
-                    "expected": None
-                })
-
-                if pidx == 0xFFFF:
-                    # Store dynamic params separately
-                    state["dynamic"][pid] = pval
-                    return
-
-                state["buffer"][pid] = pval
-                state["received_indexes"].add(pidx)
-                state["last_received"] = time.time()
-
-                if state["expected"] is None:
-                    state["expected"] = pcount
-
-            case "AHRS" | "ATTITUDE" | "GLOBAL_POSITION_INT" | "VFR_HUD" | "SYS_STATUS" | "POWER_STATUS" | "MEMINFO" | \
-                 "MISSION_CURRENT" | "SERVO_OUTPUT_RAW" | "RC_CHANNELS" | "RAW_IMU" | "SCALED_IMU2" | "SCALED_IMU3" | \
-                 "SCALED_PRESSURE" | "SCALED_PRESSURE2" | "GPS_RAW_INT" | "SYSTEM_TIME" | "WIND" | "TERRAIN_REPORT" | \
-                 "EKF_STATUS_REPORT" | "VIBRATION" | "BATTERY_STATUS" | "AOA_SSA" | "MCU_STATUS" | "UNKNOWN_295" | \
-                 "POSITION_TARGET_GLOBAL_INT" | "NAV_CONTROLLER_OUTPUT" | "EXTENDED_SYS_STATE" | "LOCAL_POSITION_NED" | \
-                 "AHRS2" | "GPS_GLOBAL_ORIGIN" | "HOME_POSITION":
-                #print(mtype, flush=True)
-                await self.send_msg({"type": "telemetry", "msg": fields})
-                async with asyncio.Lock():
-                    prev = self.telemetry[mtype]
-                    for k, v in fields.items():
-                        if prev.get(k) != v and not k in {"mavpackettype", "time_boot_ms", "time_usec"}:
-                            prev[k] = v
-
-            case "STATUSTEXT":
-                self._log(f"PH{fields['severity']}000", {"text": fields["text"]})
-
-            case "TIMESYNC":
-                # Estimate Pixhawk boot time as current time minus reported onboard time
-                new_boot_time = time.time() - msg.ts1 / 1e9
-
-                # Compare new estimate with previous one (if any)
-                if self.temps.get("boot_time") is not None:
-                    old_boot_time = self.temps["boot_time"]
-                    drift = new_boot_time - old_boot_time
-                    self._log("PX0011", {"time": round(drift, 6)})
-
-                # Update the boot_time
-                self.temps["boot_time"] = new_boot_time
-
-            case _:
-                self._log("PX1100", {"message": fields, "type": mtype})
+    def _on_command_ack(self, pkt: Packet) -> None:
+        msg = pkt.msg
+        cmd = msg.command
+        status = _result_name(msg.result)
+
+        req = self.commands.handle_ack(msg)
+        if req is None:
+            self._log("PX0200", {"command": cmd, "result": status})
+        elif msg.result != MAV_RESULT_IN_PROGRESS:
+            self._log("PX0103", {"command": cmd, "result": status})
+
+    def _on_param_value(self, pkt: Packet) -> None:
+        msg = pkt.msg
+        pid = msg.param_id.strip('\x00')
+        pidx = msg.param_index
+        pcount = msg.param_count
+        pval = msg.param_value
+
+        state = self.temps.setdefault("params", {
+            "buffer": {},  # indexed, completeable parameters
+            "dynamic": {},  # 0xFFFF parameters
+            "received_indexes": set(),
+            "last_received": time.time(),
+            "expected": None
+        })
+
+        if pidx == 0xFFFF:
+            # Store dynamic params separately
+            state["dynamic"][pid] = pval
+            return
+
+        state["buffer"][pid] = pval
+        state["received_indexes"].add(pidx)
+        state["last_received"] = time.time()
+
+        if state["expected"] is None:
+            state["expected"] = pcount
+
+    async def _on_telemetry(self, pkt: Packet) -> None:
+        mtype = pkt.type
+        fields = pkt.fields
+        # updates self.telemetry; changes of CHANGELOG_TYPES are queued as records for the GCS
+        changed = self.changes.observe(mtype, fields)
+        if self.send_raw is not None or mtype in self.changes.logged:
+            return
+        # other types go in full, when something moved beyond its deadband or the GCS hasn't had one in a while
+        now = time.monotonic()
+        if changed or now - self._last_full.get(mtype, float("-inf")) >= FULL_REFRESH_S:
+            self._last_full[mtype] = now
+            await self.send_msg({"type": "telemetry", "msg": fields})
+
+    def _on_statustext(self, pkt: Packet) -> None:
+        self._log(f"PH{pkt.msg.severity}000", {"text": pkt.msg.text})
+
+    def _on_timesync(self, pkt: Packet) -> None:
+        # Estimate Pixhawk boot time as current time minus reported onboard time
+        new_boot_time = time.time() - pkt.msg.ts1 / 1e9
+
+        # Compare new estimate with previous one (if any)
+        if self.temps.get("boot_time") is not None:
+            old_boot_time = self.temps["boot_time"]
+            drift = new_boot_time - old_boot_time
+            self._log("PX0011", {"time": round(drift, 6)})
+
+        # Update the boot_time
+        self.temps["boot_time"] = new_boot_time
+
+    def _on_unknown(self, pkt: Packet) -> None:
+        self._log("PX1100", {"message": pkt.fields, "type": pkt.type})
 
     async def _shutdown(self) -> None:
         self._log("PX0004")
@@ -373,6 +406,13 @@ class PixHawkClient:
         asyncio.create_task(self.send_log(log_id=log_id, variables=variables))
 
 
+def _result_name(result: int) -> str:
+    try:
+        return mavutil.mavlink.enums['MAV_RESULT'][result].name
+    except KeyError:
+        return str(result)
+
+
 # <editor-fold desc="utils">
 
 async def _send_log_temp(
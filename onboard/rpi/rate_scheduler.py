@@ -0,0 +1,119 @@
+# rate_scheduler.py
+"""
+Deadline scheduler for requested-telemetry fields (WebSocketClient rate
+requests).
+
+Fields requested at the same frequency share one group, and each group has a
+single entry in a heap ordered by its next due time, so the loop sleeps
+exactly until the earliest deadline and a wakeup only touches the groups
+that are actually due. Groups run at a fixed rate (next = due + period); a
+group that fell more than a period behind skips the missed ticks instead of
+bursting.
+
+Lateness of every wakeup against its deadline is recorded as jitter.
+"""
+
+import asyncio
+import heapq
+from typing import Any, Dict, List, Optional, Tuple
+
+from dispatch import TimingHistogram
+
+# (category, field, "category.field")
+FieldKey = Tuple[str, str, str]
+
+
+class _Group:
+    __slots__ = ("period", "fields", "due", "generation")
+
+    def __init__(self, period: float) -> None:
+        self.period = period
+        self.fields: Dict[Tuple[str, str], FieldKey] = {}
+        self.due = 0.0
+        self.generation = 0
+
+
+class RateScheduler:
+    def __init__(self) -> None:
+        self._groups: Dict[float, _Group] = {}
+        self._freq: Dict[Tuple[str, str], float] = {}
+        # (due, generation, freq); entries whose generation is stale are skipped
+        self._heap: List[Tuple[float, int, float]] = []
+        self._changed = asyncio.Event()
+        self._generation = 0
+        self.jitter = TimingHistogram()
+        self.fired = 0
+
+    def __len__(self) -> int:
+        return len(self._freq)
+
+    def set_rate(self, category: str, field: str, freq: float) -> None:
+        """Send category.field at `freq` Hz; 0 or less stops it."""
+        key = (category, field)
+        old = self._freq.pop(key, None)
+        if old is not None:
+            group = self._groups[old]
+            del group.fields[key]
+            if not group.fields:
+                del self._groups[old]  # its heap entry goes stale
+
+        if freq <= 0:
+            return
+        self._freq[key] = freq
+        group = self._groups.get(freq)
+        if group is None:
+            group = self._groups[freq] = _Group(1.0 / freq)
+            self._generation += 1
+            group.generation = self._generation
+            group.due = asyncio.get_running_loop().time()  # first batch right away
+            heapq.heappush(self._heap, (group.due, group.generation, freq))
+            self._changed.set()
+        group.fields[key] = (category, field, f"{category}.{field}")
+
+    def _pop_due(self, now: float) -> List[FieldKey]:
+        due_fields: List[FieldKey] = []
+        while self._heap and self._heap[0][0] <= now:
+            due, generation, freq = heapq.heappop(self._heap)
+            group = self._groups.get(freq)
+            if group is None or group.generation != generation:
+                continue
+            self.jitter.observe((now - due) * 1e6)
+            self.fired += 1
+            due_fields.extend(group.fields.values())
+            group.due = due + group.period
+            if group.due <= now:
+                group.due = now + group.period  # fell behind; skip missed ticks
+            heapq.heappush(self._heap, (group.due, generation, freq))
+        return due_fields
+
+    def _next_due(self) -> Optional[float]:
+        while self._heap:
+            due, generation, freq = self._heap[0]
+            group = self._groups.get(freq)
+            if group is not None and group.generation == generation:
+                return due
+            heapq.heappop(self._heap)
+        return None
+
+    async def wait_due(self) -> List[FieldKey]:
+        """Sleep until the next deadline and return every field due by then."""
+        loop = asyncio.get_running_loop()
+        while True:
+            self._changed.clear()
+            due = self._next_due()
+            now = loop.time()
+            if due is not None and due <= now:
+                return self._pop_due(now)
+            try:
+                # a new rate may bring the next deadline forward
+                await asyncio.wait_for(self._changed.wait(), None if due is None else due - now)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "fields": len(self._freq),
+            "groups": {freq: len(group.fields) for freq, group in self._groups.items()},
+            "fired": self.fired,
+            "jitter": self.jitter.stats(),
+        }
@@ -0,0 +1,291 @@
+# recorder.py
+"""
+Onboard flight data recorder.
+
+Every MAVLink frame and every log goes into an append-only segment file.
+Segments have a fixed size, are preallocated and memory-mapped, so recording
+a record is a struct.pack_into() plus a slice copy on the event loop; the
+kernel writes the pages back, and a background sync (sync_interval) msyncs
+the dirty range so at most that much is lost on power loss.
+
+Segment layout (little endian):
+
+    header  64 bytes  magic b"AFDR", version, header size, segment index,
+                      created (us since epoch), used bytes (set when finished),
+                      stream id (16 bytes, one per recorder start)
+    records           u32 length | u32 crc32 | u8 kind | u64 timestamp_us | payload
+
+crc32 covers kind, timestamp and payload. Unused space is zero, so after a
+crash the valid part of a segment ends at the first zero length or bad crc;
+read_segment() stops there.
+
+Segments are named fdr-<stream>-<index>, the stream being the first eight
+hex digits of the stream id. The segment being written is named *.open; it is renamed to *.seg once it
+is full or the recorder stops. *.open files left behind by a crash are
+renamed on the next start. Only *.seg files are uploaded (see upload()).
+Segments are preallocated with posix_fallocate, so a full disk shows up as
+an error when a segment is created, never as SIGBUS while writing one.
+"""
+
+import asyncio
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import urllib.request
+import uuid
+import zlib
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+MAGIC = b"AFDR"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIQQ16s")  # magic, version, header size, index, created_us, used, stream
+HEADER_SIZE = 64
+RECORD = struct.Struct("<IIBQ")  # length, crc32, kind, timestamp_us
+_CRC_OFFSET = 8  # kind + timestamp start here
+_KIND_TIMESTAMP = struct.Struct("<BQ")
+
+REC_MAVLINK = 1
+REC_LOG = 2
+
+OPEN_SUFFIX = ".open"
+SEGMENT_SUFFIX = ".seg"
+
+
+class FlightRecorder:
+    def __init__(self, directory: str | Path, segment_size: int = 16 * 1024 * 1024,
+                 sync_interval: float = 1.0, max_segments: int = 256,
+                 on_error: Optional[Callable[[Exception], None]] = None) -> None:
+        self.directory = Path(directory)
+        self.segment_size = segment_size
+        self.sync_interval = sync_interval
+        self.max_segments = max_segments
+        self.on_error = on_error
+        self.stream = uuid.uuid4()
+
+        self._index = 0
+        self._path: Optional[Path] = None
+        self._fd: Optional[int] = None
+        self._map: Optional[mmap.mmap] = None
+        self._pos = 0
+        self._synced = 0
+        # sync() runs in a worker thread; a segment is never unmapped under it
+        self._sync_lock = threading.Lock()
+
+        self.records = 0
+        self.bytes = 0
+        self.segments = 0
+        self.syncs = 0
+        self.dropped = 0  # records larger than a whole segment
+        self.recovered = 0
+
+    # <editor-fold desc="segments">
+
+    def open(self) -> None:
+        """Create the directory, finish segments left by a crash and start a new one."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for path in sorted(self.directory.glob("*" + OPEN_SUFFIX)):
+            path.rename(path.with_suffix(SEGMENT_SUFFIX))
+            self.recovered += 1
+        self._new_segment()
+
+    def _new_segment(self) -> None:
+        self._index += 1
+        self._path = self.directory / f"fdr-{self.stream.hex[:8]}-{self._index:06d}{OPEN_SUFFIX}"
+        self._fd = os.open(self._path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            if hasattr(os, "posix_fallocate"):
+                os.posix_fallocate(self._fd, 0, self.segment_size)
+            else:
+                os.ftruncate(self._fd, self.segment_size)
+            self._map = mmap.mmap(self._fd, self.segment_size)
+        except OSError:
+            # leave no headerless *.open behind for the next start to recover
+            os.close(self._fd)
+            self._path.unlink(missing_ok=True)
+            self._fd = None
+            self._path = None
+            raise
+        HEADER.pack_into(self._map, 0, MAGIC, VERSION, HEADER_SIZE, self._index,
+                         time.time_ns() // 1000, 0, self.stream.bytes)
+        self._pos = HEADER_SIZE
+        self._synced = 0
+        self.segments += 1
+        self._prune()
+
+    def _finish_segment(self) -> None:
+        if self._map is None:
+            return
+        path, self._path = self._path, None
+        try:
+            with self._sync_lock:
+                self._close_map()
+            path.rename(path.with_suffix(SEGMENT_SUFFIX))
+        except OSError as e:
+            # the records are in the file; an *.open left behind is finished on the next start
+            self._report(e)
+
+    def _close_map(self) -> None:
+        # closes the map and file even if recording the used length fails, so nothing is written after
+        mapped, fd = self._map, self._fd
+        self._map = None
+        self._fd = None
+        try:
+            # record the used length so readers can skip the zero tail
+            struct.pack_into("<Q", mapped, 20, self._pos)
+            mapped.flush()
+        finally:
+            mapped.close()
+        try:
+            # drop the unused tail; a segment finished early (rotate()) is mostly empty
+            os.ftruncate(fd, self._pos)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def rotate(self) -> None:
+        """Finish the current segment (so it can be uploaded) and start a new one."""
+        if self._map is None:
+            return
+        self._finish_segment()
+        try:
+            self._new_segment()
+        except OSError as e:
+            # typically a full disk; stop recording rather than fail the hot path
+            self._report(e)
+
+    def _report(self, e: OSError) -> None:
+        if self.on_error is not None:
+            self.on_error(e)
+
+    def close(self) -> None:
+        self._finish_segment()
+
+    def _prune(self) -> None:
+        finished = self.finished()
+        for path in finished[:max(0, len(finished) - self.max_segments)]:
+            path.unlink(missing_ok=True)
+
+    def finished(self) -> List[Path]:
+        """Finished segments, oldest first."""
+        # names are only unique per recorder start, and the Pi has no RTC; finish order is what counts
+        return sorted(self.directory.glob("*" + SEGMENT_SUFFIX), key=lambda p: p.stat().st_mtime_ns)
+
+    # </editor-fold>
+
+    # <editor-fold desc="recording">
+
+    def write(self, kind: int, payload: bytes, timestamp_us: Optional[int] = None) -> None:
+        if self._map is None:
+            return
+        size = RECORD.size + len(payload)
+        if size > self.segment_size - HEADER_SIZE:
+            self.dropped += 1
+            return
+        if self._pos + size > self.segment_size:
+            self.rotate()
+            if self._map is None:
+                # the new segment could not be created; recording has stopped (see rotate())
+                return
+        if timestamp_us is None:
+            timestamp_us = time.time_ns() // 1000
+
+        pos = self._pos
+        end = pos + size
+        crc = zlib.crc32(payload, zlib.crc32(_KIND_TIMESTAMP.pack(kind, timestamp_us)))
+        # payload first, header (with its non-zero length) last
+        self._map[pos + RECORD.size:end] = payload
+        RECORD.pack_into(self._map, pos, len(payload), crc, kind, timestamp_us)
+        self._pos = end
+        self.records += 1
+        self.bytes += size
+
+    def record_mavlink(self, frame: bytes) -> None:
+        self.write(REC_MAVLINK, frame)
+
+    def record_log(self, log_id: str, variables: Optional[Dict[str, Any]], timestamp_ns: int) -> None:
+        payload = json.dumps({"log_id": log_id, "variables": variables}, default=repr).encode()
+        self.write(REC_LOG, payload, timestamp_ns // 1000)
+
+    def sync(self) -> None:
+        """msync everything written since the last sync (blocking)."""
+        with self._sync_lock:
+            if self._map is None or self._pos == self._synced:
+                return
+            start = self._synced - self._synced % mmap.PAGESIZE
+            end = self._pos
+            self._map.flush(start, end - start)
+            self._synced = end
+            self.syncs += 1
+
+    async def sync_loop(self) -> None:
+        """Sync periodically off the event loop; runs until cancelled."""
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            await asyncio.to_thread(self.sync)
+
+    # </editor-fold>
+
+    def upload(self, url: str, delete: bool = True, timeout: float = 30.0) -> List[Tuple[str, int]]:
+        """
+        PUT every finished segment to `url`/<name> (the GCS update server) and
+        return (name, size) of those accepted. Blocking; run it in a thread.
+        """
+        uploaded = []
+        for path in self.finished():
+            data = path.read_bytes()
+            request = urllib.request.Request(f"{url.rstrip('/')}/{path.name}", data=data, method="PUT", headers={
+                "Content-Type": "application/octet-stream",
+                "X-Content-SHA256": hashlib.sha256(data).hexdigest(),
+            })
+            with urllib.request.urlopen(request, timeout=timeout) as resp:
+                if resp.status not in (200, 201):
+                    raise OSError(f"{path.name}: HTTP {resp.status}")
+            uploaded.append((path.name, len(data)))
+            if delete:
+                path.unlink(missing_ok=True)
+        return uploaded
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "segment": self._path.name if self._path else None,
+            "segment_used": self._pos,
+            "segment_size": self.segment_size,
+            "unsynced_bytes": self._pos - self._synced if self._map is not None else 0,
+            "records": self.records,
+            "bytes": self.bytes,
+            "segments": self.segments,
+            "finished_segments": len(self.finished()) if self.directory.exists() else 0,
+            "syncs": self.syncs,
+            "dropped": self.dropped,
+            "recovered": self.recovered,
+        }
+
+
+def read_header(data: bytes) -> Dict[str, Any]:
+    magic, version, header_size, index, created_us, used, stream = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("not a flight recorder segment")
+    return {"version": version, "header_size": header_size, "index": index, "created_us": created_us,
+            "used": used, "stream": uuid.UUID(bytes=stream).hex}
+
+
+def read_segment(path: str | Path) -> Iterator[Tuple[int, int, bytes]]:
+    """Yield (kind, timestamp_us, payload) for every intact record, stopping at the first torn one."""
+    with open(path, "rb") as f:
+        data = f.read()
+    header = read_header(data)
+    end = header["used"] or len(data)
+    pos = header["header_size"]
+    view = memoryview(data)
+    while pos + RECORD.size <= end:
+        length, crc, kind, timestamp_us = RECORD.unpack_from(data, pos)
+        stop = pos + RECORD.size + length
+        if length == 0 or stop > end or zlib.crc32(view[pos + _CRC_OFFSET:stop]) != crc:
+            return
+        yield kind, timestamp_us, bytes(view[pos + RECORD.size:stop])
+        pos = stop
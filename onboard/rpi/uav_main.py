@@ -3,11 +3,15 @@ import asyncio
 import signal
 import logging
 import sys
+from pathlib import Path
 
 from pixhawk_client import PixHawkClient
+from loop_monitor import LoopMonitor
+from recorder import FlightRecorder
 from websocket_client import WebSocketClient
+from wire import CODECS
 
-def parse_args() -> str:
+def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="UAV main loop")
     parser.add_argument(
         "--server-ip",
@@ -15,7 +19,52 @@ def parse_args() -> str:
         default="127.0.0.1",
         help="IP address of the backend WebSocket server"
     )
-    return parser.parse_args().server_ip
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        help="Send telemetry as periodic keyframes plus field-level diffs"
+    )
+    parser.add_argument(
+        "--codec",
+        choices=CODECS,
+        default=None,
+        help="Force a link codec instead of negotiating the best one"
+    )
+    parser.add_argument(
+        "--batch-ms",
+        type=float,
+        default=20.0,
+        help="Pack messages sent within this window into one WebSocket frame (0 disables)"
+    )
+    parser.add_argument(
+        "--passthrough",
+        action="store_true",
+        help="Forward raw MAVLink frames to the GCS instead of decoded telemetry"
+    )
+    parser.add_argument(
+        "--record-dir",
+        type=str,
+        default=str(Path(__file__).resolve().parent / "recordings"),
+        help="Directory for flight recorder segments"
+    )
+    parser.add_argument(
+        "--segment-mb",
+        type=int,
+        default=16,
+        help="Size of one flight recorder segment in MiB"
+    )
+    parser.add_argument(
+        "--loop-threshold-ms",
+        type=float,
+        default=100.0,
+        help="Report event-loop stalls longer than this, with their stack (0 disables)"
+    )
+    parser.add_argument(
+        "--no-record",
+        action="store_true",
+        help="Disable the onboard flight recorder"
+    )
+    return parser.parse_args()
 
 
 def setup_logging() -> None:
@@ -27,13 +76,15 @@ def setup_logging() -> None:
 
 
 async def main() -> None:
-    server_ip = parse_args()
+    args = parse_args()
+    server_ip = args.server_ip
     setup_logging()
 
     ws_url = f"ws://{server_ip}:55052"
     logging.info(f"Connecting to WebSocket at {ws_url}")
 
-    ws_client = WebSocketClient(ws_url)
+    ws_client = WebSocketClient(ws_url, delta=args.delta, codecs=[args.codec] if args.codec else CODECS,
+                                passthrough=args.passthrough, batch_interval=args.batch_ms / 1000)
     pix_client = PixHawkClient(device=("/dev/ttyACM0" if server_ip != "127.0.0.1" else "COM4"),
                                 baud=115200)
 
@@ -43,6 +94,19 @@ async def main() -> None:
     ws_client.state = pix_client.telemetry
     ws_client.changelog = pix_client.changelog
     ws_client.send_command = pix_client.send_command
+    if args.passthrough:
+        pix_client.send_raw = ws_client.send_raw
+        pix_client.changes.changelog = None  # the raw frames carry every change already
+
+    # Flight data recorder: every frame and log, kept on the SD card until the GCS pulls it
+    recorder = None
+    if not args.no_record:
+        recorder = FlightRecorder(args.record_dir, segment_size=args.segment_mb * 1024 * 1024,
+                                  on_error=lambda e: asyncio.create_task(ws_client.send_log("PI2101", {"e": repr(e)})))
+        recorder.open()
+        pix_client.recorder = recorder
+        ws_client.recorder = recorder
+        await ws_client.send_log("PI0000", {"directory": args.record_dir, "recovered": recorder.recovered})
 
     # Graceful shutdown setup
     loop = asyncio.get_running_loop()
@@ -55,9 +119,21 @@ async def main() -> None:
     for sig in (signal.SIGINT, signal.SIGTERM):
         loop.add_signal_handler(sig, on_shutdown)
 
+    # Stalls are reported to the GCS (and so recorded) and written to loop_report.jsonl next to this file
+    loop_monitor = None
+    if args.loop_threshold_ms > 0:
+        loop_monitor = LoopMonitor(
+            threshold=args.loop_threshold_ms / 1000,
+            report_path=Path(__file__).resolve().parent / "loop_report.jsonl",
+            on_stall=lambda stall: asyncio.create_task(
+                ws_client.send_log("PI1101", {"duration_ms": stall["duration_ms"], "where": stall["where"]})),
+        )
+        loop_monitor.start()
+
     # Start mainloop tasks
     ws_task = asyncio.create_task(ws_client.mainloop())
     pix_task = asyncio.create_task(pix_client.mainloop())
+    sync_task = asyncio.create_task(recorder.sync_loop()) if recorder else None
 
     # Wait for shutdown
     await stop_event.wait()
@@ -69,6 +145,12 @@ async def main() -> None:
 
     await asyncio.gather(ws_task, pix_task, return_exceptions=True)
 
+    if loop_monitor:
+        loop_monitor.stop()
+    if recorder:
+        sync_task.cancel()
+        recorder.close()
+
     logging.info("UAV main loop terminated")
 
 
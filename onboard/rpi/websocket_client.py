@@ -2,36 +2,92 @@
 import asyncio
 import json
 import traceback
+import uuid
+from urllib.parse import urlsplit
 
 import websockets
 import time
-from typing import Dict, Deque, Optional, Any
+from typing import Dict, Deque, Optional, Any, Tuple
 from collections import defaultdict, deque
 
+from changelog import CHANGELOG_TYPES, ChangeLog, group_records
+from delta import DeltaEncoder
+from outbound import OutboundScheduler
+from rate_scheduler import RateScheduler
+from recorder import FlightRecorder
+from wire import JSON, MAVSTRUCT, CODECS, LinkStats, MavStructCodec, encode_json, pack_batch, pack_mavlink_batch
+
 
 class WebSocketClient:
-    def __init__(self, uri: str):
+    def __init__(self, uri: str, delta: bool = False, codecs=CODECS, passthrough: bool = False,
+                 batch_interval: float = 0.02, batch_max_bytes: int = 16384, replay_size: int = 10000):
         self.uri = uri
         self.ws = None
         self.state = defaultdict(dict)
-        self.changelog: Deque[dict] = deque()
+        self.changelog = ChangeLog()
         self.rate = {}
-        self._send_queue: Deque[dict] = deque()
+        # priority lanes for everything sent to the GCS, see outbound.py
+        self.outbound = OutboundScheduler()
         self._stop = asyncio.Event()
-        self._last_rate_time: Dict[str, float] = {}
-        self.changelog_overflow = 0
+        self.rate_scheduler = RateScheduler()
         self.send_command = None
+        # keyframe + field-diff telemetry, see delta.py
+        self.delta: Optional[DeltaEncoder] = DeltaEncoder() if delta else None
+        # link codec, negotiated per connection; JSON until the GCS answers
+        self.codecs = tuple(codecs)
+        self.codec = JSON
+        self.mavstruct = MavStructCodec() if MAVSTRUCT in self.codecs else None
+        # raw MAVLink passthrough, batched into one binary frame per interval
+        self.passthrough = passthrough
+        self.raw_interval = 0.02
+        self.raw_max_bytes = 16384
+        self.raw_dropped = 0
+        self._raw_buffer = bytearray()
+        self._raw_full = asyncio.Event()
+        self._raw_count = 0
+        # several messages per WebSocket frame, if the GCS accepts batches; 0 disables
+        self.batch_interval = batch_interval
+        self.batch_max_bytes = batch_max_bytes
+        self.batch_ok = False
+        self.link_stats = LinkStats()
+        # resumable stream: once the GCS agrees, every message sent is numbered and
+        # kept in the replay buffer so a reconnect can fill the gap
+        self.stream_id = uuid.uuid4().hex
+        self.seq = 0
+        self.replay: Deque[Tuple[int, str | bytes]] = deque(maxlen=replay_size)
+        self.resume_ok = False
+        self._resume_after: Optional[int] = None
+        self._negotiated = asyncio.Event()
+        # flight data recorder (see recorder.py); every log is recorded as well
+        self.recorder: Optional[FlightRecorder] = None
+        self._upload_task: Optional[asyncio.Task] = None
+        # commands from the GCS run concurrently; each answers with a command_response
+        self._command_tasks: set = set()
 
     async def mainloop(self):
         while not self._stop.is_set():
             rate_task = None
             flush_changelog_task = None
+            raw_task = None
+            sender_task = None
             try:
                 await self._connect()
-                await self._flush_send_queue()
-
+                if self.delta:
+                    self.delta.reset()  # new connection starts from keyframes
+                self.codec = JSON
+                self.batch_ok = False
+                self.resume_ok = False
+                self._resume_after = None
+                self._negotiated.clear()
+                await self._send_now({"type": "hello", "msg": {"codecs": list(self.codecs),
+                                                               "batch": self.batch_interval > 0,
+                                                               "resume": {"stream": self.stream_id}}})
+
+                sender_task = asyncio.create_task(self._sender_loop())
                 rate_task = asyncio.create_task(self._rate_loop())
                 flush_changelog_task = asyncio.create_task(self._flush_changelog_loop())
+                if self.passthrough:
+                    raw_task = asyncio.create_task(self._raw_flush_loop())
 
                 # Inner loop: handle messages until connection breaks
                 while self.ws:
@@ -48,6 +104,10 @@ class WebSocketClient:
                     rate_task.cancel()
                 if flush_changelog_task:
                     flush_changelog_task.cancel()
+                if raw_task:
+                    raw_task.cancel()
+                if sender_task:
+                    sender_task.cancel()
                 self.ws = None  # force reconnect
                 # short pause before reconnect, but allow immediate exit
 
@@ -70,10 +130,23 @@ class WebSocketClient:
                 self._log_task("NW2101", {"location": "connecting", "e": repr(e), "message": ""})
                 await asyncio.sleep(5)
 
-    async def _flush_send_queue(self):
-        while self._send_queue:
-            msg = self._send_queue.popleft()
-            await self.send_msg(msg)
+    async def _sender_loop(self):
+        # hold everything until the GCS has answered hello (an old GCS never does)
+        try:
+            await asyncio.wait_for(self._negotiated.wait(), timeout=2)
+        except asyncio.TimeoutError:
+            pass
+        if self._resume_after is not None:
+            await self._resume(self._resume_after)
+
+        while self.ws:
+            if not (self.batch_ok and self.batch_interval > 0):
+                await self._send_now(await self.outbound.get())
+                continue
+            # hold the window open so more messages share the frame and telemetry coalesces
+            await self.outbound.wait()
+            await asyncio.sleep(self.batch_interval)
+            await self._send_batch()
 
     async def _handle_messages(self):
         msg = None
@@ -81,6 +154,8 @@ class WebSocketClient:
             msg = json.loads(await self.ws.recv())
             assert isinstance(msg, dict)
             assert "type" in msg and "msg" in msg
+        except websockets.exceptions.ConnectionClosed:
+            raise  # let mainloop reconnect
         except Exception as e:
             self._log_task("NW2101", {"location": "parsing message", "e": repr(e), "message": repr(msg) if msg else ""})
             return
@@ -101,7 +176,7 @@ class WebSocketClient:
         match msg["type"]:
 
             case "ping":
-                asyncio.create_task(self.send_msg(msg["msg"]))
+                self.outbound.put_nowait({"type": "pong", "msg": msg_body})
 
             case "rate_request":
                 try:
@@ -133,16 +208,39 @@ class WebSocketClient:
 
                     # 3) Finally, set the new rate
                     self.rate[category][field] = freq
+                    self.rate_scheduler.set_rate(category, field, freq)
 
                 except Exception as e:
                     self._log_task("NW2101", {"location": "handling message", "e": repr(e), "message": msg_body})
 
+            case "codec":
+                codec = msg_body.get("codec")
+                self.codec = codec if codec in self.codecs else JSON
+                self.batch_ok = bool(msg_body.get("batch"))
+                resume = msg_body.get("resume")
+                if isinstance(resume, dict):
+                    self.resume_ok = True
+                    self._resume_after = resume.get("last_seq")
+                self._negotiated.set()
+
+            case "resync":
+                if self.delta:
+                    self.delta.request_keyframe(msg_body.get("streams"))
+
             case "telemetry_update":
                 print(self.state, flush=True)
                 # asyncio.create_task(self.send_msg(msg = {"type": "telemetry_update", "msg": self.state}))
 
             case "command":
-                self.send_command(command=msg_body["command"], params=msg_body["params"])
+                task = asyncio.create_task(self._run_command(msg_body))
+                self._command_tasks.add(task)
+                task.add_done_callback(self._command_tasks.discard)
+
+            case "recordings_pull":
+                if self.recorder is None:
+                    self._log_task("PI1100", {"reason": "recording is disabled"})
+                elif self._upload_task is None or self._upload_task.done():
+                    self._upload_task = asyncio.create_task(self._upload_recordings(msg_body.get("port", 55051)))
 
             case _:
                 self._log_task("NW2103", {
@@ -150,50 +248,170 @@ class WebSocketClient:
                     "message": msg["msg"]
                 })
 
+    async def _run_command(self, msg_body: dict) -> None:
+        """Run a GCS command on the Pixhawk and report its result, echoing the GCS's command id."""
+        response = {"id": msg_body.get("id"), "command": msg_body.get("command")}
+        try:
+            response["result"] = await self.send_command(
+                command=msg_body["command"],
+                params=msg_body.get("params") or (),
+                timeout=msg_body.get("timeout", 3.0),
+                frame=msg_body.get("frame"),
+            )
+        except Exception as e:
+            response["error"] = repr(e)
+        await self.send_msg({"type": "command_response", "msg": response})
+
+    async def _upload_recordings(self, port: int) -> None:
+        """Finish the current segment and PUT all finished segments to the GCS update server."""
+        self.recorder.rotate()
+        url = f"http://{urlsplit(self.uri).hostname}:{port}/recordings"
+        try:
+            uploaded = await asyncio.to_thread(self.recorder.upload, url)
+        except Exception as e:
+            self._log_task("PI2100", {"e": repr(e)})
+            return
+        self._log_task("PI0001", {"count": len(uploaded), "bytes": sum(size for _, size in uploaded)})
+
     async def send_msg(self, msg: dict) -> None:
-        def sanitize(obj):
-            if isinstance(obj, bytearray):
-                return obj.hex()  # or decode() if it's text data
-            elif isinstance(obj, dict):
-                return {k: sanitize(v) for k, v in obj.items()}
-            elif isinstance(obj, list):
-                return [sanitize(v) for v in obj]
-            else:
-                return obj
+        """Queue a message for the GCS; waits only if its lane is full."""
+        await self.outbound.put(msg)
 
-        if self.ws:
-            try:
-                assert "type" in msg, "Message must contain a 'type' field"
-                #print("sending: " + repr(msg), flush=True)
-                await self.ws.send(json.dumps(sanitize(msg)))
-            except Exception as e:
-                try:
-                    await self.ws.send(json.dumps({
-                        "type": "Log",
-                        "log_id": "NW2101",
-                        "timestamp": time.time_ns(),
-                        "variables": {
-                            "location": "sending message",
-                            "e": repr(e),
-                            "message": repr(msg)
-                        }
-                    }))
-                except:
-                    print("FATAL ERROR while logging", flush=True)  # prevent logging from causing another crash
+    def _encode(self, msg: dict) -> str | bytes | None:
+        """Wire form of a message under the current codec; None if there is nothing to send."""
+        try:
+            assert "type" in msg, "Message must contain a 'type' field"
+            if self.delta and msg["type"] == "telemetry":
+                body = self.delta.encode(msg["msg"]["mavpackettype"], msg["msg"])
+                if body is None:
+                    return None  # only timestamps changed
+                msg = {"type": "telemetry_delta", "msg": body}
+            elif self.codec == MAVSTRUCT and msg["type"] == "telemetry":
+                data = self.mavstruct.encode_telemetry(msg["msg"])
+                if data is not None:
+                    return data
+            elif self.codec == MAVSTRUCT and msg["type"] == "changelog_batch":
+                data = self.mavstruct.encode_changes(msg["msg"])
+                if data is not None:
+                    return data
+            return encode_json(msg)
+        except Exception as e:
+            self._log_task("NW2101", {"location": "encoding message", "e": repr(e), "message": repr(msg)})
+            return None
+
+    async def _send_frame(self, data: str | bytes, messages: int = 1) -> None:
+        try:
+            await self.ws.send(data)
+            self.link_stats.record(messages, len(data))
+        except Exception as e:
+            self._log_task("NW2101", {"location": "sending message", "e": repr(e), "message": f"{messages} message(s)"})
+
+    async def _send_items(self, items: list[str | bytes]) -> None:
+        """Send encoded messages in one frame, numbered and kept for replay when resume is on."""
+        if self.resume_ok:
+            first = self.seq + 1
+            for item in items:
+                self.seq += 1
+                self.replay.append((self.seq, item))
+            await self._send_frame(pack_batch(items, first), len(items))
+        elif len(items) == 1:
+            await self._send_frame(items[0])
+        else:
+            await self._send_frame(pack_batch(items), len(items))
+
+    async def _resume(self, last_seq: int) -> None:
+        """Retransmit what the GCS missed after last_seq, or a snapshot if that is gone."""
+        if last_seq >= self.seq:
+            return
+        if self.replay and self.replay[0][0] <= last_seq + 1:
+            missing = [entry for entry in self.replay if entry[0] > last_seq]
+            self._log_task("NW0104", {"seq": last_seq, "count": len(missing)})
+            chunk: list[str | bytes] = []
+            first = missing[0][0]
+            size = 0
+            for seq, item in missing:
+                chunk.append(item)
+                size += len(item)
+                if size >= self.batch_max_bytes:
+                    await self._send_frame(pack_batch(chunk, first), len(chunk))
+                    chunk, first, size = [], seq + 1, 0
+            if chunk:
+                await self._send_frame(pack_batch(chunk, first), len(chunk))
         else:
+            self._log_task("NW1102", {"first": last_seq + 1, "last": self.seq})
+            await self._send_items([encode_json({"type": "snapshot", "msg": {
+                "from": last_seq + 1,
+                "to": self.seq,
+                "state": self.state
+            }})])
+
+    async def _send_now(self, msg: dict) -> None:
+        if not self.ws:
+            self.outbound.put_nowait(msg)  # connection dropped; keep it for the next one
+            return
+        data = self._encode(msg)
+        if data is not None:
+            await self._send_items([data])
+
+    async def _send_batch(self) -> None:
+        """Drain the outbound lanes into frames of up to batch_max_bytes."""
+        items: list[str | bytes] = []
+        size = 0
+        while self.ws:
+            msg = self.outbound.get_nowait()
+            if msg is None:
+                break
+            data = self._encode(msg)
+            if data is None:
+                continue
+            items.append(data)
+            size += len(data)
+            if size >= self.batch_max_bytes:
+                await self._send_items(items)
+                items, size = [], 0
+        if items:
+            await self._send_items(items)
+
+    def send_raw(self, frame: bytes) -> None:
+        """Queue a raw MAVLink frame for the next passthrough batch."""
+        if not self.ws:
+            self.raw_dropped += 1  # stale raw frames are no use after a reconnect
+            return
+        self._raw_buffer += frame
+        self._raw_count += 1
+        if len(self._raw_buffer) >= self.raw_max_bytes:
+            self._raw_full.set()
 
-            self._send_queue.append(msg)
+    async def _raw_flush_loop(self):
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._raw_full.wait(), timeout=self.raw_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._raw_full.clear()
+            if self._raw_buffer and self.ws:
+                data = pack_mavlink_batch(bytes(self._raw_buffer))
+                count = self._raw_count
+                self._raw_buffer.clear()
+                self._raw_count = 0
+                await self._send_frame(data, count)
 
     async def send_log(self,
                        log_id: str = "EX9999",
                        variables: Optional[Dict[str, Any]] = None,
                        timestamp: Optional[int] = None,
                        ) -> None:
+        self._queue_log(log_id, variables, timestamp)
+
+    def _queue_log(self, log_id: str, variables: Optional[Dict[str, Any]], timestamp: Optional[int] = None) -> None:
         if timestamp is None:
             timestamp = time.time_ns()
 
         print(f"[LOG] {timestamp}: {log_id} [{variables}]", flush=True)
 
+        if self.recorder is not None:
+            self.recorder.record_log(log_id, variables, timestamp)
+
         payload = {
             "type": "Log",
             "log_id": log_id,
@@ -201,51 +419,28 @@ class WebSocketClient:
             "variables": variables
         }
 
-        if self.ws:
-            asyncio.create_task(self.send_msg(payload))
-        else:
-            self._send_queue.append(payload)
+        # never waits: a full lane drops its oldest entry
+        self.outbound.put_nowait(payload)
 
     def _log_task(self, log_id: str, variables: dict | None = None):
-        return asyncio.create_task(self.send_log(log_id=log_id, variables=variables))
+        self._queue_log(log_id, variables)
 
     async def _rate_loop(self):
-        """Periodically batch and send all requested-telemetry in one message."""
+        """Send requested telemetry in one message whenever a rate group falls due."""
+        key = None
         try:
             while not self._stop.is_set():
-                now = time.time()
                 telemetry_batch: dict[str, Any] = {}
-
-                # Outer: each telemetry category
-                for category, field_rates in self.rate.items():
-                    if not isinstance(field_rates, dict):
-                        continue
-
+                for category, field, key in await self.rate_scheduler.wait_due():
                     state_msg = self.state.get(category)
-                    if not isinstance(state_msg, dict):
-                        state_msg = {}  # fallback to empty so we still mark missing fields
-
-                    for field, freq in field_rates.items():
-                        if not isinstance(freq, (int, float)) or freq <= 0:
-                            continue
-
-                        key = f"{category}.{field}"
-                        last = self._last_rate_time.get((category, field), 0.0)
-                        if now - last < 1.0 / freq:
-                            continue
-
-                        value = state_msg.get(field, None)
-                        telemetry_batch[key] = value
-                        self._last_rate_time[(category, field)] = now
+                    telemetry_batch[key] = state_msg.get(field) if isinstance(state_msg, dict) else None
 
                 if telemetry_batch:
                     batch_msg = {
                         "type": "requested_telemetry",
                         "msg": telemetry_batch
                     }
-                    asyncio.create_task(self.send_msg(batch_msg))
-
-                await asyncio.sleep(0.01)
+                    self.outbound.put_nowait(batch_msg)
 
         except asyncio.CancelledError:
             raise
@@ -255,36 +450,33 @@ class WebSocketClient:
                 {
                     "location": "telemetry update",
                     "e": repr(e),
-                    "message": repr(key) if 'key' in locals() else ""
+                    "message": repr(key)
                 }
             )
 
     async def _flush_changelog_loop(self):
         send_interval = 0.1  # ~10 Hz
+        max_batch = 1000
+        reported_drops = 0
+        last_report = 0.0
+
+        # status types only ever cross as changes; start each connection with their current state
+        now_ms = int(time.time() * 1000)
+        current = {t: [[now_ms, dict(self.state[t])]] for t in CHANGELOG_TYPES if self.state.get(t)}
+        if current:
+            await self.send_msg({"type": "changelog_batch", "msg": current})
 
         while not self._stop.is_set():
-            backlog = len(self.changelog)
-
-            # Emergency drop if backlog is totally out of control
-            if backlog > 15000:
-                if self.changelog_overflow == 0:
-                    self._log_task("NW1200", {"length": str(sum(len(json.dumps(entry)) for entry in self.changelog))})
-                    self.changelog_overflow = 20
-                # Optional: raise exception, drop oldest, or just pause sending non-critical data
-            self.changelog_overflow = max(self.changelog_overflow - 1, 0)
-
-            # Dynamically scale batch size
-            if backlog > 3000:
-                batch_size = min(1000, backlog)  # drain quickly
-            elif backlog > 1000:
-                batch_size = min(700, backlog)
-            elif backlog > 350:
-                batch_size = min(350, backlog)
-            else:
-                batch_size = 0
-
-            if self.ws and backlog > 0:
-                batch = [self.changelog.popleft() for _ in range(batch_size)]
+            # ChangeLog is bounded and drops low priority records first; report new drops every few seconds
+            dropped = sum(self.changelog.dropped)
+            if dropped > reported_drops and time.monotonic() - last_report > 5:
+                self._log_task("NW1200", {"dropped": dropped - reported_drops, **self.changelog.stats()})
+                reported_drops = dropped
+                last_report = time.monotonic()
+
+            if self.ws and len(self.changelog):
+                # waits while the bulk lane is full, so the changelog backs up here instead
+                batch = group_records(self.changelog.drain(max_batch))
                 await self.send_msg({"type": "changelog_batch", "msg": batch})
 
             await asyncio.sleep(send_interval)
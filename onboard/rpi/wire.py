@@ -0,0 +1,334 @@
+# wire.py
+"""
+Codecs for the Pi <-> GCS WebSocket link (ws://...:55052).
+
+"json" is the original text format and always works. "mavstruct" is a
+schema-aware binary format for telemetry: both ends already carry the pymavlink
+message definitions, so a telemetry dict is sent as a 5-byte header
+(frame kind, MAVLink message id) followed by the field values struct-packed in
+definition order; field names are never sent. Anything without a schema
+(logs, params, command responses, unknown message types) still goes as JSON
+text, so the receiver only has to look at the frame type: bytes are binary
+(first byte is the frame kind), str is JSON.
+
+Negotiation: on connect the Pi sends {"type": "hello", "msg": {"codecs": [...]}}
+and keeps using JSON until the GCS answers {"type": "codec", "msg": {"codec": ...}}.
+
+Raw passthrough: a binary frame of kind FRAME_MAVLINK carries untouched MAVLink
+frames, concatenated, exactly as read from the Pixhawk serial port.
+
+Change records (changelog_batch, see changelog.py) go as one FRAME_CHANGES
+frame under mavstruct: per message type its id and row count, then per row
+an 8-byte timestamp (ms), a bitmask of the changed fields in definition
+order and just those fields' values, struct-packed.
+
+Batching: if both ends agree ("batch" in hello/codec), several messages can
+share one WebSocket frame of kind FRAME_BATCH: an 8-byte sequence number of
+the first item (0 = not sequenced), then items, each a 4-byte length followed
+by either a binary frame (starts with its kind byte) or UTF-8 JSON text
+(starts with "{"). Items of a sequenced batch have consecutive numbers.
+
+Both ends use the MAVLink 2 definitions of the current dialect regardless of
+what mavutil has switched to, so struct layouts always agree and the parser
+accepts MAVLink 1 and 2 frames alike.
+"""
+
+import importlib
+import json
+import struct
+import time
+from typing import Dict, Any, Optional, Iterable, Tuple, List, Union
+
+from pymavlink import mavutil
+
+JSON = "json"
+MAVSTRUCT = "mavstruct"
+# preference order
+CODECS = (MAVSTRUCT, JSON)
+
+FRAME_TELEMETRY = 0x01
+FRAME_MAVLINK = 0x02
+FRAME_BATCH = 0x03
+FRAME_CHANGES = 0x04
+_HEADER = struct.Struct("<BI")
+_CHANGES_TYPE = struct.Struct("<IH")
+_CHANGES_TS = struct.Struct("<q")
+_ITEM_LEN = struct.Struct("<I")
+_BATCH_HEADER = struct.Struct("<BQ")
+
+_TYPE_CODES = {
+    "char": "s", "int8_t": "b", "uint8_t": "B", "int16_t": "h", "uint16_t": "H",
+    "int32_t": "i", "uint32_t": "I", "int64_t": "q", "uint64_t": "Q",
+    "float": "f", "double": "d",
+}
+
+
+# message types forwarded to the GCS as telemetry
+TELEMETRY_TYPES = frozenset({
+    "AHRS", "ATTITUDE", "GLOBAL_POSITION_INT", "VFR_HUD", "SYS_STATUS", "POWER_STATUS", "MEMINFO",
+    "MISSION_CURRENT", "SERVO_OUTPUT_RAW", "RC_CHANNELS", "RAW_IMU", "SCALED_IMU2", "SCALED_IMU3",
+    "SCALED_PRESSURE", "SCALED_PRESSURE2", "GPS_RAW_INT", "SYSTEM_TIME", "WIND", "TERRAIN_REPORT",
+    "EKF_STATUS_REPORT", "VIBRATION", "BATTERY_STATUS", "AOA_SSA", "MCU_STATUS", "UNKNOWN_295",
+    "POSITION_TARGET_GLOBAL_INT", "NAV_CONTROLLER_OUTPUT", "EXTENDED_SYS_STATE", "LOCAL_POSITION_NED",
+    "AHRS2", "GPS_GLOBAL_ORIGIN", "HOME_POSITION",
+})
+
+
+def mavlink_v2():
+    """MAVLink 2 module of the current pymavlink dialect."""
+    return importlib.import_module(f"pymavlink.dialects.v20.{mavutil.current_dialect}")
+
+
+def pack_mavlink_batch(frames: bytes) -> bytes:
+    """Wrap concatenated raw MAVLink frames for sending as one binary message."""
+    return bytes((FRAME_MAVLINK,)) + frames
+
+
+def pack_batch(items: Iterable[Union[str, bytes]], seq: int = 0) -> bytes:
+    """Pack encoded messages (JSON text or binary frames) into one FRAME_BATCH frame."""
+    out = bytearray(_BATCH_HEADER.pack(FRAME_BATCH, seq))
+    for item in items:
+        data = item.encode() if isinstance(item, str) else item
+        out += _ITEM_LEN.pack(len(data))
+        out += data
+    return bytes(out)
+
+
+def unpack_batch(data: bytes) -> Tuple[int, List[Union[str, bytes]]]:
+    """Inverse of pack_batch: (first sequence number, items); JSON items come back as str."""
+    items: List[Union[str, bytes]] = []
+    view = memoryview(data)
+    _, seq = _BATCH_HEADER.unpack_from(data)
+    pos = _BATCH_HEADER.size
+    while pos < len(data):
+        (n,) = _ITEM_LEN.unpack_from(data, pos)
+        pos += _ITEM_LEN.size
+        item = bytes(view[pos:pos + n])
+        if len(item) != n:
+            raise ValueError("truncated batch")
+        pos += n
+        items.append(item.decode() if item[:1] == b"{" else item)
+    return seq, items
+
+
+class LinkStats:
+    """Frames vs. messages counters with per-second rates over the last full second."""
+
+    def __init__(self) -> None:
+        self.frames = 0
+        self.messages = 0
+        self.bytes = 0
+        self._window = [time.monotonic(), 0, 0, 0]  # start, frames, messages, bytes
+        self._rates = (0.0, 0.0, 0.0)
+
+    def record(self, messages: int, nbytes: int) -> None:
+        self.frames += 1
+        self.messages += messages
+        self.bytes += nbytes
+        w = self._window
+        w[1] += 1
+        w[2] += messages
+        w[3] += nbytes
+        elapsed = time.monotonic() - w[0]
+        if elapsed >= 1.0:
+            self._rates = (w[1] / elapsed, w[2] / elapsed, w[3] / elapsed)
+            self._window = [time.monotonic(), 0, 0, 0]
+
+    def stats(self) -> Dict[str, Any]:
+        elapsed = time.monotonic() - self._window[0]
+        # the window only rolls over on traffic; don't report a stale rate after it stops
+        frames_s, messages_s, bytes_s = self._rates if elapsed < 2.0 else (0.0, 0.0, 0.0)
+        return {
+            "frames": self.frames,
+            "messages": self.messages,
+            "bytes": self.bytes,
+            "frames_per_s": round(frames_s, 1),
+            "messages_per_s": round(messages_s, 1),
+            "bytes_per_s": round(bytes_s),
+            "messages_per_frame": round(self.messages / self.frames, 2) if self.frames else 0.0,
+        }
+
+
+def json_default(obj: Any) -> Any:
+    # only called for values json can't encode natively
+    if isinstance(obj, bytearray):
+        return obj.hex()
+    if isinstance(obj, bytes):
+        return obj.decode(errors="replace")
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def encode_json(msg: Dict[str, Any]) -> str:
+    return json.dumps(msg, default=json_default, separators=(",", ":"))
+
+
+def choose_codec(offered: Iterable[str]) -> str:
+    """Best codec both sides support."""
+    offered = set(offered)
+    return next((c for c in CODECS if c in offered), JSON)
+
+
+class _Schema:
+    """Struct layout of one MAVLink message type, in fieldnames order."""
+
+    def __init__(self, cls) -> None:
+        self.msg_id: int = cls.id
+        self.name: str = cls.msgname
+        self.fields: List[Tuple[str, int, bool]] = []  # (name, array length, is_char)
+        self.field_structs: List[struct.Struct] = []  # one per field, for change records
+        lengths = dict(zip(cls.ordered_fieldnames, cls.array_lengths))
+        fmt = "<"
+        for name, ftype in zip(cls.fieldnames, cls.fieldtypes):
+            n = lengths.get(name, 0)
+            code = _TYPE_CODES[ftype]
+            if code == "s":
+                part = f"{max(n, 1)}s"
+            elif n:
+                part = f"{n}{code}"
+            else:
+                part = code
+            fmt += part
+            self.fields.append((name, n, code == "s"))
+            self.field_structs.append(struct.Struct("<" + part))
+        self.struct = struct.Struct(fmt)
+        self.header = _HEADER.pack(FRAME_TELEMETRY, self.msg_id)
+        self.index = {name: i for i, (name, _, _) in enumerate(self.fields)}
+        self.mask_size = (len(self.fields) + 7) // 8
+
+    def pack(self, fields: Dict[str, Any]) -> bytes:
+        values = []
+        for name, n, is_char in self.fields:
+            v = fields[name]
+            if is_char:
+                values.append(v.encode() if isinstance(v, str) else bytes(v))
+            elif n:
+                values.extend(v)
+            else:
+                values.append(v)
+        return self.header + self.struct.pack(*values)
+
+    def pack_row(self, timestamp_ms: int, changes: Dict[str, Any]) -> bytes:
+        """One change record row: timestamp, bitmask of the changed fields, their values."""
+        mask = 0
+        parts = []
+        for i in sorted(self.index[name] for name in changes):
+            name, n, is_char = self.fields[i]
+            v = changes[name]
+            mask |= 1 << i
+            if is_char:
+                parts.append(self.field_structs[i].pack(v.encode() if isinstance(v, str) else bytes(v)))
+            elif n:
+                parts.append(self.field_structs[i].pack(*v))
+            else:
+                parts.append(self.field_structs[i].pack(v))
+        return _CHANGES_TS.pack(timestamp_ms) + mask.to_bytes(self.mask_size, "little") + b"".join(parts)
+
+    def unpack_row(self, data: bytes, pos: int) -> Tuple[List[Any], int]:
+        """Inverse of pack_row at `pos`: ([timestamp_ms, {field: value}], position after the row)."""
+        (ts,) = _CHANGES_TS.unpack_from(data, pos)
+        pos += _CHANGES_TS.size
+        mask = int.from_bytes(data[pos:pos + self.mask_size], "little")
+        pos += self.mask_size
+        changes: Dict[str, Any] = {}
+        for i, (name, n, is_char) in enumerate(self.fields):
+            if not mask >> i & 1:
+                continue
+            values = self.field_structs[i].unpack_from(data, pos)
+            pos += self.field_structs[i].size
+            if is_char:
+                changes[name] = values[0].split(b"\x00", 1)[0].decode(errors="replace")
+            elif n:
+                changes[name] = list(values)
+            else:
+                changes[name] = values[0]
+        return [ts, changes], pos
+
+    def unpack(self, data: bytes) -> Dict[str, Any]:
+        values = self.struct.unpack_from(data, _HEADER.size)
+        out: Dict[str, Any] = {"mavpackettype": self.name}
+        i = 0
+        for name, n, is_char in self.fields:
+            if is_char:
+                out[name] = values[i].split(b"\x00", 1)[0].decode(errors="replace")
+                i += 1
+            elif n:
+                out[name] = list(values[i:i + n])
+                i += n
+            else:
+                out[name] = values[i]
+                i += 1
+        return out
+
+
+class MavStructCodec:
+    """Binary telemetry codec built from the dialect's MAVLink 2 definitions."""
+
+    def __init__(self, mavlink=None) -> None:
+        mavlink = mavlink or mavlink_v2()
+        self._classes = {cls.msgname: cls for cls in mavlink.mavlink_map.values()}
+        self._by_id = {cls.id: cls for cls in mavlink.mavlink_map.values()}
+        self._schemas: Dict[str, _Schema] = {}
+        self._schemas_by_id: Dict[int, _Schema] = {}
+
+    def _schema(self, name: str) -> Optional[_Schema]:
+        schema = self._schemas.get(name)
+        if schema is None:
+            cls = self._classes.get(name)
+            if cls is None:
+                return None
+            schema = self._schemas[name] = self._schemas_by_id[cls.id] = _Schema(cls)
+        return schema
+
+    def encode_telemetry(self, fields: Dict[str, Any]) -> Optional[bytes]:
+        """Pack a to_dict() telemetry message; None if it has no known schema."""
+        schema = self._schema(fields.get("mavpackettype"))
+        if schema is None:
+            return None
+        try:
+            return schema.pack(fields)
+        except (KeyError, TypeError, struct.error):
+            return None  # dict doesn't match this dialect's layout; send JSON
+
+    def encode_changes(self, batch: Dict[str, List[List[Any]]]) -> Optional[bytes]:
+        """Pack a changelog_batch body ({msg_type: [[timestamp_ms, {field: value}], ...]}); None if it can't be."""
+        out = bytearray((FRAME_CHANGES,))
+        try:
+            for msg_type, rows in batch.items():
+                schema = self._schema(msg_type)
+                if schema is None:
+                    return None
+                out += _CHANGES_TYPE.pack(schema.msg_id, len(rows))
+                for ts, changes in rows:
+                    out += schema.pack_row(ts, changes)
+        except (KeyError, TypeError, struct.error):
+            return None  # records don't match this dialect's layout; send JSON
+        return bytes(out)
+
+    def _schema_by_id(self, msg_id: int) -> _Schema:
+        schema = self._schemas_by_id.get(msg_id)
+        if schema is None:
+            cls = self._by_id.get(msg_id)
+            if cls is None:
+                raise ValueError(f"unknown MAVLink message id {msg_id}")
+            schema = self._schema(cls.msgname)
+        return schema
+
+    def decode(self, data: bytes) -> Dict[str, Any]:
+        """Turn a binary frame back into a link message dict."""
+        kind = data[0]
+        if kind == FRAME_CHANGES:
+            batch: Dict[str, List[List[Any]]] = {}
+            pos = 1
+            while pos < len(data):
+                msg_id, count = _CHANGES_TYPE.unpack_from(data, pos)
+                pos += _CHANGES_TYPE.size
+                schema = self._schema_by_id(msg_id)
+                rows = batch.setdefault(schema.name, [])
+                for _ in range(count):
+                    row, pos = schema.unpack_row(data, pos)
+                    rows.append(row)
+            return {"type": "changelog_batch", "msg": batch}
+        if kind != FRAME_TELEMETRY:
+            raise ValueError(f"unknown frame kind {kind}")
+        _, msg_id = _HEADER.unpack_from(data)
+        return {"type": "telemetry", "msg": self._schema_by_id(msg_id).unpack(data)}